@@ -0,0 +1,365 @@
+"""Offline end-to-end benchmark of the download pipeline.
+
+Runs the real bot in webhook mode against a fake Bot API (see fake_telegram.py), with
+yt-dlp extraction replaced by a fixture extractor whose media is served from a local HTTP
+server. Each concurrency level sends a burst of link messages from distinct users and
+measures throughput, time to first media, peak RSS and peak temp-disk usage.
+
+    python benchmark.py --levels 1,8,32 --updates 64 --output bench.json
+    python benchmark.py --levels 1,8,32 --updates 64 --baseline bench.json
+
+Output is JSON, so runs on different commits can be diffed (or compared with --baseline).
+The thread download engine is used because the fixture extractor only exists in this process.
+"""
+import argparse
+import asyncio
+import functools
+import json
+import logging
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+import httpx
+
+from fake_telegram import FakeBotAPI, make_update
+
+logger = logging.getLogger(__name__)
+
+MEDIA_METHODS = ('sendVideo', 'sendPhoto', 'sendMediaGroup')
+
+
+class FixtureServer:
+    """Serves the fixture media files over HTTP, after a configurable delay per request."""
+    def __init__(self, directory: str, latency: float):
+        latency_seconds = latency
+
+        class Handler(SimpleHTTPRequestHandler):
+            def do_GET(self):
+                if latency_seconds:
+                    time.sleep(latency_seconds)
+                super().do_GET()
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(Handler, directory=directory))
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_port}"
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fixture-server", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class FixtureExtractor:
+    """Stands in for yt-dlp's site extractors: every link resolves to a local fixture file.
+
+    Links to '/p/' posts become a photo, everything else a single progressive mp4, so the
+    bot's normal probe -> download -> upload path runs without any ffmpeg work.
+    """
+    def __init__(self, base_url: str, video_bytes: int, latency: float):
+        self.base_url = base_url
+        self.video_bytes = video_bytes
+        self.latency = latency
+        self.calls = 0
+        self._original = None
+
+    def info(self, url: str) -> dict:
+        media_id = url.rstrip('/').rsplit('/', 1)[-1]
+        common = {'id': media_id, 'title': f"fixture {media_id}", 'webpage_url': url,
+                  'extractor': 'Instagram', 'extractor_key': 'Instagram'}
+        if '/p/' in url:
+            return {**common, 'url': f"{self.base_url}/photo.jpg", 'ext': 'jpg'}
+        return {**common, 'duration': 10, 'formats': [{
+            'format_id': 'fixture', 'url': f"{self.base_url}/video.mp4", 'ext': 'mp4', 'protocol': 'http',
+            'vcodec': 'avc1.64001F', 'acodec': 'mp4a.40.2', 'height': 720, 'filesize': self.video_bytes,
+        }]}
+
+    def install(self):
+        import yt_dlp
+        extractor = self
+        self._original = yt_dlp.YoutubeDL.extract_info
+
+        def extract_info(ydl, url, download=True, ie_key=None, extra_info=None, process=True,
+                         force_generic_extractor=False):
+            extractor.calls += 1
+            if extractor.latency:
+                time.sleep(extractor.latency)
+            info = extractor.info(url)
+            return ydl.process_ie_result(info, download=download) if process else info
+
+        yt_dlp.YoutubeDL.extract_info = extract_info
+
+    def uninstall(self):
+        import yt_dlp
+        if self._original:
+            yt_dlp.YoutubeDL.extract_info = self._original
+
+
+def write_fixtures(directory: str, video_bytes: int, photo_bytes: int):
+    with open(os.path.join(directory, 'video.mp4'), 'wb') as f:
+        f.write(os.urandom(video_bytes))
+    with open(os.path.join(directory, 'photo.jpg'), 'wb') as f:
+        f.write(os.urandom(photo_bytes))
+
+
+class ResourceSampler:
+    """Polls process RSS and the size of the download directory, keeping the peaks."""
+    def __init__(self, download_dir: str, interval: float = 0.05):
+        self.download_dir = download_dir
+        self.interval = interval
+        self.peak_rss = 0
+        self.peak_disk = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="resource-sampler", daemon=True)
+
+    @staticmethod
+    def rss_bytes() -> int:
+        try:
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * resource.getpagesize()
+        except OSError:
+            # ru_maxrss is the lifetime peak (KiB on Linux, bytes on macOS)
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return peak if sys.platform == 'darwin' else peak * 1024
+
+    def disk_bytes(self) -> int:
+        total = 0
+        for root, _, files in os.walk(self.download_dir):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass # Removed while walking
+        return total
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_rss = max(self.peak_rss, self.rss_bytes())
+            self.peak_disk = max(self.peak_disk, self.disk_bytes())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def run_level(telegram_bot, level: int, concurrency: int, total: int, photo_ratio: float,
+                    delivered: Dict[int, float], settled: Dict[int, float], timeout: float) -> Dict[str, float]:
+    """Sends `total` link messages from distinct users over `concurrency` parallel requests."""
+    config = telegram_bot.config
+    first_user = 1_000_000 * (level + 1)
+    users = list(range(first_user, first_user + total))
+    photos_every = round(1 / photo_ratio) if photo_ratio else 0
+    for user_id in users:
+        telegram_bot.db.grant_access(user_id)
+
+    sent_at: Dict[int, float] = {}
+    url = f"http://127.0.0.1:{telegram_bot.http_server.port}{config.WEBHOOK_PATH}"
+    headers = {'X-Telegram-Bot-Api-Secret-Token': telegram_bot.webhook_secret}
+    slots = asyncio.Semaphore(concurrency)
+
+    async def send(client: httpx.AsyncClient, i: int, user_id: int):
+        kind = 'p' if photos_every and i % photos_every == 0 else 'reel'
+        update = make_update(user_id, user_id, f"https://www.instagram.com/{kind}/L{level}U{i}/")
+        async with slots:
+            sent_at[user_id] = time.perf_counter()
+            response = await client.post(url, json=update, headers=headers)
+            response.raise_for_status()
+
+    sampler = ResourceSampler(config.DOWNLOAD_DIR)
+    started = time.perf_counter()
+    with sampler:
+        async with httpx.AsyncClient(limits=httpx.Limits(max_connections=concurrency)) as client:
+            await asyncio.gather(*(send(client, i, user_id) for i, user_id in enumerate(users)))
+        while sum(1 for u in users if u in delivered) < total and time.perf_counter() - started < timeout:
+            await asyncio.sleep(0.01)
+        elapsed = time.perf_counter() - started
+        # Let the handlers finish (the status message is deleted last) before the next level starts.
+        while sum(1 for u in users if u in settled) < len([u for u in users if u in delivered]) \
+                and time.perf_counter() - started < timeout:
+            await asyncio.sleep(0.01)
+
+    ttfm = [delivered[u] - sent_at[u] for u in users if u in delivered]
+    return {
+        'concurrency': concurrency,
+        'updates': total,
+        'delivered': len(ttfm),
+        'failed': total - len(ttfm),
+        'seconds': round(elapsed, 4),
+        'updates_per_second': round(len(ttfm) / elapsed, 2) if elapsed else 0.0,
+        'ttfm_p50_ms': round(percentile(ttfm, 0.50) * 1000, 2),
+        'ttfm_p99_ms': round(percentile(ttfm, 0.99) * 1000, 2),
+        'peak_rss_mb': round(sampler.peak_rss / 1048576, 1),
+        'peak_temp_disk_mb': round(sampler.peak_disk / 1048576, 2),
+    }
+
+
+async def run_benchmark(args) -> dict:
+    import bot as bot_module
+    Config = bot_module.Config
+
+    work_dir = tempfile.mkdtemp(prefix="bot_benchmark_")
+    fixtures_dir = os.path.join(work_dir, 'fixtures')
+    download_dir = os.path.join(work_dir, 'downloads')
+    os.makedirs(fixtures_dir)
+    os.makedirs(download_dir)
+    write_fixtures(fixtures_dir, args.media_kb * 1024, args.photo_kb * 1024)
+
+    delivered: Dict[int, float] = {}
+    settled: Dict[int, float] = {}
+
+    def on_call(method: str, params: Dict[str, object]):
+        if method in MEDIA_METHODS:
+            delivered.setdefault(int(params.get('chat_id', 0)), time.perf_counter())
+        elif method == 'deleteMessage':
+            settled.setdefault(int(params.get('chat_id', 0)), time.perf_counter())
+
+    api = FakeBotAPI(latency=args.api_latency_ms / 1000, on_call=on_call)
+    fixtures = FixtureServer(fixtures_dir, args.download_latency_ms / 1000)
+    extractor = FixtureExtractor(fixtures.url, args.media_kb * 1024, args.extract_latency_ms / 1000)
+    await api.start()
+    fixtures.start()
+    extractor.install()
+
+    Config.TELEGRAM_API_URL = api.url
+    Config.UPDATE_MODE = 'webhook'
+    Config.WEBHOOK_URL = 'http://127.0.0.1'
+    Config.HTTP_HOST = '127.0.0.1'
+    Config.HTTP_PORT = 0
+    Config.SHORTENER_TOKEN = "" # Keep the access links offline
+    Config.ADMIN_ID = 0 # No startup notifications
+    Config.DB_FILE = os.path.join(work_dir, 'users.db')
+    Config.DOWNLOAD_DIR = download_dir
+    Config.MEDIA_CACHE_DIR = os.path.join(work_dir, 'media_cache')
+    Config.DOWNLOAD_ENGINE = 'thread'
+    Config.STREAMING_UPLOADS = args.streaming
+    Config.MAX_QUEUED_DOWNLOADS = max(Config.MAX_QUEUED_DOWNLOADS, args.updates)
+    if args.workers:
+        Config.DOWNLOAD_WORKERS = args.workers
+    if not args.rate_limits:
+        # Measure the pipeline itself, not the configured per-platform request budget.
+        Config.PLATFORM_RATE_LIMITS = {name: 1e6 for name in Config.PLATFORM_RATE_LIMITS}
+
+    telegram_bot = bot_module.TelegramBot(Config())
+    stop = asyncio.Event()
+    runner = asyncio.create_task(telegram_bot.run_webhook(stop))
+    try:
+        while not (telegram_bot.ready and telegram_bot.application.running):
+            if runner.done():
+                runner.result()
+            await asyncio.sleep(0.05)
+
+        levels = []
+        for level, concurrency in enumerate(args.levels):
+            result = await run_level(telegram_bot, level, concurrency, args.updates, args.photo_ratio,
+                                     delivered, settled, args.timeout)
+            logger.info(f"concurrency {concurrency}: {result['updates_per_second']} updates/s, "
+                        f"p99 time to first media {result['ttfm_p99_ms']} ms")
+            levels.append(result)
+    finally:
+        stop.set()
+        await runner
+        extractor.uninstall()
+        fixtures.stop()
+        await api.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'settings': {
+            'updates': args.updates, 'media_kb': args.media_kb, 'photo_kb': args.photo_kb,
+            'photo_ratio': args.photo_ratio, 'extract_latency_ms': args.extract_latency_ms,
+            'download_latency_ms': args.download_latency_ms, 'api_latency_ms': args.api_latency_ms,
+            'download_workers': Config.DOWNLOAD_WORKERS, 'streaming': args.streaming,
+            'rate_limits': args.rate_limits,
+        },
+        'levels': levels,
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline: dict, current: dict) -> List[str]:
+    """Describes the relative change of each metric per concurrency level."""
+    old_levels = {level['concurrency']: level for level in baseline.get('levels', [])}
+    lines = [f"{baseline.get('commit')} -> {current.get('commit')}"]
+    for level in current['levels']:
+        old = old_levels.get(level['concurrency'])
+        if not old:
+            continue
+        changes = []
+        for key in ('updates_per_second', 'ttfm_p50_ms', 'ttfm_p99_ms', 'peak_rss_mb', 'peak_temp_disk_mb'):
+            if old.get(key):
+                changes.append(f"{key} {(level[key] - old[key]) / old[key]:+.1%}")
+        lines.append(f"concurrency {level['concurrency']}: " + ", ".join(changes))
+    return lines
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--levels', type=lambda s: [int(x) for x in s.split(',')], default=[1, 8, 32],
+                        help="comma-separated concurrency levels (parallel webhook requests)")
+    parser.add_argument('--updates', type=int, default=64, help="link messages sent per level")
+    parser.add_argument('--media-kb', type=int, default=512, help="size of the fixture video")
+    parser.add_argument('--photo-kb', type=int, default=64, help="size of the fixture photo")
+    parser.add_argument('--photo-ratio', type=float, default=0.25, help="share of links that are photo posts")
+    parser.add_argument('--extract-latency-ms', type=float, default=50.0, help="delay of each metadata extraction")
+    parser.add_argument('--download-latency-ms', type=float, default=20.0, help="delay before each fixture download")
+    parser.add_argument('--api-latency-ms', type=float, default=10.0, help="delay of each fake Bot API call")
+    parser.add_argument('--workers', type=int, default=0, help="override Config.DOWNLOAD_WORKERS")
+    parser.add_argument('--streaming', action='store_true', help="enable Config.STREAMING_UPLOADS")
+    parser.add_argument('--rate-limits', action='store_true', help="keep Config.PLATFORM_RATE_LIMITS instead of lifting them")
+    parser.add_argument('--timeout', type=float, default=120.0, help="seconds to wait for each level to finish")
+    parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    parser.add_argument('--baseline', help="JSON report of an earlier run to compare against")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.WARNING)
+    logger.setLevel(logging.INFO)
+    report = asyncio.run(run_benchmark(args))
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    if args.baseline:
+        with open(args.baseline) as f:
+            print("\n".join(compare(json.load(f), report)), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,10 @@
-from keep_alive import keep_alive
+import time
+# Taken before the other imports so the startup report includes them.
+_IMPORTS_STARTED = time.perf_counter()
+
+from keep_alive import keep_alive, Request, Response
+from job_queue import JobQueue, open_job_queue
+from metrics import Metrics, PhaseTimer, SlowJobProfiler
 import os
 import re
 import logging
@@ -6,11 +12,33 @@ import sqlite3
 import asyncio
 import shutil
 import tempfile
-from datetime import datetime, timezone, timedelta
-from typing import List, Tuple
+import hashlib
+import multiprocessing
+import pickle
+import threading
+import queue
+import heapq
+import subprocess
+import sys
+import uuid
+import functools
+import itertools
+import copy
+import json
+import hmac
+import secrets
+import signal
+import random
+from collections import OrderedDict, defaultdict, deque
+from contextlib import contextmanager
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit, parse_qsl, urlencode
 
 import httpx
-import yt_dlp
 from telegram import (
     Update, InputMediaPhoto, InputMediaVideo, InlineKeyboardButton,
     InlineKeyboardMarkup
@@ -19,8 +47,9 @@ from telegram.ext import (
     Application, CommandHandler, MessageHandler, ContextTypes, filters
 )
 from telegram.error import TelegramError
-# --- Add this import for specific error handling ---
-from yt_dlp.utils import DownloadError
+
+if TYPE_CHECKING:
+    import yt_dlp
 
 # --- Configuration ---
 
@@ -37,10 +66,131 @@ class Config:
     INSTAGRAM_COOKIES_FILE: str = "instagram_cookies.txt"
     YOUTUBE_COOKIES_FILE: str = "youtube_cookies.txt"
     FACEBOOK_COOKIES_FILE: str = "facebook_cookies.txt"
+    # More accounts per platform go in COOKIE_SESSIONS_DIR/<platform>/*.txt, one cookie file each;
+    # downloads are spread over every valid session of a platform, the file above included.
+    COOKIE_SESSIONS_DIR: str = "cookie_sessions"
     
-    DOWNLOAD_DIR: str = tempfile.gettempdir()
+    # Only download folders live here; leftovers of killed jobs are swept (see STORAGE_* below)
+    DOWNLOAD_DIR: str = os.path.join(tempfile.gettempdir(), "bot_downloads")
+    TELEGRAM_API_URL: str = "https://api.telegram.org"
+    MAX_UPLOAD_BYTES: int = 52428800 # 50 MB, the Bot API upload limit
     SHORTENER_API_URL: str = "https://shrinkearn.com/api"
     ACCESS_DURATION_HOURS: int = 24
+    # Shortened access links are identical for everyone, so they are cached and refreshed in the background
+    SHORT_URL_TTL_SECONDS: int = 6 * 60 * 60
+
+    # Access grants are written by a background thread, committing in batches
+    DB_COMMIT_INTERVAL_SECONDS: float = 0.5
+    DB_MAX_BATCH: int = 500
+
+    # Media cache: repeat links are answered from Telegram file_ids without re-downloading
+    MEDIA_CACHE_TTL_SECONDS: int = 6 * 60 * 60
+    MEDIA_CACHE_MAX_ENTRIES: int = 5000
+    # Optionally keep the downloaded files so a rejected file_id can be re-uploaded from disk
+    MEDIA_CACHE_KEEP_FILES: bool = False
+    MEDIA_CACHE_DIR: str = os.path.join(tempfile.gettempdir(), "bot_media_cache")
+    MEDIA_CACHE_MAX_BYTES: int = 1024 * 1024 * 1024 # 1 GB
+
+    # Temp storage: a download holds space in DOWNLOAD_DIR from when it leaves the queue, and stays
+    # queued (up to STORAGE_MAX_WAIT_SECONDS, then it is refused) while the budget or the disk is full.
+    # Downloads that may stream hold nothing until they fall back to disk.
+    STORAGE_BUDGET_BYTES: int = 2 * 1024 * 1024 * 1024 # 2 GB
+    STORAGE_JOB_RESERVE_BYTES: int = 52428800 # Held until the real size is known: one file at the upload limit
+    STORAGE_MIN_FREE_BYTES: int = 512 * 1024 * 1024 # Disk space always left for everything else
+    STORAGE_MAX_WAIT_SECONDS: float = 60
+    # Download folders untouched for this long are leftovers of a killed process
+    STORAGE_ORPHAN_AGE_SECONDS: int = 60 * 60
+    STORAGE_SWEEP_INTERVAL_SECONDS: int = 10 * 60
+    # RAM-backed directory (e.g. "/dev/shm/bot_downloads") for image-only posts; empty keeps them on disk
+    STORAGE_RAM_DIR: str = ""
+
+    # Download scheduling: dedicated worker pool, per-platform caps and a bounded queue
+    DOWNLOAD_WORKERS: int = 8
+    PLATFORM_CONCURRENCY: Dict[str, int] = {'instagram': 3, 'youtube': 4, 'facebook': 2, 'other': 2}
+    MAX_QUEUED_DOWNLOADS: int = 200
+    MAX_DOWNLOADS_PER_USER: int = 3
+    # 'thread' runs yt-dlp in this process; 'process' uses long-lived worker processes
+    # so extraction doesn't compete with the bot's event loop for the GIL.
+    DOWNLOAD_ENGINE: str = 'thread'
+    # Worker processes are replaced after this many jobs to contain memory growth
+    PROCESS_WORKER_MAX_JOBS: int = 50
+    # Load yt-dlp and build its first instances on a thread of their own right after startup,
+    # instead of making the first download wait for them (thread engine only; worker processes warm up on their own)
+    PREWARM_DOWNLOADER: bool = True
+
+    # Adaptive rate limiting per platform and cookie session, in downloads/second when healthy.
+    # 429 and bot-check errors halve the rate; each success adds back RATE_RECOVERY_FRACTION of it.
+    PLATFORM_RATE_LIMITS: Dict[str, float] = {'instagram': 1.0, 'youtube': 2.0, 'facebook': 1.0, 'other': 4.0}
+    RATE_LIMIT_BURST: int = 5
+    RATE_LIMIT_MIN_RATE: float = 1 / 60
+    RATE_RECOVERY_FRACTION: float = 0.05
+    # Consecutive throttling errors that open the circuit, and its first cooldown (doubled while throttling continues)
+    CIRCUIT_BREAKER_THRESHOLD: int = 3
+    CIRCUIT_BREAKER_COOLDOWN_SECONDS: float = 30
+    CIRCUIT_BREAKER_MAX_COOLDOWN_SECONDS: float = 600
+    # New downloads are refused instead of queued when the limiter would hold them longer than this
+    RATE_LIMIT_MAX_WAIT_SECONDS: float = 120
+    # Rate-limited and network failures are retried by the scheduler with jittered exponential backoff
+    DOWNLOAD_RETRIES: int = 2
+    RETRY_BASE_DELAY_SECONDS: float = 2.0
+    # A cookie session is quarantined when SESSION_ERROR_RATE of its last SESSION_WINDOW jobs were
+    # throttled (judged after SESSION_MIN_SAMPLES jobs); each repeat doubles the quarantine.
+    SESSION_WINDOW: int = 20
+    SESSION_MIN_SAMPLES: int = 5
+    SESSION_ERROR_RATE: float = 0.5
+    SESSION_QUARANTINE_SECONDS: float = 30 * 60
+    SESSION_MAX_QUARANTINE_SECONDS: float = 6 * 60 * 60
+
+    # A message may carry several links, and profile/playlist links are expanded into their
+    # posts/videos; the items are fetched side by side and delivered in order.
+    MAX_LINKS_PER_MESSAGE: int = 10
+    MAX_BATCH_ITEMS: int = 30
+    # Items of one message fetched at once (never more than MAX_DOWNLOADS_PER_USER)
+    BATCH_PARALLELISM: int = 3
+    # Entries of a single carousel post downloaded side by side
+    CAROUSEL_DOWNLOAD_THREADS: int = 4
+
+    # Metadata probes (extract_info without downloading) are reused for this long
+    PROBE_CACHE_TTL_SECONDS: int = 120
+    # CPU threads ffmpeg may use when a video really has to be re-encoded
+    FFMPEG_THREADS: int = 2
+
+    # Pipe single-file mp4s from yt-dlp straight into the upload instead of going through DOWNLOAD_DIR
+    STREAMING_UPLOADS: bool = False
+    STREAM_CHUNK_SIZE: int = 256 * 1024
+
+    # Download jobs slower than this get their stack sampled and the profile logged (0 disables it)
+    PROFILE_SLOW_JOBS_SECONDS: float = 0
+    PROFILE_SAMPLE_INTERVAL_SECONDS: float = 0.01
+    # Collapsed-stack files of slow jobs, readable by flame graph tools
+    PROFILE_DIR: str = os.path.join(tempfile.gettempdir(), "bot_profiles")
+
+    # Update delivery: 'polling', or 'webhook' where Telegram pushes updates to the HTTP server below
+    UPDATE_MODE: str = 'polling'
+    # The HTTP server also answers the keep-alive and health probes in both modes
+    HTTP_HOST: str = '0.0.0.0'
+    HTTP_PORT: int = 8080
+    WEBHOOK_URL: str = "" # Public base URL, e.g. "https://bot.example.com"
+    WEBHOOK_PATH: str = "/telegram"
+    # Checked against X-Telegram-Bot-Api-Secret-Token; a random one is generated when empty
+    WEBHOOK_SECRET: str = ""
+    WEBHOOK_MAX_CONNECTIONS: int = 100
+    # Updates handled at the same time by python-telegram-bot
+    CONCURRENT_UPDATES: int = 64
+
+    # Scale-out: 'standalone' does everything in one process; a 'front' process handles updates and
+    # queues downloads for 'worker' processes (on this or other hosts) that download and upload them.
+    ROLE: str = 'standalone'
+    JOB_QUEUE_URL: str = "sqlite:///bot_jobs.db" # or "redis://host:6379/0" for workers on several hosts
+    # Access grants and cookie files are shared between processes through the queue's state store
+    STATE_SYNC_INTERVAL_SECONDS: float = 5.0
+    # A claimed job goes back on the queue if its worker hasn't sent a heartbeat for it within this time
+    JOB_VISIBILITY_TIMEOUT_SECONDS: int = 15 * 60
+    JOB_HEARTBEAT_SECONDS: int = 60
+    # Jobs a worker takes at once; its scheduler still applies the per-platform caps
+    WORKER_CONCURRENCY: int = 16
+    # Health probes on workers (0 disables them, so several workers can share a host)
+    WORKER_HTTP_PORT: int = 0
 
     @staticmethod
     def validate():
@@ -49,6 +199,10 @@ class Config:
             raise ValueError("FATAL: BOT_TOKEN is not set in the Config class.")
         if not Config.ADMIN_ID:
             logging.warning("ADMIN_ID is not set. Admin notifications will be disabled.")
+        if Config.UPDATE_MODE == 'webhook' and not Config.WEBHOOK_URL:
+            raise ValueError("FATAL: UPDATE_MODE is 'webhook' but WEBHOOK_URL is not set in the Config class.")
+        if Config.ROLE not in ('standalone', 'front', 'worker'):
+            raise ValueError(f"FATAL: Unknown ROLE '{Config.ROLE}'; use 'standalone', 'front' or 'worker'.")
 
 # --- Logging Setup ---
 
@@ -62,48 +216,136 @@ logger = logging.getLogger(__name__)
 # --- Database Management ---
 
 class Database:
-    """Handles all SQLite database operations."""
+    """Handles all SQLite database operations.
+
+    Access checks are answered from an in-memory index of user_id -> expiry (epoch seconds),
+    loaded at startup and written through. Writes are committed in batches by a dedicated
+    writer thread, so handlers never block on SQLite.
+    """
     def __init__(self, db_file: str):
         self._conn = sqlite3.connect(db_file, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
         self._cursor = self._conn.cursor()
         self._setup()
 
+        self._lock = threading.Lock()
+        self._expiry: Dict[int, int] = {}
+        self._expiry_heap: List[Tuple[int, int]] = []
+        self._load()
+
+        self._writes: "queue.Queue[Optional[Tuple[int, int]]]" = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="db-writer", daemon=True)
+        self._writer.start()
+
     def _setup(self):
-        """Creates the users table if it doesn't exist."""
+        """Creates the users table if it doesn't exist, migrating the old ISO-timestamp schema."""
+        columns = [row[1] for row in self._cursor.execute("PRAGMA table_info(users)")]
+        if 'access_time' in columns:
+            self._migrate_iso_access_times()
         self._cursor.execute('''
             CREATE TABLE IF NOT EXISTS users (
                 user_id INTEGER PRIMARY KEY,
-                access_time TEXT NOT NULL
+                expires_at INTEGER NOT NULL
             )
         ''')
         self._conn.commit()
 
-    def grant_access(self, user_id: int):
-        """Grants access to a user."""
-        now_utc = datetime.now(timezone.utc).isoformat()
-        self._cursor.execute(
-            "REPLACE INTO users (user_id, access_time) VALUES (?, ?)",
-            (user_id, now_utc)
-        )
-        self._conn.commit()
+    def _migrate_iso_access_times(self):
+        rows = self._cursor.execute("SELECT user_id, access_time FROM users").fetchall()
+        duration = Config.ACCESS_DURATION_HOURS * 3600
+        migrated = []
+        for user_id, access_time in rows:
+            try:
+                granted = datetime.fromisoformat(access_time).replace(tzinfo=timezone.utc)
+            except (ValueError, TypeError) as e:
+                logger.error(f"Error parsing access time for user {user_id}: {e}")
+                continue
+            migrated.append((user_id, int(granted.timestamp()) + duration))
+        with self._conn:
+            self._cursor.execute("ALTER TABLE users RENAME TO users_legacy")
+            self._cursor.execute("CREATE TABLE users (user_id INTEGER PRIMARY KEY, expires_at INTEGER NOT NULL)")
+            self._cursor.executemany("INSERT INTO users (user_id, expires_at) VALUES (?, ?)", migrated)
+            self._cursor.execute("DROP TABLE users_legacy")
+        logger.info(f"Migrated {len(migrated)} users to epoch expiry timestamps.")
+
+    def _load(self):
+        """Loads every unexpired grant into the in-memory index."""
+        now = int(time.time())
+        rows = self._cursor.execute("SELECT user_id, expires_at FROM users WHERE expires_at > ?", (now,)).fetchall()
+        with self._lock:
+            self._expiry = dict(rows)
+            self._expiry_heap = [(expires_at, user_id) for user_id, expires_at in rows]
+            heapq.heapify(self._expiry_heap)
+        logger.info(f"Loaded {len(rows)} users with active access.")
+
+    def grant_access(self, user_id: int) -> int:
+        """Grants access to a user and returns the expiry timestamp."""
+        expires_at = int(time.time()) + Config.ACCESS_DURATION_HOURS * 3600
+        with self._lock:
+            self._expiry[user_id] = expires_at
+            heapq.heappush(self._expiry_heap, (expires_at, user_id))
+        self._writes.put((user_id, expires_at))
         logger.info(f"Access granted for user_id: {user_id}")
+        return expires_at
+
+    def merge_grants(self, grants: Dict[int, int]):
+        """Applies grants made by other front processes; an older expiry never replaces a newer one."""
+        with self._lock:
+            for user_id, expires_at in grants.items():
+                if expires_at <= self._expiry.get(user_id, 0):
+                    continue
+                self._expiry[user_id] = expires_at
+                heapq.heappush(self._expiry_heap, (expires_at, user_id))
+                self._writes.put((user_id, expires_at))
 
     def has_valid_access(self, user_id: int) -> bool:
         """Checks if a user's access is still valid."""
-        self._cursor.execute("SELECT access_time FROM users WHERE user_id=?", (user_id,))
-        result = self._cursor.fetchone()
-        if not result:
-            return False
-        try:
-            access_time = datetime.fromisoformat(result[0]).replace(tzinfo=timezone.utc)
-            now_utc = datetime.now(timezone.utc)
-            return (now_utc - access_time) < timedelta(hours=Config.ACCESS_DURATION_HOURS)
-        except (ValueError, TypeError) as e:
-            logger.error(f"Error parsing access time for user {user_id}: {e}")
-            return False
+        now = time.time()
+        self._prune(now)
+        return self._expiry.get(user_id, 0) > now
+
+    def _prune(self, now: float):
+        """Drops expired grants from the index; heap entries superseded by a renewal are skipped."""
+        with self._lock:
+            while self._expiry_heap and self._expiry_heap[0][0] <= now:
+                expires_at, user_id = heapq.heappop(self._expiry_heap)
+                if self._expiry.get(user_id) == expires_at:
+                    del self._expiry[user_id]
+
+    def active_users(self) -> int:
+        self._prune(time.time())
+        return len(self._expiry)
+
+    def _write_loop(self):
+        """Runs on the writer thread: collects grants for up to DB_COMMIT_INTERVAL_SECONDS, then commits."""
+        stopping = False
+        while not stopping:
+            item = self._writes.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + Config.DB_COMMIT_INTERVAL_SECONDS
+            while len(batch) < Config.DB_MAX_BATCH:
+                try:
+                    item = self._writes.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            try:
+                with self._conn:
+                    self._conn.executemany("REPLACE INTO users (user_id, expires_at) VALUES (?, ?)", batch)
+            except sqlite3.Error as e:
+                logger.error(f"Failed to persist {len(batch)} access grants: {e}")
 
     def close(self):
-        """Closes the database connection."""
+        """Flushes pending writes and closes the database connection."""
+        if self._writer.is_alive():
+            self._writes.put(None)
+            self._writer.join()
         if self._conn:
             self._conn.close()
             logger.info("Database connection closed.")
@@ -111,6 +353,48 @@ class Database:
 
 # --- Media Downloader ---
 
+def _yt_dlp():
+    """yt-dlp, imported on first use: it is the slowest import and only downloads need it."""
+    import yt_dlp
+    return yt_dlp
+
+
+class DownloadError(Exception):
+    """A download the bot gave up on itself; yt-dlp raises its own, and both are classified by message."""
+
+
+@dataclass
+class MediaProbe:
+    """Result of a metadata-only extraction: what a link contains and which format to fetch."""
+    # Raw extractor result, reused for the download; None when it can't be reused (e.g. lazily paged profiles).
+    info: Optional[dict] = None
+    # Format that fits under MAX_UPLOAD_BYTES; None lets yt-dlp use its own default.
+    format_id: Optional[str] = None
+    ext: Optional[str] = None
+    filesize: Optional[int] = None
+    # Single-file audio+video mp4 served over HTTP, which can be streamed without touching disk.
+    progressive: bool = False
+    # Post-processing the chosen format needs: 'none', 'remux' (stream copy) or 'transcode'.
+    postprocess: str = 'none'
+    image_only: bool = False
+    entries: int = 1
+    # Set when the probe already proved the link can't be delivered; raised again on cache hits.
+    error: Optional[str] = None
+
+
+@dataclass
+class FetchResult:
+    """Outcome of a download job: either media already sent by streaming, or files to upload."""
+    media: List[Tuple[str, str]] = field(default_factory=list)
+    files: List[str] = field(default_factory=list)
+    temp_dir: Optional[str] = None
+    # How the media got to mp4: 'stream', 'none', 'remux' or 'transcode'
+    pipeline: str = 'none'
+    # Seconds spent per stage ('extract', 'download', 'postprocess', 'stream') and bytes downloaded
+    timings: Dict[str, float] = field(default_factory=dict)
+    downloaded_bytes: int = 0
+
+
 class MediaDownloader:
     """Manages media downloads from multiple platforms using yt-dlp."""
     _URL_PATTERN = re.compile(
@@ -123,14 +407,124 @@ class MediaDownloader:
         r'facebook\.com/(?:watch/?|reel/|share/|video\.php|[a-zA-Z0-9_.-]+/videos/|[a-zA-Z0-9_.-]+/posts/)[a-zA-Z0-9_.-/?=&]+|'
         # YouTube
         r'youtube\.com/(?:watch\?v=|shorts/)[a-zA-Z0-9_-]{11}|'
+        r'youtube\.com/playlist\?list=[a-zA-Z0-9_-]+|'
+        r'youtube\.com/(?:@|channel/|c/|user/)[a-zA-Z0-9_.-]+|'
         r'youtu\.be/[a-zA-Z0-9_-]{11}'
         r')'
     )
 
+    _IMAGE_EXTS = ('jpg', 'jpeg', 'png', 'webp', 'heic')
+    # Codecs that can be copied into an mp4 container as-is and still play inline on Telegram
+    _MP4_VIDEO_CODECS = ('avc1', 'h264', 'hev1', 'hvc1', 'h265', 'hevc')
+    _MP4_AUDIO_CODECS = ('mp4a', 'aac', 'mp3', 'none')
+    # Progressive (single-file, audio+video) mp4s can be written to a pipe as they download.
+    _STREAM_FORMAT = 'best[ext=mp4][vcodec!=none][acodec!=none][protocol^=http]'
+
+    # Query parameters that only track the share and never change the media itself
+    _TRACKING_PARAMS = ('igsh', 'igshid', 'img_index', 'si', 'feature', 'fbclid', 'mibextid', 'rdid', 'ref', 'app', 'pp', 'share_url')
+    _YOUTUBE_ID = re.compile(r'^[a-zA-Z0-9_-]{11}$')
+    # First path segments of Instagram pages that aren't profiles
+    _INSTAGRAM_PAGES = ('p', 'reel', 'reels', 'tv', 'stories', 'explore', 'accounts', 'direct')
+    _YOUTUBE_CHANNEL_PREFIXES = ('channel', 'c', 'user')
+
     @staticmethod
     def is_valid_url(url: str) -> bool:
         return bool(MediaDownloader._URL_PATTERN.match(url))
 
+    @staticmethod
+    def extract_urls(text: str, limit: int) -> List[str]:
+        """Supported links in a message, in order, without duplicates of the same media."""
+        urls, seen = [], set()
+        for token in re.findall(r'https?://\S+', text):
+            url = token.rstrip('.,;:!?)]>"\'')
+            if not MediaDownloader.is_valid_url(url):
+                continue
+            key = MediaDownloader.canonical_id(url)
+            if key not in seen:
+                seen.add(key)
+                urls.append(url)
+        return urls[:limit]
+
+    @staticmethod
+    def is_collection(url: str) -> bool:
+        """Whether the link is an Instagram profile or hashtag page, or a YouTube playlist or channel.
+
+        Every other link, including share links and stories, is treated as a single post.
+        """
+        host, path, _ = MediaDownloader._split_url(url)
+        if host == 'instagram.com':
+            return path[:2] == ['explore', 'tags'] or (len(path) == 1 and path[0] not in MediaDownloader._INSTAGRAM_PAGES)
+        if host == 'youtube.com':
+            return path[:1] == ['playlist'] or MediaDownloader._is_youtube_channel(path)
+        return False
+
+    @staticmethod
+    def _is_youtube_channel(path: List[str]) -> bool:
+        return bool(path) and (path[0].startswith('@') or (path[0] in MediaDownloader._YOUTUBE_CHANNEL_PREFIXES and len(path) > 1))
+
+    @staticmethod
+    def _collection_page(url: str) -> str:
+        """The page listing a collection's posts: a channel link without a tab lists its tabs, so use its videos tab."""
+        _, path, _ = MediaDownloader._split_url(url)
+        if MediaDownloader._is_youtube_channel(path) and len(path) == (1 if path[0].startswith('@') else 2):
+            return f"https://www.youtube.com/{'/'.join(path)}/videos"
+        return url
+
+    @staticmethod
+    def is_cacheable(url: str) -> bool:
+        """Whether a link always shows the same media: not a collection, nor a user's current stories."""
+        if MediaDownloader.is_collection(url):
+            return False
+        host, path, _ = MediaDownloader._split_url(url)
+        return not (host == 'instagram.com' and path[:1] == ['stories'] and len(path) < 3)
+
+    @staticmethod
+    def _split_url(url: str) -> Tuple[str, List[str], Dict[str, str]]:
+        """(host without www./m., non-empty path segments, query) of a link."""
+        parts = urlsplit(url.strip())
+        host = parts.netloc.lower().split(':')[0]
+        if host.startswith(('www.', 'm.')):
+            host = host.split('.', 1)[1]
+        return host, [p for p in parts.path.split('/') if p], dict(parse_qsl(parts.query))
+
+    @staticmethod
+    def platform_for(url: str) -> str:
+        if 'instagram.com' in url:
+            return 'instagram'
+        if 'youtube.com' in url or 'youtu.be' in url:
+            return 'youtube'
+        if 'facebook.com' in url:
+            return 'facebook'
+        return 'other'
+
+    @staticmethod
+    def canonical_id(url: str) -> str:
+        """Returns a stable id for the media behind a URL, so equivalent links share one key."""
+        host, path, query = MediaDownloader._split_url(url)
+
+        if host == 'youtu.be' and path and MediaDownloader._YOUTUBE_ID.match(path[0]):
+            return f"youtube:{path[0]}"
+        if host == 'youtube.com':
+            video_id = query.get('v') if path[:1] == ['watch'] else (path[1] if len(path) > 1 and path[0] == 'shorts' else None)
+            if video_id and MediaDownloader._YOUTUBE_ID.match(video_id):
+                return f"youtube:{video_id}"
+        if host == 'instagram.com' and len(path) >= 2 and path[0] in ('p', 'reel', 'reels', 'tv'):
+            return f"instagram:{path[1]}"
+        if host == 'facebook.com':
+            if path[:1] == ['reel'] and len(path) > 1:
+                return f"facebook:{path[1]}"
+            if query.get('v') and (path[:1] == ['watch'] or path[:1] == ['video.php']):
+                return f"facebook:{query['v']}"
+            if len(path) >= 3 and path[1] == 'videos':
+                return f"facebook:{path[2]}"
+
+        kept = sorted(
+            (k, v) for k, v in query.items()
+            if not k.startswith('utm_') and k not in MediaDownloader._TRACKING_PARAMS
+        )
+        canonical = f"{host}/{'/'.join(path)}"
+        return f"{canonical}?{urlencode(kept)}" if kept else canonical
+
     @staticmethod
     def _validate_cookies(file_path: str) -> bool:
         if not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
@@ -140,79 +534,1650 @@ class MediaDownloader:
             content = f.read(100)
             return content.strip().startswith(("# HTTP Cookie File", "# Netscape HTTP Cookie File"))
 
-    def download_media(self, url: str, user_id: int) -> Tuple[List[str], str]:
-        temp_dir = tempfile.mkdtemp(prefix=f"media_{user_id}_", dir=Config.DOWNLOAD_DIR)
-        
-        cookies_file = None
-        is_instagram = 'instagram.com' in url
-        if is_instagram:
-            cookies_file = Config.INSTAGRAM_COOKIES_FILE if self._validate_cookies(Config.INSTAGRAM_COOKIES_FILE) else None
-        elif 'youtube.com' in url or 'youtu.be' in url:
-            cookies_file = Config.YOUTUBE_COOKIES_FILE if self._validate_cookies(Config.YOUTUBE_COOKIES_FILE) else None
-        elif 'facebook.com' in url:
-            cookies_file = Config.FACEBOOK_COOKIES_FILE if self._validate_cookies(Config.FACEBOOK_COOKIES_FILE) else None
-        
-        if not cookies_file:
-            logger.warning(f"No valid cookie file found for URL: {url}")
+    def __init__(self):
+        # Warm YoutubeDL instances per (platform, cookie session, post-processing, cookie file signature).
+        self._pool_lock = threading.Lock()
+        self._idle: Dict[tuple, List["yt_dlp.YoutubeDL"]] = defaultdict(list)
+        self._pool_keys: Dict[Tuple[str, Optional[str]], tuple] = {}
+        # Cookie file validation results, keyed by path and valid while (mtime, size) is unchanged.
+        self._cookie_checks: Dict[str, Tuple[tuple, bool]] = {}
+        self._upload_client: Optional[httpx.Client] = None
+        # canonical_id -> (probe, monotonic expiry)
+        self._probes: Dict[str, Tuple[MediaProbe, float]] = {}
+        # Post-processor time of the download running on the current thread
+        self._stage = threading.local()
+        # Downloads the entries of carousel posts side by side; created on first use
+        self._entry_pool: Optional[ThreadPoolExecutor] = None
+        self.profiler = SlowJobProfiler(Config.PROFILE_SLOW_JOBS_SECONDS, Config.PROFILE_SAMPLE_INTERVAL_SECONDS, Config.PROFILE_DIR)
+
+    def _cookies_for(self, path: Optional[str]) -> Tuple[Optional[str], Optional[tuple]]:
+        """Returns the session's cookie file (or None if invalid) and its (mtime, size) signature."""
+        if not path:
+            return None, None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None, None
+        signature = (stat.st_mtime_ns, stat.st_size)
+        with self._pool_lock:
+            checked = self._cookie_checks.get(path)
+        if checked is None or checked[0] != signature:
+            checked = (signature, self._validate_cookies(path))
+            with self._pool_lock:
+                self._cookie_checks[path] = checked
+        return (path if checked[1] else None), signature
 
+    @staticmethod
+    def _base_options(platform: str, cookies_file: Optional[str], postprocess: str) -> dict:
         ydl_opts = {
-            'outtmpl': os.path.join(temp_dir, '%(title)s.%(ext)s'),
+            # The target directory is set per download through the 'paths' option.
+            'outtmpl': '%(title)s.%(ext)s',
             'cookiefile': cookies_file,
             'ignoreerrors': False,
             'quiet': True,
             'no_warnings': True,
-            'retries': 3,
+            'noprogress': True,
+            # Failed jobs are retried by the scheduler with backoff; hammering a throttled site here only makes it worse.
+            'retries': 1,
+            'extractor_retries': 0,
             'fragment_retries': 3,
             'http_headers': {
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36',
                 'Accept-Language': 'en-US,en;q=0.9',
             },
-            'max_filesize': 52428800, # 50 MB
+            'max_filesize': Config.MAX_UPLOAD_BYTES,
         }
 
         # --- THE FIX: Only specify format for non-Instagram links ---
         # This allows yt-dlp to download images/carousels from Instagram by default.
-        if not is_instagram:
+        if platform != 'instagram':
             ydl_opts['format'] = 'best'
+
+        if postprocess == 'remux':
+            # Stream copy into mp4: no re-encoding, just a new container.
+            ydl_opts['postprocessors'] = [{'key': 'FFmpegVideoRemuxer', 'preferedformat': 'mp4'}]
+        elif postprocess == 'transcode':
             ydl_opts['postprocessors'] = [{'key': 'FFmpegVideoConvertor', 'preferedformat': 'mp4'}]
+            ydl_opts['postprocessor_args'] = {'videoconvertor': ['-threads', str(Config.FFMPEG_THREADS)]}
+        return ydl_opts
 
+    @contextmanager
+    def _youtube_dl(self, platform: str, postprocess: str = 'none', session: Optional[str] = None):
+        """Checks out a warm YoutubeDL for the platform, cookie session and post-processing path,
+        building one only when none is idle. Without a session the download runs anonymously."""
+        cookies_file, signature = self._cookies_for(session)
+        if session and not cookies_file:
+            logger.warning(f"Cookie session {session} is invalid, downloading from {platform} anonymously")
+        identity = (cookies_file, signature)
+        pool_key = (platform, session)
+        key = pool_key + (postprocess,) + identity
+
+        with self._pool_lock:
+            if self._pool_keys.get(pool_key) != identity:
+                # The cookie file changed: instances holding the old jar must not be reused.
+                stale = self._drop_idle(lambda k: k[:2] == pool_key)
+                self._pool_keys[pool_key] = identity
+            else:
+                stale = []
+            idle = self._idle[key]
+            ydl = idle.pop() if idle else None
+        for old in stale:
+            self._discard(old)
+
+        if ydl is None:
+            ydl = _yt_dlp().YoutubeDL(self._base_options(platform, cookies_file, postprocess))
+            ydl.add_postprocessor_hook(self._postprocessor_hook)
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.extract_info(url, download=True)
-        except DownloadError as e:
-            shutil.rmtree(temp_dir, ignore_errors=True)
-            raise e
+            yield ydl
+        finally:
+            ydl.params['paths'] = {}
+            with self._pool_lock:
+                keep = self._pool_keys.get(pool_key) == identity and len(self._idle[key]) < Config.PLATFORM_CONCURRENCY.get(platform, 2)
+                if keep:
+                    self._idle[key].append(ydl)
+            if not keep:
+                self._discard(ydl)
+
+    def _drop_idle(self, match: Callable[[tuple], bool]) -> List["yt_dlp.YoutubeDL"]:
+        """Removes and returns the idle instances whose pool key matches. Caller holds `_pool_lock`."""
+        stale = []
+        for key in [k for k in self._idle if match(k)]:
+            stale.extend(self._idle.pop(key))
+        return stale
+
+    @staticmethod
+    def _discard(ydl: "yt_dlp.YoutubeDL"):
+        # Don't write the in-memory jar back; it may be older than a freshly uploaded cookie file.
+        ydl.params['cookiefile'] = None
+        try:
+            ydl.close()
+        except Exception as e:
+            logger.debug(f"Error closing YoutubeDL instance: {e}")
+
+    def _postprocessor_hook(self, status: dict):
+        """Accumulates how long yt-dlp's post-processors (ffmpeg remux/convert, moves) run."""
+        if status.get('status') == 'started':
+            self._stage.started = time.perf_counter()
+        elif status.get('status') == 'finished' and getattr(self._stage, 'started', None) is not None:
+            self._stage.postprocess = getattr(self._stage, 'postprocess', 0.0) + time.perf_counter() - self._stage.started
+            self._stage.started = None
+
+    def invalidate(self, platform: Optional[str] = None):
+        """Drops warm instances (and cookie checks) of every session of a platform, or of all platforms."""
+        with self._pool_lock:
+            for pool_key in [k for k in self._pool_keys if platform is None or k[0] == platform]:
+                del self._pool_keys[pool_key]
+                if pool_key[1]:
+                    self._cookie_checks.pop(pool_key[1], None)
+            stale = self._drop_idle(lambda k: platform is None or k[0] == platform)
+        for ydl in stale:
+            self._discard(ydl)
+
+    def prewarm(self, sessions: Dict[str, Optional[str]]) -> float:
+        """Imports yt-dlp and parks an instance per platform and cookie session in the pool;
+        returns the seconds it took."""
+        started = time.perf_counter()
+        for platform, session in sessions.items():
+            with self._youtube_dl(platform, session=session):
+                pass
+        return time.perf_counter() - started
+
+    def probe(self, url: str, session: Optional[str] = None) -> MediaProbe:
+        """Extracts metadata without downloading and decides what to fetch.
+
+        Links that can't be delivered fail here with the same messages a download would
+        produce, before any media bytes are transferred.
+        """
+        key = self.canonical_id(url)
+        now = time.monotonic()
+        with self._pool_lock:
+            cached = self._probes.get(key)
+        if cached and cached[1] > now:
+            probe = cached[0]
+        else:
+            with self._youtube_dl(self.platform_for(url), session=session) as ydl:
+                info = ydl.extract_info(url, download=False, process=False)
+            probe = self._remember_probe(key, info)
+        if probe.error:
+            raise DownloadError(probe.error)
+        return probe
+
+    def _remember_probe(self, key: str, info: dict) -> MediaProbe:
+        probe = self._plan(info)
+        now = time.monotonic()
+        with self._pool_lock:
+            if len(self._probes) > 1000:
+                self._probes = {k: v for k, v in self._probes.items() if v[1] > now}
+            self._probes[key] = (probe, now + Config.PROBE_CACHE_TTL_SECONDS)
+        return probe
+
+    def expand(self, url: str, limit: int, session: Optional[str] = None) -> List[str]:
+        """Lists the links of the posts/videos behind a profile, hashtag, playlist or channel link, up to `limit`.
+
+        Pages whose entries aren't links of their own come back as the link itself, with the
+        extracted metadata kept for the download that follows.
+        """
+        with self._youtube_dl(self.platform_for(url), session=session) as ydl:
+            info = ydl.extract_info(self._collection_page(url), download=False, process=False)
+        entries = info.get('entries')
+        if entries is None:
+            self._remember_probe(self.canonical_id(url), info)
+            return [url]
+        urls = []
+        # Profile feeds are paged lazily, so only the pages holding the first `limit` entries are fetched.
+        for entry in itertools.islice(entries, limit):
+            item_url = entry.get('webpage_url') or entry.get('url') if isinstance(entry, dict) else None
+            if not item_url or not self.is_valid_url(item_url) or self.is_collection(item_url):
+                # The entries are the media itself rather than links to posts: download the page as a whole.
+                if isinstance(entries, list):
+                    self._remember_probe(self.canonical_id(url), info)
+                return [url]
+            urls.append(item_url)
+        return urls
+
+    def _plan(self, info: dict) -> MediaProbe:
+        if info.get('_type') in ('url', 'url_transparent'):
+            # Resolved by another extractor during the download.
+            return MediaProbe()
+
+        if info.get('_type') in ('playlist', 'multi_video') or 'entries' in info:
+            entries = info.get('entries')
+            if not isinstance(entries, list):
+                # Lazily paged playlist (e.g. a profile): leave resolving the items to the download.
+                return MediaProbe(entries=0)
+            has_video = any(self._video_formats(entry) for entry in entries if isinstance(entry, dict))
+            return MediaProbe(info=info, image_only=bool(entries) and not has_video, entries=len(entries))
+
+        videos = self._video_formats(info)
+        if not videos:
+            if info.get('ext') in self._IMAGE_EXTS:
+                return MediaProbe(info=info, image_only=True)
+            return MediaProbe(error="ERROR: No video formats found")
+
+        # Pre-muxed formats need no ffmpeg merge; without any, yt-dlp's default selection applies.
+        muxed = [f for f in videos if f.get('acodec') != 'none']
+        if not muxed:
+            return MediaProbe(info=info)
+        sized = [(f, self._estimated_size(f, info.get('duration'))) for f in muxed]
+        fitting = [(f, size) for f, size in sized if size is None or size <= Config.MAX_UPLOAD_BYTES]
+        if not fitting:
+            return MediaProbe(error="ERROR: File is larger than the 50.00MiB limit")
+
+        # Cheapest post-processing first (mp4 as-is, then remux, then transcode), then quality.
+        costs = {'none': 0, 'remux': 1, 'transcode': 2}
+        chosen, size = max(fitting, key=lambda fs: (
+            -costs[self._postprocess_for(fs[0])], fs[1] is not None, fs[0].get('height') or 0, fs[0].get('tbr') or 0
+        ))
+        return MediaProbe(
+            info=info,
+            format_id=chosen.get('format_id'),
+            ext=chosen.get('ext'),
+            filesize=size,
+            progressive=chosen.get('ext') == 'mp4' and chosen.get('protocol', 'https') in ('http', 'https'),
+            postprocess=self._postprocess_for(chosen),
+        )
+
+    def _postprocess_for(self, fmt: dict) -> str:
+        """Decides how a format becomes a Telegram-friendly mp4."""
+        if fmt.get('ext') == 'mp4':
+            return 'none'
+        vcodec = (fmt.get('vcodec') or '').lower()
+        acodec = (fmt.get('acodec') or 'none').lower()
+        if vcodec.startswith(self._MP4_VIDEO_CODECS) and acodec.startswith(self._MP4_AUDIO_CODECS):
+            return 'remux'
+        return 'transcode'
+
+    def _video_formats(self, info: dict) -> List[dict]:
+        formats = info.get('formats') or ([info] if info.get('url') else [])
+        return [f for f in formats if f.get('vcodec') != 'none' and f.get('ext') not in self._IMAGE_EXTS]
+
+    @staticmethod
+    def _estimated_size(fmt: dict, duration: Optional[float]) -> Optional[int]:
+        size = fmt.get('filesize') or fmt.get('filesize_approx')
+        if not size and fmt.get('tbr') and duration:
+            size = fmt['tbr'] * 1000 / 8 * duration
+        return int(size) if size else None
+
+    @contextmanager
+    def _format_override(self, ydl: "yt_dlp.YoutubeDL", format_id: Optional[str]):
+        """Temporarily makes a pooled YoutubeDL select `format_id` instead of its configured format."""
+        if not format_id:
+            yield
+            return
+        selector = ydl.format_selector
+        ydl.format_selector = ydl.build_format_selector(format_id)
+        try:
+            yield
+        finally:
+            ydl.format_selector = selector
+
+    def fetch(self, url: str, user_id: int, chat_id: int, caption: str, allow_streaming: bool,
+              session: Optional[str] = None) -> FetchResult:
+        """Probes a link, then streams it to the chat when possible or downloads it to disk.
+
+        `session` is the cookie file to use, as picked by the scheduler's session pool.
+        """
+        with self.profiler.profile(f"fetch {url}"):
+            timings = {}
+            started = time.perf_counter()
+            probe = self.probe(url, session)
+            timings['extract'] = time.perf_counter() - started
+            if allow_streaming and probe.progressive:
+                started = time.perf_counter()
+                sent = self.stream_to_telegram(url, chat_id, caption, probe, session)
+                if sent:
+                    timings['stream'] = time.perf_counter() - started
+                    return FetchResult(media=[sent], pipeline='stream', timings=timings)
+                logger.info(f"Streaming unavailable for {url}, falling back to a disk download.")
+            files, temp_dir = self.download_media(url, user_id, probe, timings, session)
+            return FetchResult(
+                files=files, temp_dir=temp_dir, pipeline=self._pipeline_for(url, probe),
+                timings=timings, downloaded_bytes=sum(os.path.getsize(f) for f in files),
+            )
+
+    @staticmethod
+    def _pipeline_for(url: str, probe: MediaProbe) -> str:
+        if probe.format_id or probe.image_only or MediaDownloader.platform_for(url) == 'instagram':
+            return probe.postprocess
+        # Nothing is known about the format, so keep the old behaviour of always converting to mp4.
+        return 'transcode'
+
+    def download_media(self, url: str, user_id: int, probe: Optional[MediaProbe] = None,
+                       timings: Optional[Dict[str, float]] = None,
+                       session: Optional[str] = None) -> Tuple[List[str], str]:
+        probe = probe or self.probe(url, session)
+        temp_dir = tempfile.mkdtemp(prefix=f"media_{user_id}_", dir=self._work_dir(probe))
+
+        self._stage.postprocess = 0.0
+        started = time.perf_counter()
+        entries = probe.info.get('entries') if probe.info else None
+        try:
+            if isinstance(entries, list) and len(entries) > 1 and Config.CAROUSEL_DOWNLOAD_THREADS > 1:
+                self._stage.postprocess = self._download_entries(url, probe, temp_dir, session)
+            else:
+                self._download_into(url, probe, temp_dir, session)
         except Exception as e:
             shutil.rmtree(temp_dir, ignore_errors=True)
             raise e
+        if timings is not None:
+            timings['postprocess'] = self._stage.postprocess
+            timings['download'] = time.perf_counter() - started - self._stage.postprocess
 
-        downloaded_files = [os.path.join(temp_dir, f) for f in os.listdir(temp_dir)]
+        # Carousel entries sit in numbered folders, so sorting keeps the post's order.
+        downloaded_files = sorted(os.path.join(root, f) for root, _, names in os.walk(temp_dir) for f in names)
         if not downloaded_files:
             shutil.rmtree(temp_dir, ignore_errors=True)
             raise ValueError("Download failed: No media files were found after processing the link.")
         return downloaded_files, temp_dir
 
+    @staticmethod
+    def _work_dir(probe: MediaProbe) -> str:
+        """STORAGE_RAM_DIR for image posts while it has room, DOWNLOAD_DIR otherwise.
+
+        Checked here as well as by the scheduler, because jobs that may stream reserve no space
+        up front and only come here when streaming isn't possible.
+        """
+        if probe.image_only and Config.STORAGE_RAM_DIR:
+            try:
+                if shutil.disk_usage(Config.STORAGE_RAM_DIR).free >= Config.STORAGE_JOB_RESERVE_BYTES:
+                    return Config.STORAGE_RAM_DIR
+            except OSError:
+                pass
+        try:
+            free = shutil.disk_usage(Config.DOWNLOAD_DIR).free
+        except OSError:
+            return Config.DOWNLOAD_DIR
+        if free - Config.STORAGE_JOB_RESERVE_BYTES < Config.STORAGE_MIN_FREE_BYTES:
+            raise StorageFullError(f"No space for another download in {Config.DOWNLOAD_DIR}")
+        return Config.DOWNLOAD_DIR
+
+    def _download_into(self, url: str, probe: MediaProbe, temp_dir: str, session: Optional[str]):
+        with self._youtube_dl(self.platform_for(url), self._pipeline_for(url, probe), session) as ydl:
+            ydl.params['paths'] = {'home': temp_dir}
+            if probe.info is None:
+                ydl.extract_info(url, download=True)
+            else:
+                # Reuse the probed metadata instead of extracting the page a second time.
+                with self._format_override(ydl, probe.format_id):
+                    ydl.process_ie_result(copy.deepcopy(probe.info), download=True)
+
+    def _download_entries(self, url: str, probe: MediaProbe, temp_dir: str, session: Optional[str]) -> float:
+        """Downloads the entries of a carousel side by side, each into a numbered folder.
+
+        Returns the seconds spent post-processing, summed over the entries.
+        """
+        platform, pipeline = self.platform_for(url), self._pipeline_for(url, probe)
+        # What yt-dlp passes down from a playlist to its entries when it processes them itself
+        inherited = {k: probe.info[k] for k in ('extractor', 'extractor_key', 'webpage_url',
+                                                'webpage_url_basename', 'webpage_url_domain') if k in probe.info}
+
+        def download(indexed: Tuple[int, dict]) -> float:
+            index, entry = indexed
+            self._stage.postprocess = 0.0
+            with self._youtube_dl(platform, pipeline, session) as ydl:
+                ydl.params['paths'] = {'home': os.path.join(temp_dir, f"{index:03d}")}
+                ydl.process_ie_result(copy.deepcopy(entry), download=True,
+                                      extra_info={**inherited, 'playlist_index': index + 1})
+            return self._stage.postprocess
+
+        with self._pool_lock:
+            if self._entry_pool is None:
+                self._entry_pool = ThreadPoolExecutor(max_workers=Config.CAROUSEL_DOWNLOAD_THREADS, thread_name_prefix="carousel")
+        return sum(self._entry_pool.map(download, enumerate(probe.info['entries'])))
+
+    def stream_to_telegram(self, url: str, chat_id: int, caption: str,
+                           probe: Optional[MediaProbe] = None, session: Optional[str] = None) -> Optional[Tuple[str, str]]:
+        """Pipes a progressive mp4 from yt-dlp into a sendVideo upload without writing the media to disk.
+
+        Returns the sent (kind, file_id), or None when the link has no single-file mp4 and the
+        caller has to fall back to `download_media`, e.g. because the streams need merging.
+        """
+        cookies_file, _ = self._cookies_for(session)
+        # Only the stderr log and a private cookie copy live here; the media itself never touches disk.
+        with tempfile.TemporaryDirectory(prefix="media_stream_", dir=Config.DOWNLOAD_DIR) as work_dir:
+            command = [
+                sys.executable, '-m', 'yt_dlp', '--quiet', '--no-warnings', '--no-part', '--retries', '1', '--extractor-retries', '0',
+                '-f', (probe and probe.format_id) or self._STREAM_FORMAT, '--max-filesize', str(Config.MAX_UPLOAD_BYTES), '-o', '-',
+            ]
+            if cookies_file:
+                # yt-dlp saves the jar on exit; a private copy keeps concurrent jobs from clobbering the file.
+                cookie_copy = os.path.join(work_dir, 'cookies.txt')
+                shutil.copyfile(cookies_file, cookie_copy)
+                command += ['--cookies', cookie_copy]
+            info_path = self._write_info_json(probe.info, work_dir) if probe and probe.info else None
+            # With the probed metadata, yt-dlp skips extraction (and re-extracts from the URL if it went stale).
+            command += ['--load-info-json', info_path] if info_path else ['--', url]
+
+            stderr_path = os.path.join(work_dir, 'stderr.log')
+            with open(stderr_path, 'wb') as stderr:
+                proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr)
+            try:
+                first_chunk = proc.stdout.read(Config.STREAM_CHUNK_SIZE)
+                if not first_chunk:
+                    proc.wait()
+                    error = self._read_stream_error(stderr_path)
+                    if 'requested format is not available' in error.lower():
+                        return None
+                    raise DownloadError(error or "yt-dlp produced no output")
+                return self._upload_stream(proc, first_chunk, stderr_path, chat_id, caption)
+            finally:
+                if proc.poll() is None:
+                    proc.kill()
+                proc.wait()
+                proc.stdout.close()
+
+    def _upload_stream(self, proc: subprocess.Popen, first_chunk: bytes, stderr_path: str,
+                       chat_id: int, caption: str) -> Tuple[str, str]:
+        boundary = uuid.uuid4().hex
+
+        def body():
+            for name, value in (('chat_id', chat_id), ('caption', caption), ('supports_streaming', 'true')):
+                yield f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+            yield (
+                f'--{boundary}\r\nContent-Disposition: form-data; name="video"; filename="video.mp4"\r\n'
+                'Content-Type: video/mp4\r\n\r\n'
+            ).encode()
+            # Only one chunk is held at a time; the pipe applies backpressure to yt-dlp.
+            sent, chunk = 0, first_chunk
+            while chunk:
+                sent += len(chunk)
+                if sent > Config.MAX_UPLOAD_BYTES:
+                    raise DownloadError("ERROR: File is larger than the 50.00MiB limit")
+                yield chunk
+                chunk = proc.stdout.read(Config.STREAM_CHUNK_SIZE)
+            if proc.wait() != 0:
+                raise DownloadError(self._read_stream_error(stderr_path) or "yt-dlp stream failed")
+            yield f'\r\n--{boundary}--\r\n'.encode()
+
+        if self._upload_client is None:
+            self._upload_client = httpx.Client(timeout=httpx.Timeout(60.0, write=None))
+        response = self._upload_client.post(
+            f"{Config.TELEGRAM_API_URL}/bot{Config.BOT_TOKEN}/sendVideo",
+            content=body(),
+            headers={'Content-Type': f'multipart/form-data; boundary={boundary}'},
+        )
+        data = response.json()
+        if not data.get('ok'):
+            raise TelegramError(data.get('description', f"sendVideo failed with HTTP {response.status_code}"))
+        message = data['result']
+        video = message.get('video') or message.get('animation') or message.get('document')
+        return 'video', video['file_id']
+
+    @staticmethod
+    def _write_info_json(info: dict, work_dir: str) -> Optional[str]:
+        path = os.path.join(work_dir, 'info.json')
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(_yt_dlp().YoutubeDL.sanitize_info(copy.deepcopy(info)), f)
+        except (TypeError, ValueError) as e:
+            logger.debug(f"Probe metadata is not serializable, streaming from the URL instead: {e}")
+            return None
+        return path
+
+    @staticmethod
+    def _read_stream_error(stderr_path: str) -> str:
+        with open(stderr_path, 'r', encoding='utf-8', errors='replace') as f:
+            lines = [line.strip() for line in f if line.strip()]
+        return lines[-1] if lines else ""
+
+# --- Media Cache ---
+
+@dataclass
+class CacheEntry:
+    """Telegram file_ids (and optional local copies) of one already-delivered piece of media."""
+    media: List[Tuple[str, str]]
+    expires_at: float
+    files: List[str] = field(default_factory=list)
+    size_bytes: int = 0
+
+
+class MediaCache:
+    """TTL + size-bounded LRU cache of delivered media, keyed by `MediaDownloader.canonical_id`."""
+    def __init__(self, ttl_seconds: int, max_entries: int, keep_files: bool = False,
+                 files_dir: Optional[str] = None, max_bytes: int = 0):
+        self._ttl = ttl_seconds
+        self._max_entries = max_entries
+        self._keep_files = keep_files and bool(files_dir)
+        self._files_dir = files_dir
+        self._max_bytes = max_bytes
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        if self._keep_files:
+            # Files from a previous run are not indexed anymore, so they are only dead weight.
+            shutil.rmtree(files_dir, ignore_errors=True)
+            os.makedirs(files_dir, exist_ok=True)
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        entry = self._entries.get(key)
+        if entry and entry.expires_at <= time.time():
+            self.invalidate(key)
+            entry = None
+        if not entry:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key: str, media: List[Tuple[str, str]], files: Optional[List[str]] = None):
+        """Stores the file_ids of freshly sent media; local files are moved into the cache dir if enabled."""
+        self.invalidate(key)
+        entry = CacheEntry(media=list(media), expires_at=time.time() + self._ttl)
+        if self._keep_files and files:
+            entry_dir = os.path.join(self._files_dir, hashlib.sha1(key.encode()).hexdigest())
+            os.makedirs(entry_dir, exist_ok=True)
+            for index, path in enumerate(files):
+                # Carousel entries come from numbered subfolders and often share a file name.
+                try:
+                    target = shutil.move(path, os.path.join(entry_dir, f"{index:03d}_{os.path.basename(path)}"))
+                except OSError as e:
+                    logger.warning(f"Could not keep cached file {path}: {e}")
+                    continue
+                entry.files.append(target)
+                entry.size_bytes += os.path.getsize(target)
+        self._entries[key] = entry
+        self._total_bytes += entry.size_bytes
+        self._evict()
+
+    def update_media(self, key: str, media: List[Tuple[str, str]]):
+        """Replaces the file_ids of an entry after it had to be re-uploaded from disk."""
+        entry = self._entries.get(key)
+        if entry:
+            entry.media = list(media)
+
+    def invalidate(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry:
+            self._drop_files(entry)
+
+    def _evict(self):
+        while self._entries and (
+            len(self._entries) > self._max_entries
+            or (self._max_bytes and self._total_bytes > self._max_bytes)
+        ):
+            _, entry = self._entries.popitem(last=False)
+            self._drop_files(entry)
+
+    def _drop_files(self, entry: CacheEntry):
+        self._total_bytes -= entry.size_bytes
+        if entry.files:
+            shutil.rmtree(os.path.dirname(entry.files[0]), ignore_errors=True)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'entries': len(self._entries),
+            'bytes': self._total_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+# --- Request Coalescing ---
+
+class SingleFlight:
+    """Runs at most one job per key; callers arriving while it runs share its result or error.
+
+    If the caller running the job is cancelled, a waiting caller takes over and runs it again.
+    """
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    async def run(self, key: str, job: Callable[[], Awaitable]) -> Tuple[object, bool]:
+        """Returns (result, shared); `shared` is True when another caller's run produced the result."""
+        while key in self._inflight:
+            future = self._inflight[key]
+            try:
+                return await asyncio.shield(future), True
+            except asyncio.CancelledError:
+                # Only the run was cancelled, not this caller: the first waiter back here runs the job itself.
+                if not future.cancelled():
+                    raise
+
+        future = asyncio.get_running_loop().create_future()
+        # Mark the outcome as retrieved even when nobody else was waiting for it.
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        try:
+            result = await job()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            self._inflight.pop(key, None)
+
+
+# --- Short Link Cache ---
+
+class ShortLinkCache:
+    """TTL cache in front of the URL shortener; concurrent misses share a single shortener call."""
+    # Failed shortenings fall back to the long link, which is only kept briefly before retrying.
+    _FALLBACK_TTL_SECONDS = 60
+
+    def __init__(self, shorten: Callable[[str], Awaitable[str]], ttl_seconds: int):
+        self._shorten = shorten
+        self._ttl = ttl_seconds
+        self._links: Dict[str, Tuple[str, float]] = {}
+        self._flight = SingleFlight()
+
+    async def get(self, url: str) -> str:
+        cached = self._links.get(url)
+        if cached and cached[1] > time.time():
+            return cached[0]
+        short_url, _ = await self._flight.run(url, lambda: self._refresh(url))
+        return short_url
+
+    async def _refresh(self, url: str) -> str:
+        short_url = await self._shorten(url)
+        ttl = self._ttl if short_url != url else min(self._ttl, self._FALLBACK_TTL_SECONDS)
+        self._links[url] = (short_url, time.time() + ttl)
+        return short_url
+
+    async def refresh_loop(self):
+        """Renews links before they expire so handlers always find a fresh entry."""
+        interval = max(self._FALLBACK_TTL_SECONDS, self._ttl // 4)
+        while True:
+            await asyncio.sleep(interval)
+            for url, (_, expires_at) in list(self._links.items()):
+                if expires_at - time.time() > interval * 2:
+                    continue
+                try:
+                    await self._flight.run(url, lambda u=url: self._refresh(u))
+                except Exception as e:
+                    logger.error(f"Failed to refresh short link for {url}: {e}")
+
+
+# --- Download Engines ---
+
+# Per-process downloader used by the process engine; created once per worker and kept warm.
+_worker_downloader: Optional[MediaDownloader] = None
+
+
+def _init_download_worker():
+    global _worker_downloader
+    _worker_downloader = MediaDownloader()
+    logger.info(f"Download worker process {os.getpid()} ready.")
+
+
+def _call_in_worker(method: str, *args, **kwargs):
+    """Entry point executed in a worker process; the result is sent back over the pool's pipe."""
+    try:
+        return getattr(_worker_downloader, method)(*args, **kwargs)
+    except Exception as e:
+        try:
+            pickle.dumps(e)
+        except Exception:
+            # Keep the message (which the error mapping relies on) even if the type can't cross processes.
+            raise RuntimeError(str(e)) from None
+        raise
+
+
+def _call_downloader(downloader: MediaDownloader, method: str, *args, **kwargs):
+    return getattr(downloader, method)(*args, **kwargs)
+
+
+def build_download_executor(config: Config, downloader: MediaDownloader) -> Tuple[Executor, Callable]:
+    """Returns the executor for download jobs and a `call(method, *args, **kwargs)` function that runs a
+    MediaDownloader method on it, according to DOWNLOAD_ENGINE."""
+    if config.DOWNLOAD_ENGINE == 'process':
+        try:
+            executor = ProcessPoolExecutor(
+                max_workers=config.DOWNLOAD_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_download_worker,
+                max_tasks_per_child=config.PROCESS_WORKER_MAX_JOBS,
+            )
+            logger.info(f"Using process download engine with {config.DOWNLOAD_WORKERS} workers.")
+            return executor, _call_in_worker
+        except (OSError, ValueError, NotImplementedError) as e:
+            logger.warning(f"Process download engine unavailable ({e}), falling back to threads.")
+    executor = ThreadPoolExecutor(max_workers=config.DOWNLOAD_WORKERS, thread_name_prefix="downloader")
+    return executor, functools.partial(_call_downloader, downloader)
+
+
+# --- Rate Limiting ---
+
+@dataclass
+class RateBucket:
+    rate: float
+    max_rate: float
+    tokens: float
+    # Tokens refill from this time on; pushed into the future while the circuit is open.
+    updated: float
+    failures: int = 0
+    open_until: float = 0.0
+    last_used: float = 0.0
+
+
+class AdaptiveLimiter:
+    """Token bucket per (platform, cookie session) whose refill rate adapts to throttling.
+
+    The rate is halved on every throttling error and grows back additively with each success
+    (AIMD). After CIRCUIT_BREAKER_THRESHOLD throttling errors in a row the circuit opens: no
+    tokens for a cooldown that doubles while the session keeps being throttled. Afterwards
+    requests trickle through at the reduced rate until one succeeds.
+    """
+    IDLE_SECONDS = 3600
+
+    def __init__(self, rates: Dict[str, float], burst: int, min_rate: float, recovery_fraction: float,
+                 breaker_threshold: int, cooldown: float, max_cooldown: float):
+        self._rates = rates
+        self._burst = burst
+        self._min_rate = min_rate
+        self._recovery_fraction = recovery_fraction
+        self._breaker_threshold = breaker_threshold
+        self._cooldown = cooldown
+        self._max_cooldown = max_cooldown
+        self._buckets: Dict[Tuple[str, str], RateBucket] = {}
+
+    def _bucket(self, key: Tuple[str, str], now: float) -> RateBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) > 256:
+                self._buckets = {k: b for k, b in self._buckets.items() if now - b.last_used < self.IDLE_SECONDS}
+            max_rate = self._rates.get(key[0], self._rates.get('other', 1.0))
+            bucket = self._buckets[key] = RateBucket(rate=max_rate, max_rate=max_rate, tokens=float(self._burst), updated=now)
+        if now > bucket.updated:
+            bucket.tokens = min(float(self._burst), bucket.tokens + (now - bucket.updated) * bucket.rate)
+            bucket.updated = now
+        bucket.last_used = now
+        return bucket
+
+    def acquire(self, key: Tuple[str, str]) -> float:
+        """Takes a token. Returns 0.0 if one was taken, else the seconds until one is available."""
+        now = time.monotonic()
+        bucket = self._bucket(key, now)
+        if bucket.tokens >= 1 and now >= bucket.updated:
+            bucket.tokens -= 1
+            return 0.0
+        return max(0.0, bucket.updated - now) + (1 - bucket.tokens) / bucket.rate
+
+    def expected_wait(self, key: Tuple[str, str], queued_ahead: int) -> float:
+        """Estimates how long a new request would wait behind `queued_ahead` others for the same key."""
+        now = time.monotonic()
+        bucket = self._bucket(key, now)
+        deficit = queued_ahead + 1 - bucket.tokens
+        return max(0.0, bucket.updated - now) + max(0.0, deficit) / bucket.rate
+
+    def record_throttle(self, key: Tuple[str, str]):
+        now = time.monotonic()
+        bucket = self._bucket(key, now)
+        bucket.rate = max(self._min_rate, bucket.rate / 2)
+        bucket.tokens = 0.0
+        bucket.failures += 1
+        if bucket.failures >= self._breaker_threshold:
+            cooldown = min(self._max_cooldown, self._cooldown * 2 ** (bucket.failures - self._breaker_threshold))
+            bucket.updated = bucket.open_until = now + cooldown
+            logger.warning(f"Circuit open for {key[0]} ({key[1]}) for {cooldown:.0f}s after {bucket.failures} throttling errors.")
+        else:
+            logger.info(f"Throttled on {key[0]} ({key[1]}), rate lowered to {bucket.rate:.2f}/s.")
+
+    def record_success(self, key: Tuple[str, str]):
+        bucket = self._bucket(key, time.monotonic())
+        bucket.failures = 0
+        bucket.rate = min(bucket.max_rate, bucket.rate + bucket.max_rate * self._recovery_fraction)
+
+    def reset(self, platform: str, session: Optional[str] = None):
+        """Forgets the state of one session, or of all of a platform's, e.g. after new cookies were uploaded."""
+        self._buckets = {k: b for k, b in self._buckets.items() if k[0] != platform or session not in (None, k[1])}
+
+    def capacity(self, key: Tuple[str, str]) -> float:
+        """Downloads/second the session currently allows; 0 while its circuit is open."""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return self._rates.get(key[0], self._rates.get('other', 1.0))
+        return 0.0 if bucket.open_until > time.monotonic() else bucket.rate
+
+    def state(self) -> Dict[Tuple[str, str], Dict[str, float]]:
+        now = time.monotonic()
+        return {
+            key: {'rate': bucket.rate, 'max_rate': bucket.max_rate, 'failures': bucket.failures,
+                  'open_for': max(0.0, bucket.open_until - now)}
+            for key, bucket in self._buckets.items()
+        }
+
+
+@dataclass
+class RetryPolicy:
+    """Which job failures the scheduler retries or reports to the limiter as throttling."""
+    classify: Callable[[Exception], str]
+    retry_errors: Tuple[str, ...] = ('rate_limited', 'network')
+    throttle_errors: Tuple[str, ...] = ('rate_limited', 'bot_check')
+    max_retries: int = 2
+    base_delay: float = 2.0
+
+    def backoff(self, attempt: int) -> float:
+        """Exponential backoff with jitter, so retries of a burst of failures don't arrive together."""
+        return self.base_delay * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+
+
+# --- Cookie Sessions ---
+
+@dataclass
+class CookieSession:
+    """One account's cookie file for a platform; `path` is None for the anonymous fallback."""
+    platform: str
+    name: str
+    path: Optional[str]
+    # Recent job outcomes, True where the platform throttled the session
+    outcomes: deque = field(default_factory=deque)
+    in_flight: int = 0
+    uses: int = 0
+    quarantines: int = 0
+    quarantined_until: float = 0.0
+    last_used: float = 0.0
+
+    @property
+    def error_rate(self) -> float:
+        return sum(self.outcomes) / len(self.outcomes) if self.outcomes else 0.0
+
+
+class CookieSessionPool:
+    """The cookie sessions of each platform and how healthy they are.
+
+    A platform's sessions are its configured cookie file plus every valid `.txt` file in
+    `<sessions_dir>/<platform>/`, rescanned every RESCAN_SECONDS. Jobs go to the least busy
+    session first. A session whose recent jobs were throttled at `error_rate` or more is
+    quarantined, for twice as long on each repeat; while every session of a platform is
+    quarantined (or it has none), its jobs run without cookies.
+    """
+    ANONYMOUS = 'anonymous'
+    RESCAN_SECONDS = 10.0
+    _SESSION_NAME = re.compile(r'[a-z0-9_-][a-z0-9_.-]*\.txt', re.IGNORECASE)
+
+    def __init__(self, sessions_dir: str, cookie_files: Dict[str, str], window: int, min_samples: int,
+                 error_rate: float, quarantine: float, max_quarantine: float):
+        self._dir = sessions_dir
+        self._cookie_files = cookie_files
+        self._window = window
+        self._min_samples = min_samples
+        self._error_rate = error_rate
+        self._quarantine = quarantine
+        self._max_quarantine = max_quarantine
+        self._sessions: Dict[str, Dict[str, CookieSession]] = {}
+        self._anonymous: Dict[str, CookieSession] = {}
+        self._scanned: Dict[str, float] = {}
+        # Validation results per path, valid while (mtime, size) is unchanged
+        self._checks: Dict[str, Tuple[tuple, bool]] = {}
+
+    def platforms(self, rescan: bool = True) -> List[str]:
+        if not rescan:
+            return sorted(set(self._cookie_files) | set(self._sessions))
+        try:
+            found = [name for name in os.listdir(self._dir) if os.path.isdir(os.path.join(self._dir, name))]
+        except OSError:
+            found = []
+        return sorted(set(self._cookie_files) | set(found))
+
+    def path_for(self, platform: str, name: Optional[str] = None) -> Optional[str]:
+        """Where a session's cookie file lives; without a name, the platform's configured file.
+
+        None for unknown platforms and for names that aren't a plain `.txt` file inside the
+        platform's sessions folder, since names come from chat commands and shared state.
+        """
+        if platform not in self._cookie_files:
+            return None
+        if not name:
+            return self._cookie_files[platform]
+        if not self._SESSION_NAME.fullmatch(name):
+            return None
+        path = os.path.join(self._dir, platform, name)
+        if os.path.dirname(os.path.realpath(path)) != os.path.join(os.path.realpath(self._dir), platform):
+            return None
+        return path
+
+    def is_primary(self, platform: str, name: str) -> bool:
+        primary = self._cookie_files.get(platform)
+        return bool(primary) and os.path.basename(primary) == name
+
+    def _valid(self, path: str) -> bool:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        signature = (stat.st_mtime_ns, stat.st_size)
+        checked = self._checks.get(path)
+        if checked is None or checked[0] != signature:
+            checked = self._checks[path] = (signature, MediaDownloader._validate_cookies(path))
+        return checked[1]
+
+    def sessions(self, platform: str, rescan: bool = True) -> List[CookieSession]:
+        """The platform's valid sessions, quarantined ones included.
+
+        Without `rescan`, the sessions found by the last scan, so no file is looked at.
+        """
+        now = time.monotonic()
+        if rescan and now - self._scanned.get(platform, float('-inf')) >= self.RESCAN_SECONDS:
+            self._scanned[platform] = now
+            paths = [self._cookie_files[platform]] if platform in self._cookie_files else []
+            try:
+                names = sorted(os.listdir(os.path.join(self._dir, platform)))
+            except OSError:
+                names = []
+            paths += [os.path.join(self._dir, platform, name) for name in names if name.endswith('.txt')]
+
+            known = self._sessions.get(platform, {})
+            found: Dict[str, CookieSession] = {}
+            for path in paths:
+                name = os.path.basename(path)
+                if name in found or not self._valid(path):
+                    continue
+                # Sessions that are still there keep their history.
+                session = known.get(name)
+                if session is None or session.path != path:
+                    session = CookieSession(platform, name, path, deque(maxlen=self._window))
+                found[name] = session
+            self._sessions[platform] = found
+        return list(self._sessions.get(platform, {}).values())
+
+    def candidates(self, platform: str, rescan: bool = True) -> List[CookieSession]:
+        """Sessions to try for a job, least busy first and those heading for quarantine last;
+        the anonymous session if none is usable."""
+        now = time.monotonic()
+        usable = [s for s in self.sessions(platform, rescan) if s.quarantined_until <= now]
+        if not usable:
+            anonymous = self._anonymous.get(platform)
+            if anonymous is None:
+                anonymous = self._anonymous[platform] = CookieSession(platform, self.ANONYMOUS, None, deque(maxlen=self._window))
+            return [anonymous]
+        return sorted(usable, key=lambda s: (s.error_rate >= self._error_rate / 2, s.in_flight, s.error_rate, s.last_used))
+
+    def begin(self, session: CookieSession):
+        session.in_flight += 1
+        session.uses += 1
+        session.last_used = time.monotonic()
+
+    def end(self, session: CookieSession, throttled: Optional[bool]):
+        """Records a finished job; `throttled` is None when it was cancelled and tells nothing."""
+        session.in_flight -= 1
+        if throttled is None:
+            return
+        session.outcomes.append(throttled)
+        if session.path is None:
+            return
+        if not throttled:
+            if session.quarantines and len(session.outcomes) == session.outcomes.maxlen and not any(session.outcomes):
+                # A full window without throttling: the next offence starts from the base quarantine again.
+                session.quarantines = 0
+            return
+        if len(session.outcomes) >= self._min_samples and session.error_rate >= self._error_rate:
+            session.quarantines += 1
+            seconds = min(self._max_quarantine, self._quarantine * 2 ** (session.quarantines - 1))
+            session.quarantined_until = time.monotonic() + seconds
+            logger.warning(f"Quarantined {session.platform} cookie session {session.name} for {seconds:.0f}s "
+                           f"({session.error_rate:.0%} of its last {len(session.outcomes)} jobs were throttled).")
+            session.outcomes.clear()
+
+    def reset(self, platform: str, name: str):
+        """Clears a session's history and quarantine, e.g. after its cookies were replaced."""
+        session = self._sessions.get(platform, {}).get(name)
+        if session:
+            session.outcomes.clear()
+            session.quarantines = 0
+            session.quarantined_until = 0.0
+        self._scanned.pop(platform, None)
+
+    def remove(self, platform: str, name: str) -> bool:
+        path = self.path_for(platform, None if self.is_primary(platform, name) else name)
+        if not path or not os.path.isfile(path):
+            return False
+        try:
+            os.remove(path)
+        except OSError:
+            return False
+        self._scanned.pop(platform, None)
+        return True
+
+    def state(self, rescan: bool = True) -> List[Dict[str, object]]:
+        now = time.monotonic()
+        return [
+            {'platform': s.platform, 'session': s.name, 'in_flight': s.in_flight, 'uses': s.uses,
+             'error_rate': s.error_rate, 'quarantined_for': max(0.0, s.quarantined_until - now)}
+            for platform in self.platforms(rescan) for s in self.sessions(platform, rescan)
+        ]
+
+
+# --- Download Scheduling ---
+
+class QueueFullError(Exception):
+    """Raised when a download cannot be queued because the queue (or the user's share of it) is full."""
+    def __init__(self, message: str, per_user: bool = False):
+        super().__init__(message)
+        self.per_user = per_user
+
+
+class CircuitOpenError(Exception):
+    """Raised when a platform session is throttled so hard that a new download would only wait or fail."""
+
+
+class RemoteJobError(Exception):
+    """A queued download failed on a worker; the message is the one to show the user."""
+
+
+@dataclass
+class DownloadJob:
+    user_id: int
+    platform: str
+    func: Callable
+    args: tuple
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.monotonic)
+    # (platform, cookie session) the job was dispatched to; picked again for every attempt
+    limit_key: Optional[Tuple[str, str]] = None
+    session: Optional[CookieSession] = None
+    attempts: int = 0
+    # Download directory space the job needs, held from dispatch on
+    reservation: Optional["StorageReservation"] = None
+    # When the job first found no space for it
+    storage_blocked_at: Optional[float] = None
+    # Called with the result (None if there is none) when the caller stopped waiting for the job
+    on_abandoned: Optional[Callable[[object], None]] = None
+
+
+class DownloadScheduler:
+    """Runs blocking download jobs on a dedicated executor.
+
+    Jobs are queued per user and dispatched round-robin across users, each platform has its own
+    concurrency cap so a throttled site cannot occupy every worker, and the queue is bounded.
+    With a limiter, jobs also wait for a token of their platform session; with a retry policy,
+    throttled or flaky jobs are run again after a backoff instead of failing right away. With a
+    session pool, each attempt runs on the least busy healthy cookie session that has a token,
+    whose file is passed to the job as `session=`. With a storage manager, jobs carrying a
+    reservation stay queued until their space fits, and fail after `max_storage_wait` seconds.
+    """
+    def __init__(self, executor: Executor, workers: int, platform_limits: Dict[str, int],
+                 max_queued: int, max_per_user: int,
+                 observe_wait: Optional[Callable[[str, float], None]] = None,
+                 limiter: Optional[AdaptiveLimiter] = None, max_limiter_wait: float = float('inf'),
+                 retry: Optional[RetryPolicy] = None,
+                 observe_retry: Optional[Callable[[str, str], None]] = None,
+                 sessions: Optional[CookieSessionPool] = None,
+                 storage: Optional["StorageManager"] = None, max_storage_wait: float = float('inf')):
+        self._executor = executor
+        self._sessions = sessions
+        self._storage = storage
+        self._max_storage_wait = max_storage_wait
+        if storage:
+            storage.on_release = self._dispatch
+        self._closed = False
+        self._observe_wait = observe_wait
+        self._limiter = limiter
+        self._max_limiter_wait = max_limiter_wait
+        self._retry = retry
+        self._observe_retry = observe_retry
+        self._wakeup: Optional[asyncio.TimerHandle] = None
+        self._workers = workers
+        self._platform_limits = platform_limits
+        self._max_queued = max_queued
+        self._max_per_user = max_per_user
+        self._queues: "OrderedDict[int, deque]" = OrderedDict()
+        self._jobs_per_user: Dict[int, int] = defaultdict(int)
+        self._active_per_platform: Dict[str, int] = defaultdict(int)
+        self._active = 0
+        self._queued = 0
+        self._wait_times: deque = deque(maxlen=500)
+        self.completed = 0
+        self.rejected = 0
+        self.retried = 0
+        # Queued jobs held back because their download space doesn't fit yet
+        self.storage_waiting = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queued
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    def submit(self, user_id: int, platform: str, func: Callable, *args,
+               reservation: Optional["StorageReservation"] = None,
+               on_abandoned: Optional[Callable[[object], None]] = None) -> Tuple[asyncio.Future, int]:
+        """Queues `func(*args)`; returns its future and the queue position (0 if it started right away).
+
+        A `reservation` is held once the job is dispatched; the caller releases it. If the future is
+        cancelled, `on_abandoned` gets what the job leaves behind once it is dropped or has finished.
+        """
+        if self._queued >= self._max_queued:
+            self.rejected += 1
+            raise QueueFullError("download queue is full")
+        if self._jobs_per_user[user_id] >= self._max_per_user:
+            self.rejected += 1
+            raise QueueFullError("too many downloads for this user", per_user=True)
+        if self._limiter:
+            keys = [key for key, _ in self._candidates(platform)]
+            # Queued jobs of the platform are spread over its sessions.
+            waiting = sum(1 for queue in self._queues.values() for job in queue if job.platform == platform) // len(keys)
+            if min(self._limiter.expected_wait(key, waiting) for key in keys) > self._max_limiter_wait:
+                self.rejected += 1
+                raise CircuitOpenError(f"{platform} is rate limiting requests")
+
+        job = DownloadJob(user_id, platform, func, args, asyncio.get_running_loop().create_future(),
+                          reservation=reservation, on_abandoned=on_abandoned)
+        self._queues.setdefault(user_id, deque()).append(job)
+        self._jobs_per_user[user_id] += 1
+        self._queued += 1
+        self._dispatch()
+        return job.future, self._position(job)
+
+    def _position(self, job: DownloadJob) -> int:
+        """Estimates how many jobs will be dispatched before `job` under round-robin."""
+        own_queue = self._queues.get(job.user_id)
+        if not own_queue or job not in own_queue:
+            return 0
+        rank = own_queue.index(job) + 1
+        return rank + sum(min(len(q), rank) for uid, q in self._queues.items() if uid != job.user_id)
+
+    def _dispatch(self):
+        if self._closed:
+            return
+        while self._active < self._workers:
+            job = self._next_job()
+            if job is None:
+                return
+            self._start(job)
+
+    def _next_job(self) -> Optional[DownloadJob]:
+        token_wait = None
+        self.storage_waiting = 0
+        for user_id in list(self._queues):
+            queue = self._queues[user_id]
+            for job in list(queue):
+                if job.future.cancelled():
+                    queue.remove(job)
+                    self._release(job)
+                    if job.on_abandoned:
+                        job.on_abandoned(None)
+                    continue
+                if self._active_per_platform[job.platform] < self._platform_limits.get(job.platform, self._workers):
+                    # Checked before taking a token, so a job without space doesn't use one up.
+                    if not self._has_storage(job):
+                        if time.monotonic() - job.storage_blocked_at > self._max_storage_wait:
+                            queue.remove(job)
+                            self._release(job)
+                            self._storage.rejected += 1
+                            job.future.set_exception(StorageFullError(f"No space for another download in {self._storage.directory}"))
+                        else:
+                            self.storage_waiting += 1
+                        continue
+                    wait = self._assign_session(job)
+                    if wait:
+                        token_wait = wait if token_wait is None else min(token_wait, wait)
+                        continue
+                    if self._storage and job.reservation:
+                        self._storage.hold(job.reservation)
+                    queue.remove(job)
+                    self._queued -= 1
+                    # Rotate the user to the back so every other user gets a turn first.
+                    if queue:
+                        self._queues.move_to_end(user_id)
+                    else:
+                        del self._queues[user_id]
+                    return job
+            if not queue:
+                del self._queues[user_id]
+        if self.storage_waiting:
+            token_wait = min(token_wait or StorageManager.RECHECK_SECONDS, StorageManager.RECHECK_SECONDS)
+        if token_wait is not None:
+            self._wake_after(token_wait)
+        return None
+
+    def _has_storage(self, job: DownloadJob) -> bool:
+        if self._storage is None or job.reservation is None or job.reservation.held or self._storage.fits(job.reservation.nbytes):
+            job.storage_blocked_at = None
+            return True
+        if job.storage_blocked_at is None:
+            job.storage_blocked_at = time.monotonic()
+        return False
+
+    def _candidates(self, platform: str) -> List[Tuple[Tuple[str, str], Optional[CookieSession]]]:
+        """(limiter key, session) pairs a job of the platform may run on, in order of preference."""
+        if self._sessions is None:
+            return [((platform, CookieSessionPool.ANONYMOUS), None)]
+        return [((platform, session.name), session) for session in self._sessions.candidates(platform)]
+
+    def _assign_session(self, job: DownloadJob) -> float:
+        """Gives the job the first session with a token. Returns 0.0, or the shortest wait for a token."""
+        shortest = None
+        for key, session in self._candidates(job.platform):
+            wait = self._limiter.acquire(key) if self._limiter else 0.0
+            if not wait:
+                job.limit_key, job.session = key, session
+                return 0.0
+            shortest = wait if shortest is None else min(shortest, wait)
+        return shortest
+
+    def _wake_after(self, delay: float):
+        """Dispatches again once the limiter has a token for a waiting job."""
+        loop = asyncio.get_running_loop()
+        when = loop.time() + delay
+        if self._wakeup and self._wakeup.when() <= when:
+            return
+        if self._wakeup:
+            self._wakeup.cancel()
+        self._wakeup = loop.call_at(when, self._on_wakeup)
+
+    def _on_wakeup(self):
+        self._wakeup = None
+        self._dispatch()
+
+    def _start(self, job: DownloadJob):
+        self._active += 1
+        self._active_per_platform[job.platform] += 1
+        waited = time.monotonic() - job.enqueued_at
+        self._wait_times.append(waited)
+        if self._observe_wait:
+            self._observe_wait(job.platform, waited)
+        if job.session:
+            self._sessions.begin(job.session)
+            call = functools.partial(job.func, *job.args, session=job.session.path)
+        else:
+            call = functools.partial(job.func, *job.args)
+        loop = asyncio.get_running_loop()
+        running = loop.run_in_executor(self._executor, call)
+        running.add_done_callback(lambda f: self._finish(job, f))
+
+    def _finish(self, job: DownloadJob, running: asyncio.Future):
+        self._active -= 1
+        self._active_per_platform[job.platform] -= 1
+        error = None if running.cancelled() else running.exception()
+        error_class = self._retry.classify(error) if self._retry and error is not None else None
+        throttled = self._retry is not None and error_class in self._retry.throttle_errors
+        if self._limiter and job.limit_key and not running.cancelled():
+            if error is None:
+                self._limiter.record_success(job.limit_key)
+            elif throttled:
+                self._limiter.record_throttle(job.limit_key)
+        if job.session:
+            self._sessions.end(job.session, None if running.cancelled() else throttled)
+        if (error_class in (self._retry.retry_errors if self._retry else ())
+                and job.attempts < self._retry.max_retries and not job.future.done()):
+            job.attempts += 1
+            self.retried += 1
+            if self._observe_retry:
+                self._observe_retry(job.platform, error_class)
+            delay = self._retry.backoff(job.attempts)
+            logger.info(f"Retrying {job.platform} download for user {job.user_id} in {delay:.1f}s ({error_class}, attempt {job.attempts}).")
+            asyncio.get_running_loop().call_later(delay, self._requeue, job)
+            self._dispatch()
+            return
+
+        self._jobs_per_user[job.user_id] -= 1
+        if not self._jobs_per_user[job.user_id]:
+            del self._jobs_per_user[job.user_id]
+        self.completed += 1
+        if not job.future.done():
+            if running.cancelled():
+                job.future.cancel()
+            elif running.exception() is not None:
+                job.future.set_exception(running.exception())
+            else:
+                job.future.set_result(running.result())
+        elif job.on_abandoned:
+            job.on_abandoned(None if error is not None or running.cancelled() else running.result())
+        self._dispatch()
+
+    def _requeue(self, job: DownloadJob):
+        """Puts a job back at the front of its user's queue after its backoff."""
+        self._queues.setdefault(job.user_id, deque()).appendleft(job)
+        self._queued += 1
+        job.enqueued_at = time.monotonic()
+        self._dispatch()
+
+    def _release(self, job: DownloadJob):
+        self._queued -= 1
+        self._jobs_per_user[job.user_id] -= 1
+        if not self._jobs_per_user[job.user_id]:
+            del self._jobs_per_user[job.user_id]
+
+    def active_by_platform(self) -> Dict[Tuple[str], int]:
+        return {(platform,): count for platform, count in self._active_per_platform.items()}
+
+    def stats(self) -> Dict[str, float]:
+        waits = sorted(self._wait_times)
+        return {
+            'queued': self._queued,
+            'active': self._active,
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'retried': self.retried,
+            'storage_waiting': self.storage_waiting,
+            'wait_avg': sum(waits) / len(waits) if waits else 0.0,
+            'wait_p95': waits[int(len(waits) * 0.95)] if waits else 0.0,
+            **{f"active_{platform}": count for platform, count in self._active_per_platform.items()},
+        }
+
+    def shutdown(self):
+        self._closed = True
+        if self._wakeup:
+            self._wakeup.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# --- Temp Storage ---
+
+class StorageFullError(Exception):
+    """Raised when no space for another download freed up within STORAGE_MAX_WAIT_SECONDS."""
+
+
+@dataclass
+class StorageReservation:
+    nbytes: int
+    # Counted against the budget from when the scheduler dispatches the job until it is released
+    held: bool = False
+    released: bool = False
+
+
+class StorageManager:
+    """Byte budget for the download folders, and cleanup of the ones killed processes left behind.
+
+    A job's reservation is held from when the scheduler dispatches it, and shrinks to what its
+    files really take once downloaded. While the budget is used up, or the disk would drop below
+    its free-space floor, the scheduler keeps jobs queued until others release theirs. Folders are
+    swept by age, since a job of another process sharing the directory may still be writing to a
+    young one.
+    """
+    PREFIX = 'media_'
+    # Disk space can also be freed outside the bot, so jobs waiting for it are re-checked this often.
+    RECHECK_SECONDS = 1.0
+
+    def __init__(self, directory: str, budget_bytes: int, min_free_bytes: int, orphan_age: float, ram_dir: str = ''):
+        self.directory = directory
+        self._budget = budget_bytes
+        self._min_free = min_free_bytes
+        self._orphan_age = orphan_age
+        self._dirs = [directory]
+        if ram_dir:
+            try:
+                os.makedirs(ram_dir, exist_ok=True)
+                self._dirs.append(ram_dir)
+            except OSError as e:
+                logger.warning(f"RAM download directory {ram_dir} is unusable, images go to disk: {e}")
+        os.makedirs(directory, exist_ok=True)
+        # Wall-clock time this process started using the directories
+        self.started = time.time()
+        self.reserved = 0
+        self.rejected = 0
+        # Called when space is given back, e.g. to dispatch jobs waiting for it
+        self.on_release: Optional[Callable[[], None]] = None
+
+    def free_bytes(self) -> int:
+        try:
+            return shutil.disk_usage(self.directory).free
+        except OSError:
+            return 0
+
+    def reservation(self, nbytes: int) -> StorageReservation:
+        """A reservation for a job to be queued with; nothing is held until the job is dispatched."""
+        if nbytes > self._budget:
+            self.rejected += 1
+            raise StorageFullError(f"A download of {nbytes} bytes exceeds the storage budget")
+        return StorageReservation(nbytes)
+
+    def fits(self, nbytes: int) -> bool:
+        if not nbytes:
+            return True
+        return self.reserved + nbytes <= self._budget and self.free_bytes() - nbytes >= self._min_free
+
+    def hold(self, reservation: StorageReservation):
+        if reservation.held or reservation.released:
+            return
+        reservation.held = True
+        self.reserved += reservation.nbytes
+
+    def resize(self, reservation: StorageReservation, nbytes: int):
+        """Sets a reservation to the bytes its files really take; may exceed the budget for oversized posts."""
+        if not reservation.held or reservation.released:
+            reservation.nbytes = nbytes
+            return
+        self.reserved += nbytes - reservation.nbytes
+        shrunk = nbytes < reservation.nbytes
+        reservation.nbytes = nbytes
+        if shrunk:
+            self._notify()
+
+    def release(self, reservation: StorageReservation):
+        if reservation.released:
+            return
+        reservation.released = True
+        if reservation.held:
+            self.reserved -= reservation.nbytes
+            self._notify()
+
+    def _notify(self):
+        if self.on_release:
+            self.on_release()
+
+    def sweep(self, before: Optional[float] = None) -> int:
+        """Removes download folders untouched for the orphan age (or since `before`); returns how many."""
+        cutoff = max(time.time() - self._orphan_age, before or 0.0)
+        removed = 0
+        for directory in self._dirs:
+            try:
+                names = [name for name in os.listdir(directory) if name.startswith(self.PREFIX)]
+            except OSError:
+                continue
+            for name in names:
+                path = os.path.join(directory, name)
+                if self._last_change(path) >= cutoff:
+                    continue
+                if os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        continue
+                removed += 1
+        return removed
+
+    @staticmethod
+    def _last_change(path: str) -> float:
+        """Latest change anywhere in a folder. ctime too, because yt-dlp backdates a file's mtime to its upload date."""
+        try:
+            stat = os.stat(path)
+            latest = max(stat.st_mtime, stat.st_ctime)
+            for root, dirs, files in os.walk(path):
+                for name in dirs + files:
+                    stat = os.stat(os.path.join(root, name))
+                    latest = max(latest, stat.st_mtime, stat.st_ctime)
+        except OSError:
+            # It changed while we looked, so something is still using it.
+            return time.time()
+        return latest
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'reserved': self.reserved,
+            'budget': self._budget,
+            'free': self.free_bytes(),
+            'rejected': self.rejected,
+        }
+
+
+# --- Batch Delivery ---
+
+@dataclass
+class BatchItem:
+    """One post of a multi-link message; posts are delivered in the order of their links."""
+    url: str
+    cache_key: str
+    # (kind, file_id) pairs from the media cache, or (kind, path) pairs of downloaded files
+    media: List[Tuple[str, str]] = field(default_factory=list)
+    cached: Optional[CacheEntry] = None
+    result: Optional[FetchResult] = None
+    error: Optional[str] = None
+    # Whether the post's media may be answered from and stored in the media cache
+    cacheable: bool = False
+    # Space held in the download directory until the post's files are sent
+    reservation: Optional[StorageReservation] = None
+
 
 # --- Main Bot Class ---
 
 class TelegramBot:
     """The main class for the Telegram Bot."""
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, startup: Optional[PhaseTimer] = None):
         self.config = config
+        # Startup phase durations: imports, setup, connect and http, plus the background warm-up
+        self.startup = startup or PhaseTimer()
         self.db = Database(config.DB_FILE)
         self.downloader = MediaDownloader()
-        self.application = Application.builder().token(config.BOT_TOKEN).build()
+        self.media_cache = MediaCache(
+            ttl_seconds=config.MEDIA_CACHE_TTL_SECONDS,
+            max_entries=config.MEDIA_CACHE_MAX_ENTRIES,
+            keep_files=config.MEDIA_CACHE_KEEP_FILES,
+            files_dir=config.MEDIA_CACHE_DIR,
+            max_bytes=config.MEDIA_CACHE_MAX_BYTES,
+        )
+        self.inflight = SingleFlight()
+        self.storage = StorageManager(
+            directory=config.DOWNLOAD_DIR,
+            budget_bytes=config.STORAGE_BUDGET_BYTES,
+            min_free_bytes=config.STORAGE_MIN_FREE_BYTES,
+            orphan_age=config.STORAGE_ORPHAN_AGE_SECONDS,
+            ram_dir=config.STORAGE_RAM_DIR,
+        )
+        self.metrics = Metrics()
+        self.stage_seconds = self.metrics.histogram(
+            'bot_stage_seconds', "Time spent in each stage of handling a link.", ['stage', 'platform'])
+        self.download_speed = self.metrics.histogram(
+            'bot_download_bytes_per_second', "Download throughput of finished downloads.", ['platform'],
+            buckets=(64e3, 256e3, 1e6, 2.5e6, 5e6, 10e6, 25e6, 50e6, 100e6))
+        # How many jobs took each media path (stream / none / remux / transcode)
+        self.downloads = self.metrics.counter(
+            'bot_downloads_total', "Finished downloads by media path.", ['platform', 'pipeline'])
+        self.download_errors = self.metrics.counter(
+            'bot_download_errors_total', "Failed downloads by error class.", ['platform', 'error'])
+        self.download_executor, self.download_call = build_download_executor(config, self.downloader)
+        self.limiter = AdaptiveLimiter(
+            rates=config.PLATFORM_RATE_LIMITS,
+            burst=config.RATE_LIMIT_BURST,
+            min_rate=config.RATE_LIMIT_MIN_RATE,
+            recovery_fraction=config.RATE_RECOVERY_FRACTION,
+            breaker_threshold=config.CIRCUIT_BREAKER_THRESHOLD,
+            cooldown=config.CIRCUIT_BREAKER_COOLDOWN_SECONDS,
+            max_cooldown=config.CIRCUIT_BREAKER_MAX_COOLDOWN_SECONDS,
+        )
+        self.download_retries = self.metrics.counter(
+            'bot_download_retries_total', "Download jobs retried after a backoff, by error class.", ['platform', 'error'])
+        self.sessions = CookieSessionPool(
+            sessions_dir=config.COOKIE_SESSIONS_DIR,
+            cookie_files={
+                'instagram': config.INSTAGRAM_COOKIES_FILE,
+                'youtube': config.YOUTUBE_COOKIES_FILE,
+                'facebook': config.FACEBOOK_COOKIES_FILE,
+            },
+            window=config.SESSION_WINDOW,
+            min_samples=config.SESSION_MIN_SAMPLES,
+            error_rate=config.SESSION_ERROR_RATE,
+            quarantine=config.SESSION_QUARANTINE_SECONDS,
+            max_quarantine=config.SESSION_MAX_QUARANTINE_SECONDS,
+        )
+        self.scheduler = DownloadScheduler(
+            executor=self.download_executor,
+            workers=config.DOWNLOAD_WORKERS,
+            platform_limits=config.PLATFORM_CONCURRENCY,
+            max_queued=config.MAX_QUEUED_DOWNLOADS,
+            max_per_user=config.MAX_DOWNLOADS_PER_USER,
+            observe_wait=lambda platform, seconds: self.stage_seconds.observe(seconds, stage='queue', platform=platform),
+            limiter=self.limiter,
+            max_limiter_wait=config.RATE_LIMIT_MAX_WAIT_SECONDS,
+            retry=RetryPolicy(self.classify_error, max_retries=config.DOWNLOAD_RETRIES, base_delay=config.RETRY_BASE_DELAY_SECONDS),
+            observe_retry=lambda platform, error: self.download_retries.inc(platform=platform, error=error),
+            sessions=self.sessions,
+            storage=self.storage,
+            max_storage_wait=config.STORAGE_MAX_WAIT_SECONDS,
+        )
+        self.metrics.gauge('bot_download_queue_depth', "Download jobs waiting for a worker.", fn=lambda: self.scheduler.queue_depth)
+        self.metrics.gauge('bot_downloads_active', "Download jobs running.", fn=lambda: self.scheduler.active)
+        self.metrics.gauge('bot_downloads_active_by_platform', "Download jobs running per platform.", ['platform'],
+                           fn=self.scheduler.active_by_platform)
+        self.metrics.gauge('bot_rate_limit_per_second', "Current download rate allowed per platform session.",
+                           ['platform', 'session'], fn=lambda: {k: v['rate'] for k, v in self.limiter.state().items()})
+        self.metrics.gauge('bot_circuit_open_seconds', "Seconds until a tripped platform session accepts downloads again.",
+                           ['platform', 'session'], fn=lambda: {k: v['open_for'] for k, v in self.limiter.state().items()})
+        # Session gauges read the sessions found by the last scan (jobs rescan every RESCAN_SECONDS),
+        # so a scrape does no file I/O on the event loop.
+        self.metrics.gauge('bot_cookie_sessions', "Valid cookie sessions per platform, healthy or quarantined.",
+                           ['platform', 'state'], fn=lambda: self._session_counts(rescan=False))
+        self.metrics.gauge('bot_session_throttle_ratio', "Share of a cookie session's recent jobs that were throttled.",
+                           ['platform', 'session'],
+                           fn=lambda: {(s['platform'], s['session']): s['error_rate'] for s in self.sessions.state(rescan=False)})
+        self.metrics.gauge('bot_download_capacity_per_second', "Downloads/second the usable sessions of a platform allow.",
+                           ['platform'], fn=lambda: {(p,): rate for p, rate in self._session_capacity(rescan=False).items()})
+        self.metrics.gauge('bot_inflight_links', "Distinct links being fetched, after coalescing.", fn=lambda: len(self.inflight))
+        self.metrics.gauge('bot_media_cache_entries', "Links answered from cached file_ids.", fn=lambda: self.media_cache.stats()['entries'])
+        self.metrics.gauge('bot_storage_reserved_bytes',
+                           "Bytes reserved in the download directory by dispatched jobs and files waiting to be sent.",
+                           fn=lambda: self.storage.reserved)
+        self.metrics.gauge('bot_storage_free_bytes', "Free space on the download directory's disk.", fn=self.storage.free_bytes)
+        self.metrics.gauge('bot_storage_waiting_jobs', "Queued jobs held back until their download space fits.",
+                           fn=lambda: self.scheduler.storage_waiting)
+        self.storage_swept = self.metrics.counter(
+            'bot_storage_orphans_removed_total', "Download folders left behind by killed processes and removed.")
+        self.metrics.gauge('bot_startup_seconds', "Time each startup phase took.", ['phase'],
+                           fn=lambda: {(phase,): seconds for phase, seconds in self.startup.phases.items()})
+        self.application = (
+            Application.builder()
+            .token(config.BOT_TOKEN)
+            .base_url(f"{config.TELEGRAM_API_URL}/bot")
+            .base_file_url(f"{config.TELEGRAM_API_URL}/file/bot")
+            .concurrent_updates(config.CONCURRENT_UPDATES)
+            .build()
+        )
+        self.webhook_secret = config.WEBHOOK_SECRET or secrets.token_urlsafe(32)
+        self.http_server = keep_alive(config.HTTP_HOST, config.WORKER_HTTP_PORT if config.ROLE == 'worker' else config.HTTP_PORT)
+        self.http_server.route('GET', '/healthz', self.health_probe)
+        self.http_server.route('GET', '/readyz', self.readiness_probe)
+        self.http_server.route('GET', '/metrics', self.metrics_endpoint)
+        self.http_server.route('POST', config.WEBHOOK_PATH, self.webhook_update)
+        self.ready = False
         self.http_client = httpx.AsyncClient(timeout=10.0)
+        self.short_links = ShortLinkCache(self._shorten_url, config.SHORT_URL_TTL_SECONDS)
+        # Resolved once in post_init instead of calling get_me() for every reply.
+        self.bot_username: Optional[str] = None
+        self._background_tasks: List[asyncio.Task] = []
+        self._prewarm: Optional[asyncio.Future] = None
+        # Shared with the other processes when the front and the download workers run apart
+        self.job_queue: Optional[JobQueue] = open_job_queue(config.JOB_QUEUE_URL) if config.ROLE != 'standalone' else None
+        self._state_synced_at = 0.0
+        # Read from the shared queue off the event loop just before each scrape
+        self._shared_queue_depth = 0
+        if self.job_queue:
+            self.metrics.gauge('bot_shared_queue_depth', "Jobs waiting in the queue shared with the download workers.",
+                               fn=lambda: self._shared_queue_depth)
         self._register_handlers()
+        self.startup.mark('setup')
 
     def _register_handlers(self):
         self.application.add_handler(CommandHandler("start", self.start_command))
+        self.application.add_handler(CommandHandler("stats", self.stats_command))
+        self.application.add_handler(CommandHandler("sessions", self.sessions_command))
         self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message))
         self.application.add_handler(MessageHandler(filters.Document.ALL, self.handle_cookie_file))
         self.application.add_error_handler(self.error_handler)
 
-    async def _generate_short_url(self, bot_username: str) -> str:
-        deep_link = f"https://t.me/{bot_username}?start=shorte"
+    async def _get_bot_username(self, bot) -> str:
+        if not self.bot_username:
+            self.bot_username = (await bot.get_me()).username
+        return self.bot_username
+
+    async def _generate_short_url(self, bot) -> str:
+        deep_link = f"https://t.me/{await self._get_bot_username(bot)}?start=shorte"
+        return await self.short_links.get(deep_link)
+
+    async def _shorten_url(self, deep_link: str) -> str:
         if not self.config.SHORTENER_TOKEN:
             return deep_link
         params = {'api': self.config.SHORTENER_TOKEN, 'url': deep_link}
@@ -233,10 +2198,11 @@ class TelegramBot:
         start_message = (
             "🌟 **Welcome to the All-in-One Media Downloader!**\n\n"
             "Send me a link from Instagram, Facebook, or YouTube, and I'll download it for you.\n\n"
-            "Supported content: Reels, Shorts, Videos, and Images."
+            "Supported content: Reels, Shorts, Videos, and Images.\n"
+            "Send several links at once, or a profile or playlist link, to get all of its posts."
         )
         if context.args and context.args[0] == "shorte":
-            self.db.grant_access(user.id)
+            await self._grant_access(user.id)
             await update.message.reply_text(
                 f"🎉 **Premium Access Activated!**\n\nYour free access is valid for {self.config.ACCESS_DURATION_HOURS} hours.\n\n{start_message}",
                 parse_mode='Markdown'
@@ -244,8 +2210,7 @@ class TelegramBot:
         elif self.db.has_valid_access(user.id):
             await update.message.reply_text(f"✅ **Welcome back!**\nYour access is active.\n\n{start_message}", parse_mode='Markdown')
         else:
-            bot_username = (await context.bot.get_me()).username
-            short_url = await self._generate_short_url(bot_username)
+            short_url = await self._generate_short_url(context.bot)
             keyboard = [[InlineKeyboardButton("🔥 GET FREE ACCESS 🔥", url=short_url)]]
             await update.message.reply_text(
                 f"🔒 **Premium Access Required**\n\n{start_message}\n\nFirst, click the button below to activate your free 24-hour access.",
@@ -258,20 +2223,26 @@ class TelegramBot:
         message_text = update.message.text.strip()
 
         if message_text == "9434" and user_id == self.config.ADMIN_ID:
-            self.db.grant_access(user_id)
+            await self._grant_access(user_id)
             await update.message.reply_text("✅ **Admin Bypass:** Access granted for 24 hours.")
             return
 
-        if not self.downloader.is_valid_url(message_text):
+        started = time.perf_counter()
+        urls = self.downloader.extract_urls(message_text, self.config.MAX_LINKS_PER_MESSAGE)
+        platform = self.downloader.platform_for(urls[0]) if urls else 'other'
+        self.stage_seconds.observe(time.perf_counter() - started, stage='validate', platform=platform)
+        if not urls:
             await update.message.reply_text(
                 "❌ **Invalid or Unsupported URL**\n\nPlease send a direct link to a Reel, Short, Video, or Image from Instagram, Facebook, or YouTube.",
                 parse_mode='Markdown'
             )
             return
             
-        if not self.db.has_valid_access(user_id):
-            bot_username = (await context.bot.get_me()).username
-            short_url = await self._generate_short_url(bot_username)
+        started = time.perf_counter()
+        has_access = self.db.has_valid_access(user_id)
+        self.stage_seconds.observe(time.perf_counter() - started, stage='access', platform=platform)
+        if not has_access:
+            short_url = await self._generate_short_url(context.bot)
             keyboard = [[InlineKeyboardButton("⏳ RENEW ACCESS ⏳", url=short_url)]]
             await update.message.reply_text(
                 "⏱️ **Your access has expired!**\nPlease renew your free access.",
@@ -280,101 +2251,622 @@ class TelegramBot:
             )
             return
 
-        asyncio.create_task(self.process_download_task(update, context, message_text))
+        if len(urls) == 1 and not self.downloader.is_collection(urls[0]):
+            asyncio.create_task(self.process_download_task(update, context, urls[0]))
+        else:
+            asyncio.create_task(self.process_batch_task(update, context, urls))
+
+    async def _grant_access(self, user_id: int):
+        expires_at = self.db.grant_access(user_id)
+        if self.job_queue:
+            # Kept until the grant ends; the other processes have merged it by then.
+            await asyncio.to_thread(self.job_queue.set_state, f"access:{user_id}", str(expires_at),
+                                    max(0, expires_at - time.time()))
 
     async def process_download_task(self, update: Update, context: ContextTypes.DEFAULT_TYPE, url: str):
         user_id = update.effective_user.id
+        chat_id = update.effective_chat.id
+        cache_key = self.downloader.canonical_id(url)
+        cacheable = self.downloader.is_cacheable(url)
+
+        cached = self.media_cache.get(cache_key) if cacheable else None
+        if cached and await self._send_cached_media(context.bot, chat_id, cache_key, cached):
+            logger.info(f"Cache hit for {cache_key} (user {user_id})")
+            return
+
         msg = await update.message.reply_text("⏬ Downloading, please wait...")
-        temp_dir = None
         try:
-            files, temp_dir = await asyncio.to_thread(self.downloader.download_media, url, user_id)
-            
-            await context.bot.edit_message_text("✅ Download complete! Sending media...", chat_id=msg.chat_id, message_id=msg.message_id)
-            await self._send_media(update, context, files)
-            
+            # Concurrent requests for the same media attach to the first one instead of downloading again.
+            media, shared = await self.inflight.run(
+                cache_key,
+                lambda: self._download_and_send(context.bot, chat_id, user_id, url, msg, cache_key if cacheable else None)
+            )
+            if shared:
+                logger.info(f"Joined in-flight download of {cache_key} (user {user_id})")
+                if media:
+                    await self._deliver_media(context.bot, chat_id, media)
+                else:
+                    await context.bot.send_message(chat_id=chat_id, text="🤔 Could not find any supported media in the link.")
+
             await context.bot.delete_message(chat_id=msg.chat_id, message_id=msg.message_id)
 
         except Exception as e:
             logger.error(f"Unexpected error for user {user_id}: {e}", exc_info=True)
-            error_message = self._handle_download_error(e, user_id)
+            error_message = self._handle_download_error(e, user_id, self.downloader.platform_for(url))
             await context.bot.edit_message_text(error_message, chat_id=msg.chat_id, message_id=msg.message_id, parse_mode='Markdown')
+
+    async def process_batch_task(self, update: Update, context: ContextTypes.DEFAULT_TYPE, urls: List[str]):
+        """Delivers every post behind the links of one message, in order.
+
+        Profile and playlist links are expanded into their posts, which are fetched a few at a
+        time; each run of posts that is ready goes out (as a media group) while the later ones
+        are still downloading.
+        """
+        user_id = update.effective_user.id
+        chat_id = update.effective_chat.id
+        bot = context.bot
+        msg = await update.message.reply_text(f"⏬ Collecting {len(urls)} link{'s' if len(urls) > 1 else ''}, please wait...")
+        # Bounded fan-out; more would only be refused by the scheduler's per-user cap.
+        limit = asyncio.Semaphore(max(1, min(self.config.BATCH_PARALLELISM, self.config.MAX_DOWNLOADS_PER_USER)))
+        errors: List[str] = []
+        try:
+            expanded = await asyncio.gather(*(self._expand_link(bot, user_id, url, limit) for url in urls),
+                                            return_exceptions=True)
+            items, seen = [], set()
+            for url, found in zip(urls, expanded):
+                if isinstance(found, Exception):
+                    logger.error(f"Could not expand {url} for user {user_id}: {found}")
+                    errors.append(self._handle_download_error(found, user_id, self.downloader.platform_for(url)))
+                    continue
+                for item_url in found:
+                    key = self.downloader.canonical_id(item_url)
+                    if key not in seen:
+                        seen.add(key)
+                        items.append(item_url)
+            items = items[:self.config.MAX_BATCH_ITEMS]
+            total = len(items) + len(errors)
+
+            delivered = 0
+            if items:
+                await bot.edit_message_text(f"⏬ Downloading {len(items)} post{'s' if len(items) > 1 else ''}, please wait...",
+                                            chat_id=msg.chat_id, message_id=msg.message_id)
+                if self.config.ROLE == 'front':
+                    delivered = await self._deliver_remote_batch(bot, chat_id, user_id, items, msg, errors)
+                else:
+                    delivered = await self._deliver_batch(bot, chat_id, user_id, items, limit, errors)
+            logger.info(f"Delivered {delivered} of {total} posts from {len(urls)} links to user {user_id}")
+
+            if not errors:
+                await bot.delete_message(chat_id=msg.chat_id, message_id=msg.message_id)
+                return
+            # The same failure on many posts is reported once.
+            reasons = "\n\n".join(list(dict.fromkeys(errors))[:3])
+            await bot.edit_message_text(f"✅ Sent {delivered} of {total} posts.\n\n{reasons}",
+                                        chat_id=msg.chat_id, message_id=msg.message_id, parse_mode='Markdown')
+        except Exception as e:
+            logger.error(f"Unexpected error for user {user_id}: {e}", exc_info=True)
+            error_message = self._handle_download_error(e, user_id, self.downloader.platform_for(urls[0]))
+            await bot.edit_message_text(error_message, chat_id=msg.chat_id, message_id=msg.message_id, parse_mode='Markdown')
+
+    async def _expand_link(self, bot, user_id: int, url: str, limit: asyncio.Semaphore) -> List[str]:
+        """The post links behind a profile/playlist link, or the link itself."""
+        if not self.downloader.is_collection(url):
+            return [url]
+        async with limit:
+            return await self._run_download_job(bot, None, user_id, self.downloader.platform_for(url),
+                                                'expand', url, self.config.MAX_BATCH_ITEMS)
+
+    async def _deliver_batch(self, bot, chat_id: int, user_id: int, urls: List[str],
+                             limit: asyncio.Semaphore, errors: List[str]) -> int:
+        """Fetches posts in parallel and sends them in order. Returns how many were delivered."""
+        fetches = [asyncio.create_task(self._fetch_batch_item(bot, chat_id, user_id, url, limit)) for url in urls]
+        delivered = 0
+        ready: List[BatchItem] = []
+        try:
+            for index, fetch in enumerate(fetches):
+                item = await fetch
+                if item.error:
+                    errors.append(item.error)
+                else:
+                    ready.append(item)
+                # Send what is ready once it fills a media group, or when the next post would keep it waiting.
+                next_ready = index + 1 < len(fetches) and fetches[index + 1].done()
+                if ready and (sum(len(i.media) for i in ready) >= 10 or not next_ready):
+                    delivered += await self._send_batch(bot, chat_id, user_id, ready, errors)
+                    for sent in ready:
+                        self._discard_batch_item(sent)
+                    ready = []
+        finally:
+            for fetch in fetches:
+                if not fetch.done():
+                    fetch.cancel()
+                elif not fetch.cancelled() and fetch.exception() is None:
+                    self._discard_batch_item(fetch.result())
+        return delivered
+
+    async def _fetch_batch_item(self, bot, chat_id: int, user_id: int, url: str, limit: asyncio.Semaphore) -> BatchItem:
+        item = BatchItem(url=url, cache_key=self.downloader.canonical_id(url), cacheable=self.downloader.is_cacheable(url))
+        cached = self.media_cache.get(item.cache_key) if item.cacheable else None
+        if cached:
+            item.media, item.cached = list(cached.media), cached
+            return item
+        platform = self.downloader.platform_for(url)
+        caption = f"Downloaded via @{await self._get_bot_username(bot)}"
+        try:
+            item.reservation = self.storage.reservation(self.config.STORAGE_JOB_RESERVE_BYTES)
+            async with limit:
+                try:
+                    # No streaming: it would send the video straight to the chat, ahead of the posts before it.
+                    item.result = await self._run_download_job(bot, None, user_id, platform, 'fetch',
+                                                               url, user_id, chat_id, caption, False,
+                                                               reservation=item.reservation,
+                                                               on_abandoned=functools.partial(self._abandon_batch_item, item))
+                except Exception:
+                    # Nothing to hold if the job failed.
+                    self.storage.resize(item.reservation, 0)
+                    raise
+            # Hold what the files take until they are sent.
+            self.storage.resize(item.reservation, item.result.downloaded_bytes)
+            self._record_fetch(platform, item.result)
+            item.media = self._media_files(item.result.files)
+            if not item.media:
+                item.error = self._ERROR_MESSAGES['no_media']
+        except asyncio.CancelledError:
+            # A job that already started can't be stopped; the scheduler hands its files to _abandon_batch_item.
+            if not (item.reservation and item.reservation.held):
+                self._discard_batch_item(item)
+            raise
+        except Exception as e:
+            logger.error(f"Batch download of {url} for user {user_id} failed: {e}")
+            item.error = self._handle_download_error(e, user_id, platform)
+        return item
+
+    async def _send_batch(self, bot, chat_id: int, user_id: int, items: List[BatchItem], errors: List[str]) -> int:
+        """Sends ready posts in media groups of up to 10 items that never split a post. Returns how many were delivered."""
+        groups: List[List[BatchItem]] = [[]]
+        for item in items:
+            if groups[-1] and sum(len(i.media) for i in groups[-1]) + len(item.media) > 10:
+                groups.append([])
+            groups[-1].append(item)
+        delivered = 0
+        for group in groups:
+            delivered += await self._send_group(bot, chat_id, user_id, group, errors)
+        return delivered
+
+    async def _send_group(self, bot, chat_id: int, user_id: int, items: List[BatchItem], errors: List[str]) -> int:
+        """Sends posts together and caches their file_ids. Returns how many were delivered."""
+        files = []
+        try:
+            media = []
+            for item in items:
+                for kind, payload in item.media:
+                    if item.cached is None:
+                        payload = open(payload, 'rb')
+                        files.append(payload)
+                    media.append((kind, payload))
+            with self.stage_seconds.time(stage='upload', platform=self.downloader.platform_for(items[0].url)):
+                sent = await self._deliver_media(bot, chat_id, media)
+        except TelegramError as e:
+            if len(items) == 1 and items[0].cached is None:
+                errors.append(self._handle_download_error(e, user_id, self.downloader.platform_for(items[0].url)))
+                return 0
+            # E.g. an expired cached file_id: send the posts one by one so only the bad one is retried.
+            logger.warning(f"Sending {len(items)} posts together failed, sending them one by one: {e}")
+            return sum([await self._send_batch_item(bot, chat_id, user_id, item, errors) for item in items])
+        finally:
+            for f in files:
+                f.close()
+
+        offset = 0
+        for item in items:
+            if item.cached is None and item.cacheable:
+                self.media_cache.put(item.cache_key, sent[offset:offset + len(item.media)], item.result.files)
+            offset += len(item.media)
+        return len(items)
+
+    async def _send_batch_item(self, bot, chat_id: int, user_id: int, item: BatchItem, errors: List[str]) -> int:
+        try:
+            if item.cached is not None:
+                if await self._send_cached_media(bot, chat_id, item.cache_key, item.cached):
+                    return 1
+                errors.append(self._ERROR_MESSAGES['no_media'])
+                return 0
+            media = await self._send_media(bot, chat_id, item.result.files)
+            if media and item.cacheable:
+                self.media_cache.put(item.cache_key, media, item.result.files)
+            return 1
+        except Exception as e:
+            errors.append(self._handle_download_error(e, user_id, self.downloader.platform_for(item.url)))
+            return 0
+
+    def _abandon_batch_item(self, item: BatchItem, result: Optional[FetchResult]):
+        item.result = item.result or result
+        self._discard_batch_item(item)
+
+    def _discard_batch_item(self, item: BatchItem):
+        if item.result and item.result.temp_dir:
+            shutil.rmtree(item.result.temp_dir, ignore_errors=True)
+            item.result.temp_dir = None
+        if item.reservation:
+            self.storage.release(item.reservation)
+
+    async def _deliver_remote_batch(self, bot, chat_id: int, user_id: int, urls: List[str], msg, errors: List[str]) -> int:
+        """Front role: workers send each post themselves, so posts are handed to them one at a time to keep their order."""
+        delivered = 0
+        for url in urls:
+            key = self.downloader.canonical_id(url)
+            cacheable = self.downloader.is_cacheable(url)
+            cached = self.media_cache.get(key) if cacheable else None
+            if cached and await self._send_cached_media(bot, chat_id, key, cached):
+                delivered += 1
+                continue
+            try:
+                if await self._download_and_send(bot, chat_id, user_id, url, msg, key if cacheable else None):
+                    delivered += 1
+            except Exception as e:
+                errors.append(self._handle_download_error(e, user_id, self.downloader.platform_for(url)))
+        return delivered
+
+    async def _download_and_send(self, bot, chat_id: int, user_id: int, url: str, msg, cache_key: Optional[str]) -> List[Tuple[str, str]]:
+        """Gets a link to the requesting chat, here or on a worker, and returns the resulting file_ids."""
+        if self.config.ROLE != 'front':
+            return await self._fetch_and_send(bot, chat_id, user_id, url, msg, cache_key)
+        media = await self._run_remote_job(chat_id, user_id, url, msg)
+        if media and cache_key:
+            self.media_cache.put(cache_key, media)
+        return media
+
+    async def _fetch_and_send(self, bot, chat_id: int, user_id: int, url: str, msg, cache_key: Optional[str]) -> List[Tuple[str, str]]:
+        """Downloads a link in this process, uploads it to the chat and returns the resulting file_ids."""
+        platform = self.downloader.platform_for(url)
+        caption = f"Downloaded via @{await self._get_bot_username(bot)}"
+        result = None
+        # A job that may stream holds no space up front; if it has to download, it checks the disk itself.
+        reservation = self.storage.reservation(0 if self.config.STREAMING_UPLOADS else self.config.STORAGE_JOB_RESERVE_BYTES)
+        try:
+            result = await self._run_download_job(
+                bot, msg, user_id, platform, 'fetch', url, user_id, chat_id, caption, self.config.STREAMING_UPLOADS,
+                reservation=reservation,
+            )
+            self.storage.resize(reservation, result.downloaded_bytes)
+            self._record_fetch(platform, result)
+            logger.info(f"Fetched {url} for user {user_id} via the '{result.pipeline}' path")
+            media = result.media
+            if not media:
+                await bot.edit_message_text("✅ Download complete! Sending media...", chat_id=msg.chat_id, message_id=msg.message_id)
+                with self.stage_seconds.time(stage='upload', platform=platform):
+                    media = await self._send_media(bot, chat_id, result.files)
+            if media and cache_key:
+                self.media_cache.put(cache_key, media, result.files)
+            return media
         finally:
-            if temp_dir:
-                shutil.rmtree(temp_dir, ignore_errors=True)
+            if result and result.temp_dir:
+                shutil.rmtree(result.temp_dir, ignore_errors=True)
+            self.storage.release(reservation)
+
+    def _session_counts(self, rescan: bool = True) -> Dict[Tuple[str, str], int]:
+        counts: Dict[Tuple[str, str], int] = defaultdict(int)
+        for s in self.sessions.state(rescan):
+            counts[(s['platform'], 'quarantined' if s['quarantined_for'] else 'healthy')] += 1
+        return dict(counts)
+
+    def _session_capacity(self, rescan: bool = True) -> Dict[str, float]:
+        """Effective downloads/second per platform: the summed rates of the sessions jobs can go to."""
+        return {
+            platform: sum(self.limiter.capacity((platform, s.name)) for s in self.sessions.candidates(platform, rescan))
+            for platform in self.sessions.platforms(rescan)
+        }
+
+    def _record_fetch(self, platform: str, result: FetchResult):
+        self.downloads.inc(platform=platform, pipeline=result.pipeline)
+        for stage, seconds in result.timings.items():
+            self.stage_seconds.observe(seconds, stage=stage, platform=platform)
+        if result.downloaded_bytes and result.timings.get('download'):
+            self.download_speed.observe(result.downloaded_bytes / result.timings['download'], platform=platform)
+
+    async def _run_download_job(self, bot, msg, user_id: int, platform: str, method: str, *args,
+                                reservation: Optional[StorageReservation] = None,
+                                on_abandoned: Optional[Callable[[object], None]] = None):
+        """Queues a MediaDownloader method on the scheduler, telling the user their place in the queue."""
+        job, position = self.scheduler.submit(user_id, platform, self.download_call, method, *args,
+                                              reservation=reservation, on_abandoned=on_abandoned)
+        if position and msg:
+            await bot.edit_message_text(
+                f"🕒 Queued (position {position}). Your download will start shortly...",
+                chat_id=msg.chat_id, message_id=msg.message_id
+            )
+        return await job
+
+    async def _run_remote_job(self, chat_id: int, user_id: int, url: str, msg) -> List[Tuple[str, str]]:
+        """Queues a download for the worker processes and waits for the file_ids they sent."""
+        job = {'url': url, 'user_id': user_id, 'chat_id': chat_id, 'message_id': msg.message_id}
+        job_id = await asyncio.to_thread(self.job_queue.push, job)
+        result_key = f"result:{job_id}"
+        deadline = time.monotonic() + 2 * self.config.JOB_VISIBILITY_TIMEOUT_SECONDS
+        delay = 0.1
+        while time.monotonic() < deadline:
+            raw = await asyncio.to_thread(self.job_queue.get_state, result_key)
+            if raw is not None:
+                await asyncio.to_thread(self.job_queue.delete_state, result_key)
+                result = json.loads(raw)
+                if 'error' in result:
+                    raise RemoteJobError(result['error'])
+                return [tuple(item) for item in result['media']]
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 1.0)
+        raise TimeoutError(f"No worker finished download job {job_id}")
+
+    async def _run_queued_job(self, job: dict):
+        """Runs a job taken from the shared queue and publishes its outcome for the front process."""
+        msg = SimpleNamespace(chat_id=job['chat_id'], message_id=job['message_id'])
+        heartbeat = asyncio.create_task(self._job_heartbeat(job['id']))
+        try:
+            media = await self._fetch_and_send(self.application.bot, job['chat_id'], job['user_id'], job['url'], msg, None)
+            result = {'media': media}
+        except Exception as e:
+            logger.error(f"Queued job {job['id']} for user {job['user_id']} failed: {e}", exc_info=True)
+            result = {'error': self._handle_download_error(e, job['user_id'], self.downloader.platform_for(job['url']))}
+        finally:
+            heartbeat.cancel()
+        # The front stops waiting after twice the visibility timeout; a result it never read expires then.
+        await asyncio.to_thread(self.job_queue.set_state, f"result:{job['id']}", json.dumps(result),
+                                2 * self.config.JOB_VISIBILITY_TIMEOUT_SECONDS)
+        await asyncio.to_thread(self.job_queue.ack, job['id'])
+
+    async def _job_heartbeat(self, job_id: str):
+        """Renews the claim on a queued job while this worker runs it, so it isn't handed to another worker."""
+        while True:
+            await asyncio.sleep(self.config.JOB_HEARTBEAT_SECONDS)
+            try:
+                await asyncio.to_thread(self.job_queue.touch, job_id)
+            except Exception as e:
+                logger.warning(f"Heartbeat for download job {job_id} failed: {e}")
+
+    _ERROR_MESSAGES = {
+        'user_limit': "🚦 **Too Many Downloads**\nYou can have up to {max_per_user} downloads at a time. Please wait for them to finish.",
+        'queue_full': "🚦 **Server Busy**\nToo many downloads are queued right now. Please try again in a few minutes.",
+        'storage_full': "💾 **Server Busy**\nThe server is short on disk space right now. Please try again in a few minutes.",
+        'no_video': "🤔 **No Video Found**\nThis link might be for an image-only post, a private account, or an expired story. If it's private, the admin needs to provide a valid `instagram_cookies.txt` file.",
+        'no_media': "❌ **Download Failed**\nCould not retrieve any media from the provided link. The content might be private, deleted, or from an unsupported format.",
+        'bot_check': "🤖 **Bot-Check Failed**\nYouTube is asking to verify that you're not a bot. The admin needs to provide a `youtube_cookies.txt` file to solve this.",
+        'private': "🔒 **Private Content**\nThis content is private and requires a login session to download. The admin needs to provide a cookie file for the specific platform.",
+        'age_restricted': "🔞 **Age-Restricted Content**\nThis video can't be downloaded because it's marked as 18+. The admin needs to provide a logged-in session for the specific platform.",
+        'too_large': "📦 **File Too Large**\nThis video is larger than 50MB and cannot be sent on Telegram.",
+        'rate_limited': "⏳ **Rate Limited**\nThe service is limiting requests. Please try again later.",
+        'network': "🌐 **Network Error**\nCould not reach the site. Please try again in a moment.",
+        'unsupported': "🔗 **Unsupported URL**\nThis type of link is not supported.",
+        'unknown': "❌ **Download Failed**\nAn unknown error occurred.",
+    }
+
+    @staticmethod
+    def classify_error(e: Exception) -> str:
+        """Maps a download failure to an error class, a key of `_ERROR_MESSAGES`."""
+        if isinstance(e, QueueFullError):
+            return 'user_limit' if e.per_user else 'queue_full'
+        if isinstance(e, CircuitOpenError):
+            return 'rate_limited'
+        if isinstance(e, StorageFullError):
+            return 'storage_full'
 
-    def _handle_download_error(self, e: Exception, user_id: int) -> str:
         err_str = str(e).lower()
-        logger.warning(f"DownloadError for user {user_id}: {err_str}")
-        
+        if "no space left on device" in err_str:
+            return 'storage_full'
         if "no video formats found" in err_str:
-            return "🤔 **No Video Found**\nThis link might be for an image-only post, a private account, or an expired story. If it's private, the admin needs to provide a valid `instagram_cookies.txt` file."
-        
+            return 'no_video'
         if "no media files were found" in err_str:
-            return "❌ **Download Failed**\nCould not retrieve any media from the provided link. The content might be private, deleted, or from an unsupported format."
+            return 'no_media'
         if "sign in to confirm" in err_str or "not a bot" in err_str:
-            return "🤖 **Bot-Check Failed**\nYouTube is asking to verify that you're not a bot. The admin needs to provide a `youtube_cookies.txt` file to solve this."
+            return 'bot_check'
         if "login required" in err_str or "private" in err_str:
-            return "🔒 **Private Content**\nThis content is private and requires a login session to download. The admin needs to provide a cookie file for the specific platform."
+            return 'private'
         if "age-restricted" in err_str or "18 years old" in err_str:
-            return "🔞 **Age-Restricted Content**\nThis video can't be downloaded because it's marked as 18+. The admin needs to provide a logged-in session for the specific platform."
+            return 'age_restricted'
         if "file is larger than the 50.00mib limit" in err_str:
-            return "📦 **File Too Large**\nThis video is larger than 50MB and cannot be sent on Telegram."
+            return 'too_large'
         if "429" in err_str or "too many requests" in err_str:
-            return "⏳ **Rate Limited**\nThe service is limiting requests. Please try again later."
+            return 'rate_limited'
         if "unsupported url" in err_str:
-            return "🔗 **Unsupported URL**\nThis type of link is not supported."
-        
-        return "❌ **Download Failed**\nAn unknown error occurred."
+            return 'unsupported'
+        # Transport failures (DNS, refused or dropped connections) and 5xx answers are worth retrying;
+        # a page that couldn't be downloaded because of a 4xx answer is not.
+        if "http error 4" not in err_str and any(s in err_str for s in (
+            "timed out", "connection reset", "connection aborted", "connection refused", "remote end closed",
+            "transporterror", "unable to download webpage", "unable to download video data",
+            "name or service not known", "temporary failure in name resolution", "nodename nor servname",
+            "getaddrinfo failed", "network is unreachable",
+            "http error 500", "http error 502", "http error 503", "http error 504",
+        )):
+            return 'network'
+        return 'unknown'
 
-    async def _send_media(self, update: Update, context: ContextTypes.DEFAULT_TYPE, files: List[str]):
-        bot_username = (await context.bot.get_me()).username
-        caption = f"Downloaded via @{bot_username}"
-        
-        videos = sorted([f for f in files if f.lower().endswith(('.mp4', '.mov', '.webm'))])
-        photos = sorted([f for f in files if f.lower().endswith(('.jpg', '.jpeg', '.png', '.webp'))])
+    def _handle_download_error(self, e: Exception, user_id: int, platform: str = 'other') -> str:
+        if isinstance(e, RemoteJobError):
+            # Already classified and counted by the worker that ran the job.
+            return str(e)
+        error_class = self.classify_error(e)
+        self.download_errors.inc(platform=platform, error=error_class)
+        if not isinstance(e, (QueueFullError, CircuitOpenError, StorageFullError)):
+            logger.warning(f"DownloadError for user {user_id} ({error_class}): {str(e).lower()}")
+        return self._ERROR_MESSAGES[error_class].format(max_per_user=self.config.MAX_DOWNLOADS_PER_USER)
 
-        all_media_paths = photos + videos
+    async def _send_media(self, bot, chat_id: int, files: List[str]) -> List[Tuple[str, str]]:
+        """Uploads downloaded files and returns the (kind, file_id) pairs Telegram assigned to them."""
+        media_files = self._media_files(files)
+        if not media_files:
+            await bot.send_message(chat_id=chat_id, text="🤔 Could not find any supported media in the link.")
+            return []
 
-        if not all_media_paths:
-            await update.message.reply_text("🤔 Could not find any supported media in the link.")
-            return
-
-        if len(all_media_paths) == 1:
-            path = all_media_paths[0]
-            with open(path, 'rb') as file:
-                if path in photos:
-                    await update.message.reply_photo(photo=file, caption=caption)
-                else:
-                    await update.message.reply_video(video=file, caption=caption, supports_streaming=True)
-            return
-
-        media_group = []
         file_handlers = []
         try:
-            first_path = all_media_paths[0]
-            first_file = open(first_path, 'rb')
-            file_handlers.append(first_file)
-            if first_path in photos:
-                media_group.append(InputMediaPhoto(media=first_file, caption=caption))
-            else:
-                media_group.append(InputMediaVideo(media=first_file, caption=caption))
-            
-            for path in all_media_paths[1:]:
+            media = []
+            for kind, path in media_files:
                 file = open(path, 'rb')
                 file_handlers.append(file)
-                if path in photos:
-                    media_group.append(InputMediaPhoto(media=file))
-                else:
-                    media_group.append(InputMediaVideo(media=file))
-
-            for i in range(0, len(media_group), 10):
-                await update.message.reply_media_group(media=media_group[i:i+10])
-
+                media.append((kind, file))
+            return await self._deliver_media(bot, chat_id, media)
         finally:
             for f in file_handlers:
                 f.close()
 
+    @staticmethod
+    def _media_files(files: List[str]) -> List[Tuple[str, str]]:
+        """(kind, path) of the photos and videos among downloaded files, keeping their order."""
+        media = []
+        for path in files:
+            if path.lower().endswith(('.mp4', '.mov', '.webm')):
+                media.append(('video', path))
+            elif path.lower().endswith(('.jpg', '.jpeg', '.png', '.webp')):
+                media.append(('photo', path))
+        return media
+
+    async def _send_cached_media(self, bot, chat_id: int, cache_key: str, entry: CacheEntry) -> bool:
+        """Replies from cached file_ids, falling back to the kept files. Returns False on a cache miss."""
+        try:
+            await self._deliver_media(bot, chat_id, entry.media)
+            return True
+        except TelegramError as e:
+            logger.warning(f"Cached file_ids for {cache_key} were rejected: {e}")
+
+        if entry.files and all(os.path.exists(f) for f in entry.files):
+            try:
+                media = await self._send_media(bot, chat_id, entry.files)
+                self.media_cache.update_media(cache_key, media)
+                return True
+            except TelegramError as e:
+                logger.warning(f"Re-upload of cached files for {cache_key} failed: {e}")
+        self.media_cache.invalidate(cache_key)
+        return False
+
+    async def _deliver_media(self, bot, chat_id: int, media: List[Tuple[str, object]]) -> List[Tuple[str, str]]:
+        """Sends photos/videos given as open files or file_ids, in media groups of at most 10 when there are several."""
+        caption = f"Downloaded via @{await self._get_bot_username(bot)}"
+
+        if len(media) == 1:
+            kind, payload = media[0]
+            if kind == 'photo':
+                message = await bot.send_photo(chat_id=chat_id, photo=payload, caption=caption)
+            else:
+                message = await bot.send_video(chat_id=chat_id, video=payload, caption=caption, supports_streaming=True)
+            return [self._sent_file_id(message)]
+
+        media_group = []
+        for kind, payload in media:
+            item_caption = caption if not media_group else None
+            if kind == 'photo':
+                media_group.append(InputMediaPhoto(media=payload, caption=item_caption))
+            else:
+                media_group.append(InputMediaVideo(media=payload, caption=item_caption))
+
+        # Evenly sized chunks, since a media group needs at least 2 items (11 items go as 6 + 5, not 10 + 1).
+        chunks = -(-len(media_group) // 10)
+        size = -(-len(media_group) // chunks)
+        sent = []
+        for i in range(0, len(media_group), size):
+            messages = await bot.send_media_group(chat_id=chat_id, media=media_group[i:i+size])
+            sent.extend(self._sent_file_id(m) for m in messages)
+        return sent
+
+    @staticmethod
+    def _sent_file_id(message) -> Tuple[str, str]:
+        if message.photo:
+            return 'photo', message.photo[-1].file_id
+        video = message.video or message.animation or message.document
+        return 'video', video.file_id
+
+    async def stats_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if update.effective_user.id != self.config.ADMIN_ID:
+            return
+        cache = self.media_cache.stats()
+        lookups = cache['hits'] + cache['misses']
+        hit_rate = (cache['hits'] / lookups * 100) if lookups else 0.0
+        queue = self.scheduler.stats()
+        storage = self.storage.stats()
+        pipeline_counts: Dict[str, int] = defaultdict(int)
+        for (_, pipeline), count in self.downloads.values().items():
+            pipeline_counts[pipeline] += int(count)
+        pipelines = ", ".join(f"{path} {count}" for path, count in sorted(pipeline_counts.items()))
+        throttled = ", ".join(
+            f"{platform} (`{session}`) {state['rate']:.2f}/s" + (f", open {state['open_for']:.0f}s" if state['open_for'] else "")
+            for (platform, session), state in sorted(self.limiter.state().items()) if state['rate'] < state['max_rate']
+        )
+        capacity = self._session_capacity()
+        session_counts = self._session_counts()
+        sessions = ", ".join(
+            f"{platform} {session_counts.get((platform, 'healthy'), 0)}/"
+            f"{session_counts.get((platform, 'healthy'), 0) + session_counts.get((platform, 'quarantined'), 0)} "
+            f"({capacity[platform]:.2f}/s)"
+            for platform in sorted(capacity)
+        )
+        await update.message.reply_text(
+            "📊 **Bot Stats**\n\n"
+            f"Media cache: {cache['entries']} entries, {cache['bytes'] / 1048576:.1f} MB on disk\n"
+            f"Cache hits/misses: {cache['hits']}/{cache['misses']} ({hit_rate:.1f}% hit rate)\n"
+            f"Downloads: {queue['active']} active, {queue['queued']} queued, {queue['rejected']} rejected\n"
+            f"Queue wait: {queue['wait_avg']:.1f}s avg, {queue['wait_p95']:.1f}s p95, {queue['retried']} retried\n"
+            f"Temp storage: {storage['reserved'] / 1048576:.0f}/{storage['budget'] / 1048576:.0f} MB reserved, "
+            f"{storage['free'] / 1073741824:.1f} GB free, {queue['storage_waiting']} waiting, {storage['rejected']} refused\n"
+            f"Throttled: {throttled or 'none'}\n"
+            f"Cookie sessions (healthy/total): {sessions}\n"
+            f"Media paths: {pipelines or 'none yet'}"
+            + (f"\nWorker queue: {await asyncio.to_thread(self.job_queue.depth)} waiting" if self.job_queue else ""),
+            parse_mode='Markdown'
+        )
+
+    async def sessions_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Lists the cookie sessions; `/sessions drop <platform> <file>` removes one."""
+        if update.effective_user.id != self.config.ADMIN_ID:
+            return
+        args = context.args or []
+        if args[:1] == ['drop']:
+            if len(args) != 3:
+                await update.message.reply_text("Usage: /sessions drop <platform> <file name>")
+                return
+            platform, name = args[1].lower(), args[2]
+            if not self.sessions.path_for(platform, name):
+                await update.message.reply_text(
+                    "❌ Unknown platform or file name. Platforms are instagram, youtube and facebook; "
+                    "session files are plain .txt names."
+                )
+                return
+            if not self.sessions.remove(platform, name):
+                await update.message.reply_text(f"❌ No {platform} cookie session named {name}.")
+                return
+            self.downloader.invalidate(platform)
+            self.limiter.reset(platform, name)
+            if self.job_queue:
+                await asyncio.to_thread(self.job_queue.set_state, self._cookie_state_key(platform, name), "")
+            logger.info(f"{platform} cookie session {name} removed by admin.")
+            await update.message.reply_text(f"🗑 Removed {platform} cookie session {name}.")
+            return
+
+        lines = []
+        limits = self.limiter.state()
+        for s in self.sessions.state():
+            limit = limits.get((s['platform'], s['session']))
+            status = f"quarantined {s['quarantined_for'] / 60:.0f}m" if s['quarantined_for'] else "healthy"
+            if limit and limit['open_for']:
+                status += f", cooling down {limit['open_for']:.0f}s"
+            rate = limit['rate'] if limit else self.limiter.capacity((s['platform'], s['session']))
+            lines.append(
+                f"{s['platform']} / {s['session']}: {status}, {rate:.2f}/s, {s['in_flight']} running, "
+                f"{s['uses']} jobs, {s['error_rate']:.0%} throttled recently"
+            )
+        capacity = ", ".join(f"{platform} {rate:.2f}/s" for platform, rate in sorted(self._session_capacity().items()))
+        await update.message.reply_text(
+            "🍪 Cookie sessions\n\n" + ("\n".join(lines) or "No valid cookie sessions.")
+            + f"\n\nCapacity: {capacity}"
+        )
+
+    def _cookie_state_key(self, platform: str, name: str) -> str:
+        """Shared-state key a cookie session is published under for the other processes."""
+        return f"cookies:{platform}" if self.sessions.is_primary(platform, name) else f"cookies:{platform}/{name}"
+
     async def handle_cookie_file(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Stores an uploaded cookie file as a session of its platform.
+
+        A file named like the configured one (e.g. `instagram_cookies.txt`) replaces it; any other
+        name, e.g. `instagram_account2.txt`, adds or replaces that session in the pool.
+        """
         if update.effective_user.id != self.config.ADMIN_ID:
             return
         
@@ -383,35 +2875,51 @@ class TelegramBot:
             await update.message.reply_text("Please upload the cookie file as a `.txt` document.")
             return
 
-        file_name = doc.file_name.lower()
-        target_path = None
+        file_name = re.sub(r'[^a-z0-9_.-]+', '_', os.path.basename(doc.file_name.lower()))
         platform_name = "Unknown"
 
         if "instagram" in file_name:
-            target_path = self.config.INSTAGRAM_COOKIES_FILE
             platform_name = "Instagram"
         elif "youtube" in file_name:
-            target_path = self.config.YOUTUBE_COOKIES_FILE
             platform_name = "YouTube"
         elif "facebook" in file_name:
-            target_path = self.config.FACEBOOK_COOKIES_FILE
             platform_name = "Facebook"
         else:
             await update.message.reply_text(
                 "❌ **Unknown Cookie File**\n"
-                "Please name your file `instagram_cookies.txt`, `youtube_cookies.txt`, or `facebook_cookies.txt`."
+                "Please name your file `instagram_cookies.txt`, `youtube_cookies.txt`, or `facebook_cookies.txt`, "
+                "or e.g. `instagram_account2.txt` to add another session."
             )
             return
 
+        platform = platform_name.lower()
+        primary = self.sessions.is_primary(platform, file_name)
+        target_path = self.sessions.path_for(platform, None if primary else file_name)
+        if not target_path:
+            await update.message.reply_text("❌ Please use a plain file name such as `instagram_account2.txt`.")
+            return
+        # Validated before it replaces anything, so a bad upload can't knock out a working session.
+        upload_path = f"{target_path}.upload"
         try:
+            os.makedirs(os.path.dirname(target_path) or '.', exist_ok=True)
             file = await context.bot.get_file(doc.file_id)
-            await file.download_to_drive(target_path)
-            
-            if self.downloader._validate_cookies(target_path):
-                await update.message.reply_text(f"✅ **{platform_name} cookies updated successfully!**")
-                logger.info(f"{platform_name} cookies file updated by admin.")
+            await file.download_to_drive(upload_path)
+
+            if self.downloader._validate_cookies(upload_path):
+                os.replace(upload_path, target_path)
+                self.downloader.invalidate(platform)
+                self.limiter.reset(platform, file_name)
+                self.sessions.reset(platform, file_name)
+                if self.job_queue:
+                    with open(target_path, encoding='utf-8', errors='replace') as f:
+                        await asyncio.to_thread(self.job_queue.set_state, self._cookie_state_key(platform, file_name), f.read())
+                await update.message.reply_text(
+                    f"✅ **{platform_name} cookies updated successfully!**\n"
+                    f"Session {file_name}; {len(self.sessions.sessions(platform))} {platform_name} sessions in the pool."
+                )
+                logger.info(f"{platform_name} cookie session {file_name} updated by admin.")
             else:
-                os.remove(target_path)
+                os.remove(upload_path)
                 await update.message.reply_text(f"❌ **Invalid {platform_name} Cookies File**.")
         except Exception as e:
             logger.error(f"Failed to update {platform_name} cookie file: {e}")
@@ -420,15 +2928,242 @@ class TelegramBot:
     async def error_handler(self, update: object, context: ContextTypes.DEFAULT_TYPE):
         logger.error(f"Update {update} caused error: {context.error}", exc_info=context.error)
 
+    async def health_probe(self, request: Request) -> Response:
+        return Response("ok")
+
+    async def metrics_endpoint(self, request: Request) -> Response:
+        if self.job_queue:
+            # The only gauge that blocks (a database or Redis round trip); everything else reads in-memory state
+            self._shared_queue_depth = await asyncio.to_thread(self.job_queue.depth)
+        body = self.metrics.render()
+        return Response(body, content_type=Metrics.CONTENT_TYPE)
+
+    async def readiness_probe(self, request: Request) -> Response:
+        if self.ready and self.application.running:
+            return Response("ready")
+        return Response("not ready", status=503)
+
+    async def webhook_update(self, request: Request) -> Response:
+        """Receives an update pushed by Telegram and hands it to the application's update queue."""
+        token = request.headers.get('x-telegram-bot-api-secret-token', '')
+        if not hmac.compare_digest(token, self.webhook_secret):
+            return Response("Forbidden", status=403)
+        try:
+            update = Update.de_json(json.loads(request.body), self.application.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning(f"Rejected malformed webhook update: {e}")
+            return Response("Bad Request", status=400)
+        await self.application.update_queue.put(update)
+        return Response(status=200)
+
+    @staticmethod
+    def _stop_on_signals(stop: Optional[asyncio.Event]) -> asyncio.Event:
+        stop = stop or asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except (NotImplementedError, RuntimeError):
+                pass
+        return stop
+
+    async def run_webhook(self, stop: Optional[asyncio.Event] = None):
+        """Runs the bot with Telegram pushing updates to the built-in HTTP server until stopped."""
+        stop = self._stop_on_signals(stop)
+        async with self.application:
+            try:
+                await self.post_init(self.application)
+                await self.application.start()
+                await self.application.bot.set_webhook(
+                    url=f"{self.config.WEBHOOK_URL.rstrip('/')}{self.config.WEBHOOK_PATH}",
+                    secret_token=self.webhook_secret,
+                    max_connections=self.config.WEBHOOK_MAX_CONNECTIONS,
+                    allowed_updates=Update.ALL_TYPES,
+                )
+                logger.info("Webhook registered, receiving updates.")
+                await stop.wait()
+            finally:
+                self.ready = False
+                if self.application.running:
+                    await self.application.stop()
+                await self.post_shutdown(self.application)
+
+    async def run_worker(self, stop: Optional[asyncio.Event] = None):
+        """Runs a download worker: takes jobs queued by the front process and uploads the results."""
+        stop = self._stop_on_signals(stop)
+        slots = asyncio.Semaphore(self.config.WORKER_CONCURRENCY)
+        running = set()
+
+        def finished(task: asyncio.Task):
+            running.discard(task)
+            slots.release()
+
+        async with self.application:
+            try:
+                self.startup.mark('connect')
+                self.bot_username = self.application.bot.username
+                if self.config.WORKER_HTTP_PORT:
+                    await self.http_server.start()
+                self.ready = True
+                self.startup.mark('http')
+                self._prewarm = self._start_prewarm()
+                self._background_tasks.append(asyncio.create_task(self._startup_report()))
+                self._background_tasks.append(asyncio.create_task(self._storage_sweep_loop()))
+                self._background_tasks.append(asyncio.create_task(self._state_sync_loop()))
+                logger.info(f"Download worker consuming jobs from {self.config.JOB_QUEUE_URL}")
+                while not stop.is_set():
+                    await slots.acquire()
+                    job = await asyncio.to_thread(self.job_queue.pop, 1.0)
+                    if job is None:
+                        slots.release()
+                        continue
+                    task = asyncio.create_task(self._run_queued_job(job))
+                    running.add(task)
+                    task.add_done_callback(finished)
+                # Let claimed jobs finish; anything interrupted is requeued after the visibility timeout.
+                if running:
+                    await asyncio.wait(running)
+            finally:
+                await self.post_shutdown(self.application)
+
+    async def _state_sync_loop(self):
+        """Periodically pulls shared state written by the other processes."""
+        while True:
+            try:
+                await asyncio.to_thread(self._sync_state)
+            except Exception as e:
+                logger.error(f"Shared state sync failed: {e}")
+            await asyncio.sleep(self.config.STATE_SYNC_INTERVAL_SECONDS)
+
+    async def _storage_sweep_loop(self):
+        """Removes download folders left behind by killed processes, at startup and then periodically."""
+        # A standalone bot is alone in DOWNLOAD_DIR, so anything from before it started is an orphan;
+        # otherwise a worker on the same host may still be using a recent folder.
+        before = self.storage.started if self.config.ROLE == 'standalone' else None
+        while True:
+            try:
+                removed = await asyncio.to_thread(self.storage.sweep, before)
+                if removed:
+                    self.storage_swept.inc(removed)
+                    logger.warning(f"Removed {removed} orphaned download folders.")
+            except Exception as e:
+                logger.error(f"Sweeping the download directory failed: {e}")
+            before = None
+            await asyncio.sleep(self.config.STORAGE_SWEEP_INTERVAL_SECONDS)
+
+    def _sync_state(self):
+        """Merges access grants and installs cookie files changed since the last sync."""
+        # Overlap the previous window a little so clock skew between hosts can't drop an update.
+        since = max(0.0, self._state_synced_at - self.config.STATE_SYNC_INTERVAL_SECONDS)
+        self._state_synced_at = time.time()
+        if self.config.ROLE == 'front':
+            grants = self.job_queue.changed_state('access:', since)
+            if grants:
+                self.db.merge_grants({int(key.split(':', 1)[1]): int(value) for key, value in grants.items()})
+        for key, content in self.job_queue.changed_state('cookies:', since).items():
+            platform, _, name = key.split(':', 1)[1].partition('/')
+            self._install_cookies(platform, name or None, content)
+        if self.config.ROLE == 'worker':
+            requeued = self.job_queue.requeue_stale(self.config.JOB_VISIBILITY_TIMEOUT_SECONDS)
+            if requeued:
+                logger.warning(f"Requeued {requeued} download jobs abandoned by their worker.")
+            self.job_queue.expire_state()
+
+    def _install_cookies(self, platform: str, name: Optional[str], content: str):
+        """Writes a cookie session shared by another process, unless the local copy already matches.
+
+        `name` is None for the platform's configured cookie file; empty content removes the session.
+        """
+        path = self.sessions.path_for(platform, name)
+        if not path:
+            logger.warning(f"Ignored shared cookie session {platform}/{name}: not a valid session location.")
+            return
+        try:
+            with open(path, encoding='utf-8', errors='replace') as f:
+                if f.read() == content:
+                    return
+        except OSError:
+            if not content:
+                return
+        if content:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+                f.write(content)
+            os.replace(f"{path}.tmp", path)
+        else:
+            os.remove(path)
+        session = os.path.basename(path)
+        self.downloader.invalidate(platform)
+        self.limiter.reset(platform, session)
+        self.sessions.reset(platform, session)
+        logger.info(f"{'Installed' if content else 'Removed'} shared {platform} cookie session {session}.")
+
     async def post_init(self, application: Application):
-        """Actions to run after initialization but before polling starts."""
-        await self._notify_admin("🔔 Bot is starting up...")
-        if not self.downloader._validate_cookies(self.config.INSTAGRAM_COOKIES_FILE):
-            await self._notify_admin("⚠️ **Warning:** `instagram_cookies.txt` is missing or invalid.")
-        if not self.downloader._validate_cookies(self.config.YOUTUBE_COOKIES_FILE):
-            await self._notify_admin("⚠️ **Warning:** `youtube_cookies.txt` is missing or invalid.")
-        if not self.downloader._validate_cookies(self.config.FACEBOOK_COOKIES_FILE):
-            await self._notify_admin("⚠️ **Warning:** `facebook_cookies.txt` is missing or invalid.")
+        """Actions to run after initialization but before updates are received.
+
+        Only what serving needs happens here; the warm-up and the startup report run in the background.
+        """
+        self.startup.mark('connect')
+        await self.http_server.start()
+        self.ready = True
+        # initialize() has already fetched the bot's profile, so this needs no extra API call.
+        self.bot_username = application.bot.username
+        self._prewarm = self._start_prewarm()
+        self._background_tasks.append(asyncio.create_task(self._storage_sweep_loop()))
+        self._background_tasks.append(asyncio.create_task(self._generate_short_url(application.bot)))
+        self._background_tasks.append(asyncio.create_task(self.short_links.refresh_loop()))
+        if self.job_queue:
+            self._background_tasks.append(asyncio.create_task(self._state_sync_loop()))
+        self._background_tasks.append(asyncio.create_task(self._startup_report()))
+        self.startup.mark('http')
+
+    def _start_prewarm(self) -> Optional[asyncio.Future]:
+        """Warms the downloader with each platform's preferred cookie session on a thread of its own.
+
+        Not on the download executor: the scheduler doesn't count the warm-up, so the first download
+        could wait behind it for a worker the scheduler believes is free.
+        """
+        # Instances built in this process would not reach the download worker processes.
+        if not self.config.PREWARM_DOWNLOADER or isinstance(self.download_executor, ProcessPoolExecutor):
+            return None
+        sessions = {platform: self.sessions.candidates(platform)[0].path for platform in ('instagram', 'youtube', 'facebook')}
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prewarm")
+        warmup = asyncio.get_running_loop().run_in_executor(executor, self.downloader.prewarm, sessions)
+        # The thread exits once the warm-up is done.
+        executor.shutdown(wait=False)
+        return warmup
+
+    async def _startup_report(self):
+        """Checks the cookie sessions once the warm-up is done and sends the admin a single startup message."""
+        lines = ["🔔 Bot is starting up..."]
+        for platform in ('instagram', 'youtube', 'facebook'):
+            if not self.sessions.sessions(platform):
+                lines.append(
+                    f"⚠️ **Warning:** `{os.path.basename(self.sessions.path_for(platform))}` is missing or invalid "
+                    f"and there are no other {platform} cookie sessions."
+                )
+        if self._prewarm:
+            try:
+                self.startup.record('warmup', await self._prewarm)
+            except Exception as e:
+                logger.warning(f"Downloader warm-up failed: {e}")
+        summary = f"Serving after {self.startup.elapsed:.2f}s ({self.startup.summary()})."
+        logger.info(summary)
+        if self.config.ROLE != 'worker':
+            lines.append(f"⏱ `{summary}`")
+            await self._notify_admin("\n\n".join(lines))
+
+    async def post_shutdown(self, application: Application):
+        """Releases workers and connections once the application has stopped."""
+        self.ready = False
+        for task in self._background_tasks:
+            task.cancel()
+        await self.http_server.stop()
+        self.scheduler.shutdown()
+        await self.http_client.aclose()
+        if self.job_queue:
+            self.job_queue.close()
+        self.db.close()
 
     async def _notify_admin(self, text: str):
         if not self.config.ADMIN_ID:
@@ -443,20 +3178,29 @@ class TelegramBot:
 
 
 def main():
-    """The main entry point for the bot."""
+    """The main entry point for the bot. `python bot.py worker` starts a download worker."""
+    if len(sys.argv) > 1:
+        Config.ROLE = sys.argv[1]
+    startup = PhaseTimer(_IMPORTS_STARTED)
+    startup.mark('imports')
     Config.validate()
-    bot = TelegramBot(Config())
+    bot = TelegramBot(Config(), startup)
 
     bot.application.post_init = bot.post_init
+    bot.application.post_shutdown = bot.post_shutdown
 
     logger.info("All-in-One Media Downloader Bot is now running.")
     
-    bot.application.run_polling()
+    if Config.ROLE == 'worker':
+        asyncio.run(bot.run_worker())
+    elif Config.UPDATE_MODE == 'webhook':
+        asyncio.run(bot.run_webhook())
+    else:
+        bot.application.run_polling()
 
 
 if __name__ == "__main__":
     try:
-        keep_alive()
         main()
     except (KeyboardInterrupt, SystemExit):
         logger.info("Bot shutdown initiated.")
@@ -0,0 +1,268 @@
+"""Offline stand-in for the Telegram Bot API, plus a webhook load generator.
+
+Run `python fake_telegram.py` to start the bot in webhook mode against a local fake Bot API
+and flood its webhook with synthetic updates, or `python fake_telegram.py --serve-only` to
+just serve the fake API (point Config.TELEGRAM_API_URL at it).
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from collections import Counter
+from email.parser import BytesParser
+from typing import Callable, Dict, List, Optional
+from urllib.parse import parse_qsl
+
+from keep_alive import HTTPServer, Request, Response
+
+logger = logging.getLogger(__name__)
+
+
+class FakeBotAPI:
+    """Answers Bot API calls with canned but well-formed results and counts them per method."""
+    BOT_USER = {'id': 1000000001, 'is_bot': True, 'first_name': 'Fake Bot', 'username': 'fake_downloader_bot',
+                'can_join_groups': True, 'can_read_all_group_messages': False, 'supports_inline_queries': False}
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0,
+                 on_call: Optional[Callable[[str, Dict[str, object]], None]] = None):
+        self.latency = latency
+        # Called with (method, params) for every request, e.g. to timestamp deliveries
+        self.on_call = on_call
+        self.calls: Counter = Counter()
+        self._ids = itertools.count(1)
+        self.server = HTTPServer(host, port)
+        # Media uploads go up to the Bot API's 50 MB limit
+        self.server.MAX_BODY_BYTES = 64 * 1024 * 1024
+        self.server.fallback(self._handle)
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.server.host}:{self.server.port}"
+
+    async def start(self):
+        await self.server.start()
+
+    async def stop(self):
+        await self.server.stop()
+
+    async def _handle(self, request: Request) -> Response:
+        # Paths look like /bot<token>/<method>
+        method = request.path.rsplit('/', 1)[-1]
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        params = self._parse_params(request)
+        if self.on_call:
+            self.on_call(method, params)
+        result = self._result(method, params)
+        return Response(json.dumps({'ok': True, 'result': result}), content_type='application/json')
+
+    @staticmethod
+    def _parse_params(request: Request) -> Dict[str, object]:
+        content_type = request.headers.get('content-type', '')
+        if content_type.startswith('multipart/form-data'):
+            message = BytesParser().parsebytes(f"Content-Type: {content_type}\r\n\r\n".encode() + request.body)
+            raw = {part.get_param('name', header='content-disposition'): part.get_payload(decode=True)
+                   for part in message.get_payload() if not part.get_filename()}
+            raw = {k: v.decode(errors='replace') for k, v in raw.items() if k}
+        elif content_type.startswith('application/json'):
+            return json.loads(request.body or b'{}')
+        else:
+            raw = dict(parse_qsl(request.body.decode()))
+        params = {}
+        for key, value in raw.items():
+            # python-telegram-bot JSON-encodes non-string values in form fields.
+            try:
+                params[key] = json.loads(value)
+            except ValueError:
+                params[key] = value
+        return params
+
+    def _message(self, params: Dict[str, object], **content) -> dict:
+        chat_id = params.get('chat_id', 0)
+        return {
+            'message_id': next(self._ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': self.BOT_USER,
+            **content,
+        }
+
+    def _file(self, kind: str) -> dict:
+        file_id = f"fake-{kind}-{next(self._ids)}"
+        return {'file_id': file_id, 'file_unique_id': file_id, 'width': 720, 'height': 1280, 'file_size': 1024}
+
+    def _result(self, method: str, params: Dict[str, object]):
+        if method == 'getMe':
+            return self.BOT_USER
+        if method in ('sendMessage', 'editMessageText'):
+            return self._message(params, text=params.get('text', ''))
+        if method == 'sendPhoto':
+            return self._message(params, photo=[self._file('photo')])
+        if method == 'sendVideo':
+            return self._message(params, video={**self._file('video'), 'duration': 10})
+        if method == 'sendMediaGroup':
+            media = params.get('media') or []
+            return [
+                self._message(params, photo=[self._file('photo')]) if item.get('type') == 'photo'
+                else self._message(params, video={**self._file('video'), 'duration': 10})
+                for item in media
+            ]
+        if method == 'getUpdates':
+            return []
+        if method == 'getWebhookInfo':
+            return {'url': '', 'has_custom_certificate': False, 'pending_update_count': 0}
+        return True
+
+
+def make_update(update_id: int, user_id: int, text: str) -> dict:
+    message = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': {'id': user_id, 'type': 'private'},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': f"User{user_id}"},
+        'text': text,
+    }
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    return {'update_id': update_id, 'message': message}
+
+
+async def flood_webhook(host: str, port: int, path: str, secret: str, updates: List[dict],
+                        concurrency: int) -> Dict[str, float]:
+    """POSTs the updates over `concurrency` keep-alive connections; returns ingestion stats."""
+    pending = iter(updates)
+    latencies: List[float] = []
+    failures = 0
+
+    async def connection():
+        nonlocal failures
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            for update in pending:
+                body = json.dumps(update).encode()
+                head = (
+                    f"POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                    f"X-Telegram-Bot-Api-Secret-Token: {secret}\r\nContent-Length: {len(body)}\r\n\r\n"
+                )
+                started = time.perf_counter()
+                writer.write(head.encode() + body)
+                await writer.drain()
+                status_line = await reader.readline()
+                length = 0
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b""):
+                        break
+                    if line.lower().startswith(b"content-length:"):
+                        length = int(line.split(b":", 1)[1])
+                if length:
+                    await reader.readexactly(length)
+                latencies.append(time.perf_counter() - started)
+                if b" 200 " not in status_line:
+                    failures += 1
+        finally:
+            writer.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(connection() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'updates': len(updates),
+        'failures': failures,
+        'seconds': elapsed,
+        'updates_per_second': len(updates) / elapsed if elapsed else 0.0,
+        'p50_ms': latencies[len(latencies) // 2] * 1000 if latencies else 0.0,
+        'p99_ms': latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0.0,
+    }
+
+
+async def run_load_test(total: int, concurrency: int, users: int, latency: float, timeout: float) -> Dict[str, float]:
+    """Starts the real bot in webhook mode against a FakeBotAPI and floods it with text updates."""
+    import bot as bot_module
+    Config = bot_module.Config
+
+    api = FakeBotAPI(latency=latency)
+    await api.start()
+
+    # Everything the bot writes or sweeps stays in here, away from a real bot on the same host.
+    work_dir = tempfile.mkdtemp(prefix="fake_telegram_")
+    Config.TELEGRAM_API_URL = api.url
+    Config.UPDATE_MODE = 'webhook'
+    Config.WEBHOOK_URL = 'http://127.0.0.1'
+    Config.HTTP_HOST = '127.0.0.1'
+    Config.HTTP_PORT = 0
+    Config.SHORTENER_TOKEN = "" # Keep the access links offline
+    Config.ADMIN_ID = 0 # No startup message to count as a reply
+    Config.DB_FILE = os.path.join(work_dir, 'users.db')
+    Config.DOWNLOAD_DIR = os.path.join(work_dir, 'downloads')
+    Config.STORAGE_RAM_DIR = ""
+    Config.MEDIA_CACHE_DIR = os.path.join(work_dir, 'media_cache')
+    Config.COOKIE_SESSIONS_DIR = os.path.join(work_dir, 'cookie_sessions')
+
+    telegram_bot = bot_module.TelegramBot(Config())
+    stop = asyncio.Event()
+    runner = asyncio.create_task(telegram_bot.run_webhook(stop))
+    while not (telegram_bot.ready and telegram_bot.application.running):
+        if runner.done():
+            runner.result()
+        await asyncio.sleep(0.05)
+
+    texts = ["hello", "/start", "not a link", "https://example.com/unsupported"]
+    updates = [make_update(i, 10_000 + i % users, texts[i % len(texts)]) for i in range(1, total + 1)]
+    calls_before = sum(api.calls.values())
+    stats = await flood_webhook('127.0.0.1', telegram_bot.http_server.port, Config.WEBHOOK_PATH,
+                                telegram_bot.webhook_secret, updates, concurrency)
+
+    # Every synthetic update is answered with exactly one Bot API call.
+    started = time.perf_counter()
+    while sum(api.calls.values()) - calls_before < total and time.perf_counter() - started < timeout:
+        await asyncio.sleep(0.05)
+    processed = sum(api.calls.values()) - calls_before
+    stats['processed'] = processed
+    stats['processed_per_second'] = processed / (stats['seconds'] + time.perf_counter() - started)
+
+    stop.set()
+    await runner
+    await api.stop()
+    shutil.rmtree(work_dir, ignore_errors=True)
+    return stats
+
+
+async def serve_forever(host: str, port: int, latency: float):
+    api = FakeBotAPI(host, port, latency)
+    await api.start()
+    logger.info(f"Fake Bot API serving on {api.url}")
+    await asyncio.Event().wait()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--updates', type=int, default=20000, help="number of synthetic updates to send")
+    parser.add_argument('--concurrency', type=int, default=64, help="parallel webhook connections")
+    parser.add_argument('--users', type=int, default=500, help="distinct synthetic user ids")
+    parser.add_argument('--api-latency-ms', type=float, default=0.0, help="delay added to every fake Bot API call")
+    parser.add_argument('--timeout', type=float, default=60.0, help="seconds to wait for processing to finish")
+    parser.add_argument('--serve-only', action='store_true', help="only run the fake Bot API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.WARNING)
+    if args.serve_only:
+        logging.getLogger(__name__).setLevel(logging.INFO)
+        asyncio.run(serve_forever(args.host, args.port, args.api_latency_ms / 1000))
+        return
+    stats = asyncio.run(run_load_test(args.updates, args.concurrency, args.users,
+                                      args.api_latency_ms / 1000, args.timeout))
+    print(json.dumps(stats, indent=2))
+
+
+if __name__ == "__main__":
+    main()
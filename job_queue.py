@@ -0,0 +1,303 @@
+"""Shared download job queue and key/value state for running front and worker processes apart.
+
+Two backends are provided: SQLite for processes on one host (or a shared volume), and a
+Redis-compatible backend for several hosts. Both are synchronous; call them from a thread.
+"""
+import json
+import logging
+import math
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueue(ABC):
+    """Interface shared by the queue backends.
+
+    Popped jobs stay claimed until acknowledged, and their worker calls `touch` while it runs
+    them; jobs not touched within the visibility timeout (e.g. because their worker died) can
+    be put back with `requeue_stale`.
+    """
+    @abstractmethod
+    def push(self, job: dict) -> str:
+        ...
+
+    @abstractmethod
+    def pop(self, timeout: float) -> Optional[dict]:
+        """Claims the oldest job, waiting up to `timeout` seconds. The job dict carries its 'id'."""
+
+    @abstractmethod
+    def touch(self, job_id: str):
+        """Renews the claim on a job that is still being worked on."""
+
+    @abstractmethod
+    def ack(self, job_id: str):
+        ...
+
+    @abstractmethod
+    def requeue_stale(self, older_than: float) -> int:
+        """Puts back jobs whose claim wasn't renewed for `older_than` seconds; returns how many."""
+
+    @abstractmethod
+    def depth(self) -> int:
+        ...
+
+    @abstractmethod
+    def set_state(self, key: str, value: str, ttl: Optional[float] = None):
+        """Writes a key; one with a `ttl` is removed by `expire_state` that many seconds later."""
+
+    @abstractmethod
+    def get_state(self, key: str) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    def delete_state(self, key: str):
+        ...
+
+    @abstractmethod
+    def changed_state(self, prefix: str, since: float) -> Dict[str, str]:
+        """Returns the keys under `prefix` written after the `since` timestamp."""
+
+    @abstractmethod
+    def expire_state(self) -> int:
+        """Removes the keys whose ttl has passed; returns how many."""
+
+    def close(self):
+        pass
+
+
+class SQLiteJobQueue(JobQueue):
+    """Job queue and state in a SQLite file (WAL mode), shared by processes on the same host."""
+    POLL_INTERVAL = 0.2
+
+    def __init__(self, path: str):
+        self._path = path
+        self._local = threading.local()
+        # Every thread's connection, so close() can reach the ones it didn't open
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        conn = self._conn()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                payload TEXT NOT NULL,
+                claimed_at REAL
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS state (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                expires_at REAL
+            )
+        ''')
+        if 'expires_at' not in [row[1] for row in conn.execute("PRAGMA table_info(state)")]:
+            # Queue files from before state keys could expire
+            conn.execute("ALTER TABLE state ADD COLUMN expires_at REAL")
+        conn.execute("CREATE INDEX IF NOT EXISTS state_updated ON state (updated_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS state_expires ON state (expires_at)")
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread; sqlite3 connections must not be shared across threads.
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # check_same_thread is off only so close() may run elsewhere; each connection is still used by one thread.
+            conn = sqlite3.connect(self._path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def push(self, job: dict) -> str:
+        cursor = self._conn().execute("INSERT INTO jobs (payload) VALUES (?)", (json.dumps(job),))
+        return str(cursor.lastrowid)
+
+    def pop(self, timeout: float) -> Optional[dict]:
+        conn = self._conn()
+        deadline = time.monotonic() + timeout
+        while True:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT id, payload FROM jobs WHERE claimed_at IS NULL ORDER BY id LIMIT 1"
+                ).fetchone()
+                if row:
+                    conn.execute("UPDATE jobs SET claimed_at = ? WHERE id = ?", (time.time(), row[0]))
+            finally:
+                conn.execute("COMMIT")
+            if row:
+                return {**json.loads(row[1]), 'id': str(row[0])}
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(self.POLL_INTERVAL)
+
+    def touch(self, job_id: str):
+        self._conn().execute(
+            "UPDATE jobs SET claimed_at = ? WHERE id = ? AND claimed_at IS NOT NULL", (time.time(), int(job_id))
+        )
+
+    def ack(self, job_id: str):
+        self._conn().execute("DELETE FROM jobs WHERE id = ?", (int(job_id),))
+
+    def requeue_stale(self, older_than: float) -> int:
+        cursor = self._conn().execute(
+            "UPDATE jobs SET claimed_at = NULL WHERE claimed_at < ?", (time.time() - older_than,)
+        )
+        return cursor.rowcount
+
+    def depth(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM jobs WHERE claimed_at IS NULL").fetchone()[0]
+
+    def set_state(self, key: str, value: str, ttl: Optional[float] = None):
+        now = time.time()
+        self._conn().execute(
+            "REPLACE INTO state (key, value, updated_at, expires_at) VALUES (?, ?, ?, ?)",
+            (key, value, now, now + ttl if ttl is not None else None)
+        )
+
+    def get_state(self, key: str) -> Optional[str]:
+        row = self._conn().execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def delete_state(self, key: str):
+        self._conn().execute("DELETE FROM state WHERE key = ?", (key,))
+
+    def changed_state(self, prefix: str, since: float) -> Dict[str, str]:
+        rows = self._conn().execute(
+            "SELECT key, value FROM state WHERE updated_at > ? AND substr(key, 1, ?) = ?",
+            (since, len(prefix), prefix)
+        ).fetchall()
+        return dict(rows)
+
+    def expire_state(self) -> int:
+        return self._conn().execute("DELETE FROM state WHERE expires_at <= ?", (time.time(),)).rowcount
+
+    def close(self):
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local.conn = None
+
+
+class RedisJobQueue(JobQueue):
+    """Job queue and state in Redis, for workers on several hosts.
+
+    Works with any redis-py compatible client, so a local stand-in such as
+    `fakeredis.FakeRedis()` can replace the server in tests.
+    """
+    def __init__(self, client, namespace: str = 'bot'):
+        self._redis = client
+        self._queue = f"{namespace}:queue"
+        self._processing = f"{namespace}:processing"
+        self._jobs = f"{namespace}:jobs"
+        self._claims = f"{namespace}:claims"
+        self._ids = f"{namespace}:job_ids"
+        self._state = f"{namespace}:state"
+        self._state_updated = f"{namespace}:state_updated"
+        self._state_expires = f"{namespace}:state_expires"
+
+    @classmethod
+    def from_url(cls, url: str, namespace: str = 'bot') -> 'RedisJobQueue':
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("The 'redis' package is required for a redis:// JOB_QUEUE_URL (pip install redis).") from e
+        return cls(redis.Redis.from_url(url), namespace)
+
+    @staticmethod
+    def _text(value) -> Optional[str]:
+        return value.decode() if isinstance(value, bytes) else value
+
+    def push(self, job: dict) -> str:
+        job_id = str(self._redis.incr(self._ids))
+        self._redis.hset(self._jobs, job_id, json.dumps(job))
+        self._redis.lpush(self._queue, job_id)
+        return job_id
+
+    def pop(self, timeout: float) -> Optional[dict]:
+        job_id = self._text(self._redis.brpoplpush(self._queue, self._processing, timeout=max(1, math.ceil(timeout))))
+        if job_id is None:
+            return None
+        self._redis.hset(self._claims, job_id, time.time())
+        payload = self._text(self._redis.hget(self._jobs, job_id))
+        if payload is None:
+            # Acknowledged by someone else in the meantime.
+            self.ack(job_id)
+            return None
+        return {**json.loads(payload), 'id': job_id}
+
+    def touch(self, job_id: str):
+        self._redis.hset(self._claims, job_id, time.time())
+
+    def ack(self, job_id: str):
+        self._redis.lrem(self._processing, 0, job_id)
+        self._redis.hdel(self._jobs, job_id)
+        self._redis.hdel(self._claims, job_id)
+
+    def requeue_stale(self, older_than: float) -> int:
+        cutoff = time.time() - older_than
+        requeued = 0
+        for job_id, claimed_at in self._redis.hgetall(self._claims).items():
+            job_id = self._text(job_id)
+            if float(claimed_at) >= cutoff:
+                continue
+            self._redis.hdel(self._claims, job_id)
+            if self._redis.lrem(self._processing, 0, job_id):
+                # Right end of the list is popped next, so the retry isn't starved by newer jobs.
+                self._redis.rpush(self._queue, job_id)
+                requeued += 1
+        return requeued
+
+    def depth(self) -> int:
+        return self._redis.llen(self._queue)
+
+    def set_state(self, key: str, value: str, ttl: Optional[float] = None):
+        now = time.time()
+        self._redis.hset(self._state, key, value)
+        self._redis.zadd(self._state_updated, {key: now})
+        if ttl is not None:
+            self._redis.zadd(self._state_expires, {key: now + ttl})
+        else:
+            self._redis.zrem(self._state_expires, key)
+
+    def get_state(self, key: str) -> Optional[str]:
+        return self._text(self._redis.hget(self._state, key))
+
+    def delete_state(self, key: str):
+        self._redis.hdel(self._state, key)
+        self._redis.zrem(self._state_updated, key)
+        self._redis.zrem(self._state_expires, key)
+
+    def changed_state(self, prefix: str, since: float) -> Dict[str, str]:
+        keys = [self._text(k) for k in self._redis.zrangebyscore(self._state_updated, f"({since}", "+inf")]
+        keys = [k for k in keys if k.startswith(prefix)]
+        if not keys:
+            return {}
+        values = self._redis.hmget(self._state, keys)
+        return {k: self._text(v) for k, v in zip(keys, values) if v is not None}
+
+    def expire_state(self) -> int:
+        keys = [self._text(k) for k in self._redis.zrangebyscore(self._state_expires, "-inf", time.time())]
+        for key in keys:
+            self.delete_state(key)
+        return len(keys)
+
+    def close(self):
+        self._redis.close()
+
+
+def open_job_queue(url: str) -> JobQueue:
+    """Opens a queue from a URL: 'sqlite:///path/to/jobs.db' or 'redis://host:6379/0'."""
+    if url.startswith('sqlite:///'):
+        return SQLiteJobQueue(url[len('sqlite:///'):])
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisJobQueue.from_url(url)
+    raise ValueError(f"Unsupported JOB_QUEUE_URL: {url}")
@@ -1,16 +1,182 @@
-from flask import Flask
-from threading import Thread
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Optional, Set, Tuple
+from urllib.parse import parse_qsl, urlsplit
 
-app = Flask('')
+logger = logging.getLogger(__name__)
 
-@app.route('/')
-def home():
-    return " Video Downloader Bot is alive!"
+_REASONS = {
+    200: "OK", 204: "No Content", 400: "Bad Request", 403: "Forbidden", 404: "Not Found",
+    405: "Method Not Allowed", 413: "Payload Too Large",
+    500: "Internal Server Error", 503: "Service Unavailable",
+}
 
-def run():
-    app.run(host='0.0.0.0', port=8080)
 
-def keep_alive():
-    t = Thread(target=run)
+class Request:
+    """A parsed HTTP request."""
+    def __init__(self, method: str, target: str, headers: Dict[str, str], body: bytes):
+        parts = urlsplit(target)
+        self.method = method
+        self.path = parts.path
+        self.query = dict(parse_qsl(parts.query))
+        self.headers = headers
+        self.body = body
 
-    t.start()
+
+class Response:
+    """An HTTP response to send back."""
+    def __init__(self, body=b"", status: int = 200, content_type: str = "text/plain; charset=utf-8"):
+        self.body = body.encode() if isinstance(body, str) else body
+        self.status = status
+        self.content_type = content_type
+
+
+Handler = Callable[[Request], Awaitable[Response]]
+
+
+class HTTPServer:
+    """Small asyncio HTTP/1.1 server with keep-alive, run on the bot's own event loop.
+
+    It serves the health routes and receives Telegram webhook updates without a separate
+    thread or framework.
+    """
+    MAX_BODY_BYTES = 1024 * 1024
+    IDLE_TIMEOUT = 75.0
+
+    def __init__(self, host: str = '0.0.0.0', port: int = 8080):
+        self.host = host
+        self.port = port
+        self._routes: Dict[Tuple[str, str], Handler] = {}
+        self._fallback: Optional[Handler] = None
+        self._server: Optional[asyncio.base_events.Server] = None
+        # Open connections, and the ones currently handling a request
+        self._connections: Dict[asyncio.Task, asyncio.StreamWriter] = {}
+        self._busy: Set[asyncio.Task] = set()
+
+    def route(self, method: str, path: str, handler: Handler):
+        self._routes[(method.upper(), path)] = handler
+
+    def fallback(self, handler: Handler):
+        """Handles every request that matches no route."""
+        self._fallback = handler
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port, backlog=1024)
+        # Port 0 picks a free port; report the real one.
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"HTTP server listening on {self.host}:{self.port}")
+
+    async def stop(self, grace: float = 5.0):
+        """Stops accepting connections, closes idle ones and gives requests in progress `grace` seconds."""
+        if not self._server:
+            return
+        server, self._server = self._server, None
+        server.close()
+        for task, writer in list(self._connections.items()):
+            if task not in self._busy:
+                writer.close()
+        if self._connections:
+            await asyncio.wait(list(self._connections), timeout=grace)
+        await server.wait_closed()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self._connections[task] = writer
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), self.IDLE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                if not request_line.strip():
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    await self._write(writer, Response("Bad Request", 400), keep_alive=False)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                if headers.get('transfer-encoding', '').lower() == 'chunked':
+                    body = await self._read_chunked(reader)
+                else:
+                    length = int(headers.get('content-length', 0) or 0)
+                    body = await reader.readexactly(length) if length <= self.MAX_BODY_BYTES else None
+                if body is None:
+                    await self._write(writer, Response("Payload Too Large", 413), keep_alive=False)
+                    break
+
+                self._busy.add(task)
+                try:
+                    response = await self._dispatch(Request(method.upper(), target, headers, body))
+                    keep_alive = (version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                                  and self._server is not None)
+                    await self._write(writer, response, keep_alive)
+                finally:
+                    self._busy.discard(task)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            # Dropped connection, or a malformed length we can't frame the next request after.
+            pass
+        finally:
+            self._connections.pop(task, None)
+            writer.close()
+
+    async def _read_chunked(self, reader: asyncio.StreamReader) -> Optional[bytes]:
+        """Reads a chunked request body; None if it exceeds MAX_BODY_BYTES."""
+        chunks = []
+        size = 0
+        while True:
+            length = int((await reader.readline()).split(b";", 1)[0].strip() or b"0", 16)
+            if length == 0:
+                # Skip trailers up to the terminating empty line.
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                return b"".join(chunks)
+            size += length
+            if size > self.MAX_BODY_BYTES:
+                return None
+            chunks.append(await reader.readexactly(length))
+            await reader.readline()
+
+    async def _dispatch(self, request: Request) -> Response:
+        handler = self._routes.get((request.method, request.path)) or self._fallback
+        if handler is None:
+            if any(path == request.path for _, path in self._routes):
+                return Response("Method Not Allowed", 405)
+            return Response("Not Found", 404)
+        try:
+            return await handler(request)
+        except Exception as e:
+            logger.error(f"Error handling {request.method} {request.path}: {e}", exc_info=True)
+            return Response("Internal Server Error", 500)
+
+    @staticmethod
+    async def _write(writer: asyncio.StreamWriter, response: Response, keep_alive: bool):
+        head = (
+            f"HTTP/1.1 {response.status} {_REASONS.get(response.status, 'OK')}\r\n"
+            f"Content-Type: {response.content_type}\r\n"
+            f"Content-Length: {len(response.body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode('latin-1') + response.body)
+        await writer.drain()
+
+
+async def home(request: Request) -> Response:
+    return Response(" Video Downloader Bot is alive!")
+
+
+def keep_alive(host: str = '0.0.0.0', port: int = 8080) -> HTTPServer:
+    """Creates the HTTP server with the '/' keep-alive route; start it from the bot's event loop."""
+    server = HTTPServer(host, port)
+    server.route('GET', '/', home)
+    return server
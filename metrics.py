@@ -0,0 +1,276 @@
+"""Dependency-free Prometheus-style metrics, plus a sampling profiler for slow download jobs."""
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter as StackCounter
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ''
+    return '{' + ','.join(f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} expects labels {self.labels}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(f"{name}{labels} {_format_value(value)}" for name, labels, value in self.samples())
+        return lines
+
+
+class Counter(_Metric):
+    """A monotonically increasing count per label combination."""
+    kind = 'counter'
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def values(self) -> Dict[LabelValues, float]:
+        with self._lock:
+            return dict(self._values)
+
+    def samples(self):
+        for key, value in sorted(self.values().items()):
+            yield self.name, _format_labels(self.labels, key), value
+
+
+class Gauge(_Metric):
+    """A value that goes up and down, either set directly or read from `fn` at scrape time.
+
+    `fn` returns a number, or a dict of label-value tuples to numbers for labelled gauges.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 fn: Optional[Callable[[], object]] = None):
+        super().__init__(name, help_text, labels)
+        self._fn = fn
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def samples(self):
+        if self._fn is None:
+            with self._lock:
+                values = dict(self._values)
+        else:
+            try:
+                result = self._fn()
+            except Exception as e:
+                logger.warning(f"Gauge {self.name} could not be read: {e}")
+                return
+            values = result if isinstance(result, dict) else {(): result}
+        for key, value in sorted(values.items()):
+            yield self.name, _format_labels(self.labels, key), value
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram per label combination."""
+    kind = 'histogram'
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        # label values -> (per-bucket counts, sum, count)
+        self._values: Dict[LabelValues, Tuple[List[int], float, int]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, count = self._values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value, count + 1)
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(counts), total, count) for key, (counts, total, count) in self._values.items()}
+        for key, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labels + ('le',), key + (_format_value(bound),))
+                yield f"{self.name}_bucket", labels, cumulative
+            yield f"{self.name}_sum", _format_labels(self.labels, key), total
+            yield f"{self.name}_count", _format_labels(self.labels, key), count
+
+
+class Metrics:
+    """Registry of metrics rendered in the Prometheus text exposition format."""
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labels))
+
+    def gauge(self, name: str, help_text: str, labels: Sequence[str] = (),
+              fn: Optional[Callable[[], object]] = None) -> Gauge:
+        return self._register(Gauge(name, help_text, labels, fn))
+
+    def histogram(self, name: str, help_text: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = Histogram.DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labels, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class SlowJobProfiler:
+    """Samples the stack of the thread running a job and keeps the profile only if the job was slow.
+
+    Profiles are logged (top stacks) and written in the collapsed-stack format that flame graph
+    tools read. A threshold of 0 disables sampling entirely.
+    """
+    TOP_STACKS = 5
+
+    def __init__(self, threshold_seconds: float, interval: float = 0.01, output_dir: Optional[str] = None):
+        self.threshold = threshold_seconds
+        self.interval = interval
+        self.output_dir = output_dir
+
+    @contextmanager
+    def profile(self, label: str):
+        if self.threshold <= 0:
+            yield
+            return
+        target = threading.get_ident()
+        samples: StackCounter = StackCounter()
+        done = threading.Event()
+
+        def sample():
+            while not done.wait(self.interval):
+                frame = sys._current_frames().get(target)
+                if frame is not None:
+                    samples[self._collapse(frame)] += 1
+
+        sampler = threading.Thread(target=sample, name="job-profiler", daemon=True)
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            yield
+        finally:
+            done.set()
+            sampler.join()
+            elapsed = time.perf_counter() - started
+            if elapsed >= self.threshold and samples:
+                self._report(label, elapsed, samples)
+
+    @staticmethod
+    def _collapse(frame) -> str:
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        return ';'.join(reversed(stack))
+
+    def _report(self, label: str, elapsed: float, samples: StackCounter):
+        total = sum(samples.values())
+        top = "\n".join(
+            f"  {count / total:6.1%}  {' <- '.join(reversed(stack.split(';')[-3:]))}"
+            for stack, count in samples.most_common(self.TOP_STACKS)
+        )
+        logger.warning(f"Slow job ({elapsed:.1f}s, {total} samples): {label}\n{top}")
+        if not self.output_dir:
+            return
+        os.makedirs(self.output_dir, exist_ok=True)
+        name = re.sub(r'[^A-Za-z0-9_.-]+', '_', label)[:80]
+        path = os.path.join(self.output_dir, f"slow_{int(time.time())}_{name}.folded")
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in samples.items():
+                f.write(f"{stack} {count}\n")
+        logger.info(f"Wrote profile of slow job to {path}")
+
+
+class PhaseTimer:
+    """Durations of consecutive phases, e.g. of startup, plus ones that ran alongside them."""
+    def __init__(self, started: Optional[float] = None):
+        self.started = time.perf_counter() if started is None else started
+        self._last = self.started
+        self.phases: Dict[str, float] = {}
+
+    def mark(self, phase: str) -> float:
+        """Ends `phase` now; it began where the previous one ended."""
+        now = time.perf_counter()
+        self.phases[phase] = now - self._last
+        self._last = now
+        return self.phases[phase]
+
+    def record(self, phase: str, seconds: float):
+        """Adds a phase that didn't run in sequence with the others."""
+        self.phases[phase] = seconds
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds from the start to the end of the last marked phase."""
+        return self._last - self.started
+
+    def summary(self) -> str:
+        return ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in self.phases.items())
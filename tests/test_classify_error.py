@@ -0,0 +1,45 @@
+"""TelegramBot.classify_error against messages yt-dlp really produces."""
+import pytest
+
+from bot import DownloadError, RetryPolicy, TelegramBot
+
+# Captured from yt-dlp 2026.08.19
+NAME_NOT_KNOWN = ("ERROR: [generic] watch: Unable to download webpage: [Errno -2] Name or service not known "
+                  "(caused by TransportError('[Errno -2] Name or service not known'))")
+NAME_RESOLUTION = ("ERROR: [Instagram] abc: Unable to download webpage: [Errno -3] Temporary failure in name resolution "
+                   "(caused by TransportError('[Errno -3] Temporary failure in name resolution'))")
+CONNECTION_REFUSED = ("ERROR: [generic] x: Unable to download webpage: [Errno 111] Connection refused "
+                      "(caused by TransportError('[Errno 111] Connection refused'))")
+SERVICE_UNAVAILABLE = ("ERROR: [generic] busy: Unable to download webpage: HTTP Error 503: Service Unavailable "
+                       "(caused by <HTTPError 503: Service Unavailable>)")
+NOT_FOUND = ("ERROR: [generic] nf: Unable to download webpage: HTTP Error 404: Not Found "
+             "(caused by <HTTPError 404: Not Found>)")
+TOO_MANY_REQUESTS = ("ERROR: [Instagram] abc: Unable to download webpage: HTTP Error 429: Too Many Requests "
+                     "(caused by <HTTPError 429: Too Many Requests>)")
+BOT_CHECK = "ERROR: [youtube] dQw4w9WgXcQ: Sign in to confirm you're not a bot. Use --cookies-from-browser or --cookies for the authentication."
+PRIVATE = "ERROR: [Instagram] abc: This content is private"
+
+
+@pytest.mark.parametrize("message, expected", [
+    (NAME_NOT_KNOWN, 'network'),
+    (NAME_RESOLUTION, 'network'),
+    (CONNECTION_REFUSED, 'network'),
+    (SERVICE_UNAVAILABLE, 'network'),
+    (NOT_FOUND, 'unknown'),
+    (TOO_MANY_REQUESTS, 'rate_limited'),
+    (BOT_CHECK, 'bot_check'),
+    (PRIVATE, 'private'),
+])
+def test_yt_dlp_errors(message, expected):
+    assert TelegramBot.classify_error(DownloadError(message)) == expected
+
+
+def test_process_engine_errors_keep_their_class():
+    # Exceptions that can't be pickled come back from worker processes as RuntimeError with the same message.
+    assert TelegramBot.classify_error(RuntimeError(NAME_NOT_KNOWN)) == 'network'
+
+
+def test_transport_errors_are_retried():
+    policy = RetryPolicy(TelegramBot.classify_error)
+    assert policy.classify(DownloadError(CONNECTION_REFUSED)) in policy.retry_errors
+    assert policy.classify(DownloadError(NOT_FOUND)) not in policy.retry_errors
@@ -0,0 +1,207 @@
+"""Both job queue backends behave the same; Redis runs against a small in-memory stand-in."""
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from job_queue import RedisJobQueue, SQLiteJobQueue
+
+
+class InMemoryRedis:
+    """The redis-py calls RedisJobQueue makes, with Redis' bytes replies. Single process only."""
+
+    def __init__(self):
+        self._lock = threading.Condition()
+        self._strings = {}
+        self._lists = {}
+        self._hashes = {}
+        self._zsets = {}
+        self.closed = False
+
+    @staticmethod
+    def _b(value):
+        return value if isinstance(value, bytes) else str(value).encode()
+
+    def incr(self, key):
+        with self._lock:
+            self._strings[key] = int(self._strings.get(key, 0)) + 1
+            return self._strings[key]
+
+    def hset(self, key, field, value):
+        with self._lock:
+            self._hashes.setdefault(key, {})[self._b(field)] = self._b(value)
+
+    def hget(self, key, field):
+        with self._lock:
+            return self._hashes.get(key, {}).get(self._b(field))
+
+    def hmget(self, key, fields):
+        with self._lock:
+            return [self._hashes.get(key, {}).get(self._b(f)) for f in fields]
+
+    def hdel(self, key, field):
+        with self._lock:
+            return int(self._hashes.get(key, {}).pop(self._b(field), None) is not None)
+
+    def hgetall(self, key):
+        with self._lock:
+            return dict(self._hashes.get(key, {}))
+
+    def lpush(self, key, value):
+        with self._lock:
+            self._lists.setdefault(key, []).insert(0, self._b(value))
+            self._lock.notify_all()
+
+    def rpush(self, key, value):
+        with self._lock:
+            self._lists.setdefault(key, []).append(self._b(value))
+            self._lock.notify_all()
+
+    def brpoplpush(self, source, destination, timeout=0):
+        with self._lock:
+            if not self._lock.wait_for(lambda: self._lists.get(source), timeout or None):
+                return None
+            value = self._lists[source].pop()
+            self._lists.setdefault(destination, []).insert(0, value)
+            return value
+
+    def lrem(self, key, count, value):
+        with self._lock:
+            items = self._lists.get(key, [])
+            kept = [v for v in items if v != self._b(value)]
+            self._lists[key] = kept
+            return len(items) - len(kept)
+
+    def llen(self, key):
+        with self._lock:
+            return len(self._lists.get(key, []))
+
+    def zadd(self, key, mapping):
+        with self._lock:
+            self._zsets.setdefault(key, {}).update({self._b(k): float(v) for k, v in mapping.items()})
+
+    def zrem(self, key, member):
+        with self._lock:
+            self._zsets.get(key, {}).pop(self._b(member), None)
+
+    def zrangebyscore(self, key, low, high):
+        exclusive = low.startswith('(')
+        low = float(low.lstrip('('))
+        high = float(high)
+        with self._lock:
+            members = sorted(self._zsets.get(key, {}).items(), key=lambda item: item[1])
+        return [m for m, score in members if (score > low if exclusive else score >= low) and score <= high]
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture(params=['sqlite', 'redis'])
+def queue(request, tmp_path):
+    if request.param == 'sqlite':
+        q = SQLiteJobQueue(str(tmp_path / 'jobs.db'))
+    else:
+        q = RedisJobQueue(InMemoryRedis())
+    yield q
+    q.close()
+
+
+def test_jobs_pop_in_order_and_ack(queue):
+    first = queue.push({'url': 'a'})
+    queue.push({'url': 'b'})
+    assert queue.depth() == 2
+    job = queue.pop(timeout=1)
+    assert job == {'url': 'a', 'id': first}
+    assert queue.depth() == 1
+    queue.ack(job['id'])
+    assert queue.pop(timeout=1)['url'] == 'b'
+    assert queue.pop(timeout=0.1) is None
+
+
+def test_stale_claims_are_requeued(queue):
+    queue.push({'url': 'a'})
+    job = queue.pop(timeout=1)
+    assert queue.requeue_stale(older_than=60) == 0
+    time.sleep(0.05)
+    assert queue.requeue_stale(older_than=0.01) == 1
+    assert queue.pop(timeout=1)['id'] == job['id']
+
+
+def test_touched_jobs_are_not_requeued(queue):
+    queue.push({'url': 'a'})
+    job = queue.pop(timeout=1)
+    time.sleep(0.1)
+    queue.touch(job['id'])
+    assert queue.requeue_stale(older_than=0.05) == 0
+    assert queue.depth() == 0
+    time.sleep(0.1)
+    assert queue.requeue_stale(older_than=0.05) == 1
+
+
+def test_acked_jobs_are_not_requeued(queue):
+    queue.push({'url': 'a'})
+    queue.ack(queue.pop(timeout=1)['id'])
+    time.sleep(0.05)
+    assert queue.requeue_stale(older_than=0.01) == 0
+    assert queue.depth() == 0
+
+
+def test_state_changes_since(queue):
+    queue.set_state('user:1', 'a')
+    since = time.time()
+    time.sleep(0.01)
+    queue.set_state('user:2', 'b')
+    queue.set_state('other:3', 'c')
+    assert queue.get_state('user:1') == 'a'
+    assert queue.changed_state('user:', since) == {'user:2': 'b'}
+    queue.delete_state('user:2')
+    assert queue.get_state('user:2') is None
+    assert queue.changed_state('user:', since) == {}
+
+
+def test_state_with_a_ttl_expires(queue):
+    queue.set_state('result:1', 'short', ttl=0.05)
+    queue.set_state('result:2', 'long', ttl=60)
+    queue.set_state('cookies:x', 'kept')
+    assert queue.expire_state() == 0
+    time.sleep(0.1)
+    assert queue.expire_state() == 1
+    assert queue.get_state('result:1') is None
+    assert queue.get_state('result:2') == 'long'
+    assert queue.get_state('cookies:x') == 'kept'
+    # Written again without a ttl, the key no longer expires.
+    queue.set_state('result:2', 'kept', ttl=None)
+    assert queue.expire_state() == 0
+
+
+def test_sqlite_adds_expiry_to_an_old_queue_file(tmp_path):
+    path = str(tmp_path / 'jobs.db')
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE state (key TEXT PRIMARY KEY, value TEXT NOT NULL, updated_at REAL NOT NULL)")
+    conn.execute("INSERT INTO state VALUES ('access:1', '5', 1.0)")
+    conn.commit()
+    conn.close()
+    q = SQLiteJobQueue(path)
+    q.set_state('result:1', 'x', ttl=0)
+    assert q.expire_state() == 1
+    assert q.get_state('access:1') == '5'
+    q.close()
+
+
+def test_pop_waits_for_a_push(queue):
+    threading.Timer(0.2, queue.push, args=({'url': 'late'},)).start()
+    assert queue.pop(timeout=2)['url'] == 'late'
+
+
+def test_sqlite_close_reaches_every_thread(tmp_path):
+    q = SQLiteJobQueue(str(tmp_path / 'jobs.db'))
+    worker = threading.Thread(target=q.depth)
+    worker.start()
+    worker.join()
+    connections = list(q._connections)
+    assert len(connections) == 2
+    q.close()
+    for conn in connections:
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
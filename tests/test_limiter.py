@@ -0,0 +1,121 @@
+"""AdaptiveLimiter rate adaptation and CookieSessionPool quarantine."""
+import time
+
+from bot import AdaptiveLimiter, CookieSessionPool
+
+KEY = ('instagram', 'main.txt')
+
+
+def make_limiter(**overrides):
+    options = dict(rates={'instagram': 4.0}, burst=2, min_rate=0.5, recovery_fraction=0.25,
+                   breaker_threshold=3, cooldown=60.0, max_cooldown=600.0)
+    options.update(overrides)
+    return AdaptiveLimiter(**options)
+
+
+def test_burst_then_wait_for_a_token():
+    limiter = make_limiter()
+    assert limiter.acquire(KEY) == 0.0
+    assert limiter.acquire(KEY) == 0.0
+    assert 0 < limiter.acquire(KEY) <= 1 / 4.0
+
+
+def test_throttling_halves_the_rate_and_successes_bring_it_back():
+    limiter = make_limiter()
+    limiter.record_throttle(KEY)
+    limiter.record_throttle(KEY)
+    assert limiter.capacity(KEY) == 1.0
+    assert limiter.acquire(KEY) > 0
+    limiter.record_success(KEY)
+    assert limiter.capacity(KEY) == 2.0
+    for _ in range(10):
+        limiter.record_success(KEY)
+    assert limiter.capacity(KEY) == 4.0
+    assert limiter.state()[KEY]['failures'] == 0
+
+
+def test_rate_never_drops_below_the_floor():
+    limiter = make_limiter(breaker_threshold=100)
+    for _ in range(10):
+        limiter.record_throttle(KEY)
+    assert limiter.capacity(KEY) == 0.5
+
+
+def test_circuit_opens_after_repeated_throttling():
+    limiter = make_limiter()
+    for _ in range(3):
+        limiter.record_throttle(KEY)
+    assert limiter.capacity(KEY) == 0.0
+    assert limiter.acquire(KEY) >= 59
+    assert 59 <= limiter.state()[KEY]['open_for'] <= 60
+    # The cooldown doubles while the session keeps being throttled.
+    limiter.record_throttle(KEY)
+    assert limiter.state()[KEY]['open_for'] > 119
+    # Other sessions of the platform are unaffected.
+    assert limiter.acquire(('instagram', 'other.txt')) == 0.0
+
+
+def test_reset_forgets_a_session():
+    limiter = make_limiter()
+    for _ in range(3):
+        limiter.record_throttle(KEY)
+    limiter.reset('instagram', 'main.txt')
+    assert limiter.capacity(KEY) == 4.0
+    assert limiter.acquire(KEY) == 0.0
+
+
+def make_pool(tmp_path, names=('a.txt', 'b.txt')):
+    folder = tmp_path / 'instagram'
+    folder.mkdir()
+    for name in names:
+        (folder / name).write_text("# Netscape HTTP Cookie File\n")
+    return CookieSessionPool(str(tmp_path), {'instagram': str(tmp_path / 'missing.txt')}, window=4,
+                             min_samples=2, error_rate=0.5, quarantine=60.0, max_quarantine=600.0)
+
+
+def test_throttled_session_is_quarantined(tmp_path):
+    pool = make_pool(tmp_path)
+    bad, good = pool.candidates('instagram')
+    for _ in range(2):
+        pool.begin(bad)
+        pool.end(bad, True)
+    assert bad.quarantined_until > time.monotonic() + 59
+    assert pool.candidates('instagram') == [good]
+
+
+def test_jobs_run_anonymously_while_every_session_is_quarantined(tmp_path):
+    pool = make_pool(tmp_path, names=('a.txt',))
+    session, = pool.candidates('instagram')
+    for _ in range(2):
+        pool.begin(session)
+        pool.end(session, True)
+    anonymous, = pool.candidates('instagram')
+    assert anonymous.name == CookieSessionPool.ANONYMOUS and anonymous.path is None
+    pool.reset('instagram', 'a.txt')
+    assert [s.name for s in pool.candidates('instagram')] == ['a.txt']
+
+
+def test_cancelled_jobs_do_not_count(tmp_path):
+    pool = make_pool(tmp_path, names=('a.txt',))
+    session, = pool.candidates('instagram')
+    for _ in range(3):
+        pool.begin(session)
+        pool.end(session, None)
+    assert session.in_flight == 0
+    assert not session.outcomes
+    assert pool.candidates('instagram') == [session]
+
+
+def test_state_without_rescan_reads_no_files(tmp_path, monkeypatch):
+    pool = make_pool(tmp_path, names=('a.txt',))
+    assert [s['session'] for s in pool.state()] == ['a.txt']
+    (tmp_path / 'instagram' / 'b.txt').write_text("# Netscape HTTP Cookie File\n")
+
+    def no_file_access(*args):
+        raise AssertionError("touched the filesystem")
+
+    monkeypatch.setattr('os.listdir', no_file_access)
+    monkeypatch.setattr('os.stat', no_file_access)
+    pool._scanned.clear()
+    assert [s['session'] for s in pool.state(rescan=False)] == ['a.txt']
+    assert [s.name for s in pool.candidates('instagram', rescan=False)] == ['a.txt']
@@ -0,0 +1,27 @@
+"""MediaCache keeping sent files on disk."""
+import os
+
+from bot import MediaCache
+
+
+def test_put_keeps_carousel_files_with_the_same_name(tmp_path):
+    cache = MediaCache(ttl_seconds=60, max_entries=10, keep_files=True, files_dir=str(tmp_path / 'cache'))
+    files = []
+    for index, content in enumerate((b'first', b'second!')):
+        entry_dir = tmp_path / 'media_1' / f"{index:03d}"
+        entry_dir.mkdir(parents=True)
+        path = entry_dir / 'Video by someone.mp4'
+        path.write_bytes(content)
+        files.append(str(path))
+
+    cache.put('instagram:abc', [('video', 'id1'), ('video', 'id2')], files)
+
+    entry = cache.get('instagram:abc')
+    assert len(set(entry.files)) == 2
+    assert [open(path, 'rb').read() for path in entry.files] == [b'first', b'second!']
+    assert entry.size_bytes == len(b'first') + len(b'second!')
+    assert cache.stats()['bytes'] == entry.size_bytes
+
+    cache.invalidate('instagram:abc')
+    assert not any(os.path.exists(path) for path in entry.files)
+    assert cache.stats()['bytes'] == 0
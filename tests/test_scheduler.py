@@ -0,0 +1,168 @@
+"""DownloadScheduler queueing, caps and storage reservations."""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from bot import DownloadScheduler, QueueFullError, StorageFullError, StorageManager
+
+
+def make_scheduler(workers=1, platform_limits=None, max_queued=10, max_per_user=3, **kwargs):
+    return DownloadScheduler(ThreadPoolExecutor(workers), workers, platform_limits or {'other': workers},
+                             max_queued, max_per_user, **kwargs)
+
+
+def blocked_job():
+    """A job function that runs until its event is set, plus the event."""
+    release = threading.Event()
+
+    def job(value=None):
+        release.wait(5)
+        return value
+
+    return job, release
+
+
+def test_users_take_turns():
+    async def main():
+        scheduler = make_scheduler()
+        order = []
+        job, release = blocked_job()
+        first, _ = scheduler.submit(1, 'other', job)
+        futures = [scheduler.submit(user_id, 'other', order.append, user_id)[0] for user_id in (1, 1, 2)]
+        release.set()
+        await asyncio.wait_for(asyncio.gather(first, *futures), timeout=5)
+        # User 2 is served before user 1's second queued job.
+        assert order == [1, 2, 1]
+        scheduler.shutdown()
+
+    asyncio.run(main())
+
+
+def test_per_user_cap_rejects_only_that_user():
+    async def main():
+        scheduler = make_scheduler(max_per_user=2)
+        job, release = blocked_job()
+        futures = [scheduler.submit(1, 'other', job)[0] for _ in range(2)]
+        with pytest.raises(QueueFullError) as rejected:
+            scheduler.submit(1, 'other', job)
+        assert rejected.value.per_user
+        futures.append(scheduler.submit(2, 'other', job)[0])
+        assert scheduler.rejected == 1
+        release.set()
+        await asyncio.wait_for(asyncio.gather(*futures), timeout=5)
+        scheduler.shutdown()
+
+    asyncio.run(main())
+
+
+def test_full_queue_rejects_everyone():
+    async def main():
+        scheduler = make_scheduler(max_queued=2, max_per_user=10)
+        job, release = blocked_job()
+        futures = [scheduler.submit(user_id, 'other', job)[0] for user_id in (1, 2, 3)]
+        assert scheduler.queue_depth == 2
+        with pytest.raises(QueueFullError) as rejected:
+            scheduler.submit(4, 'other', job)
+        assert not rejected.value.per_user
+        release.set()
+        await asyncio.wait_for(asyncio.gather(*futures), timeout=5)
+        scheduler.shutdown()
+
+    asyncio.run(main())
+
+
+def test_platform_cap_leaves_workers_to_other_platforms():
+    async def main():
+        scheduler = make_scheduler(workers=2, platform_limits={'instagram': 1, 'youtube': 2})
+        job, release = blocked_job()
+        scheduler.submit(1, 'instagram', job)
+        queued, position = scheduler.submit(2, 'instagram', job)
+        assert position == 1
+        started, position = scheduler.submit(3, 'youtube', job)
+        assert position == 0
+        assert scheduler.active == 2
+        release.set()
+        await asyncio.wait_for(asyncio.gather(queued, started), timeout=5)
+        scheduler.shutdown()
+
+    asyncio.run(main())
+
+
+def test_storage_is_held_from_dispatch(tmp_path):
+    async def main():
+        storage = StorageManager(str(tmp_path), budget_bytes=100, min_free_bytes=0, orphan_age=3600)
+        scheduler = make_scheduler(workers=2, storage=storage)
+        job, release = blocked_job()
+        running_reservation = storage.reservation(80)
+        running, _ = scheduler.submit(1, 'other', job, reservation=running_reservation)
+        waiting_reservation = storage.reservation(80)
+        waiting, _ = scheduler.submit(2, 'other', job, reservation=waiting_reservation)
+        # A free worker, but no space: the second job stays queued without holding anything.
+        assert storage.reserved == 80
+        assert scheduler.active == 1
+        assert not waiting_reservation.held
+
+        release.set()
+        await asyncio.wait_for(running, timeout=5)
+        storage.release(running_reservation)
+        await asyncio.wait_for(waiting, timeout=5)
+        assert waiting_reservation.held
+        storage.release(waiting_reservation)
+        assert storage.reserved == 0
+        scheduler.shutdown()
+
+    asyncio.run(main())
+
+
+def test_jobs_without_space_fail_after_the_max_wait(tmp_path):
+    async def main():
+        storage = StorageManager(str(tmp_path), budget_bytes=100, min_free_bytes=0, orphan_age=3600)
+        scheduler = make_scheduler(workers=2, storage=storage, max_storage_wait=0.1)
+        job, release = blocked_job()
+        scheduler.submit(1, 'other', job, reservation=storage.reservation(80))
+        waiting, _ = scheduler.submit(2, 'other', job, reservation=storage.reservation(80))
+        with pytest.raises(StorageFullError):
+            await asyncio.wait_for(waiting, timeout=5)
+        release.set()
+        scheduler.shutdown()
+
+    asyncio.run(main())
+
+
+def test_cancelled_jobs_hand_back_their_reservation(tmp_path):
+    async def main():
+        storage = StorageManager(str(tmp_path), budget_bytes=100, min_free_bytes=0, orphan_age=3600)
+        scheduler = make_scheduler(workers=2, storage=storage)
+        abandoned = []
+
+        def cleanup(reservation):
+            def on_abandoned(result):
+                abandoned.append(result)
+                storage.release(reservation)
+            return on_abandoned
+
+        job, release = blocked_job()
+        running_reservation = storage.reservation(60)
+        running, _ = scheduler.submit(1, 'other', job, 'files', reservation=running_reservation,
+                                      on_abandoned=cleanup(running_reservation))
+        queued_reservation = storage.reservation(60)
+        queued, _ = scheduler.submit(2, 'other', job, reservation=queued_reservation,
+                                     on_abandoned=cleanup(queued_reservation))
+        assert running_reservation.held and not queued_reservation.held
+
+        running.cancel()
+        queued.cancel()
+        # The running job can't be stopped: its result is handed over once it finishes.
+        release.set()
+        for _ in range(100):
+            if len(abandoned) == 2:
+                break
+            await asyncio.sleep(0.02)
+        assert len(abandoned) == 2 and set(abandoned) == {'files', None}
+        assert storage.reserved == 0
+        assert scheduler.queue_depth == 0
+        scheduler.shutdown()
+
+    asyncio.run(main())
@@ -0,0 +1,85 @@
+"""SingleFlight sharing one run between concurrent callers."""
+import asyncio
+
+import pytest
+
+from bot import SingleFlight
+
+
+def test_callers_share_one_run():
+    async def main():
+        flight = SingleFlight()
+        runs = []
+
+        async def job():
+            runs.append(1)
+            await asyncio.sleep(0.05)
+            return 'media'
+
+        results = await asyncio.gather(*(flight.run('k', job) for _ in range(3)))
+        assert results == [('media', False), ('media', True), ('media', True)]
+        assert len(runs) == 1
+        assert len(flight) == 0
+
+    asyncio.run(main())
+
+
+def test_errors_reach_every_caller():
+    async def main():
+        flight = SingleFlight()
+
+        async def job():
+            await asyncio.sleep(0.05)
+            raise ValueError('private')
+
+        results = await asyncio.gather(*(flight.run('k', job) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(r, ValueError) for r in results)
+
+    asyncio.run(main())
+
+
+def test_a_waiter_takes_over_from_a_cancelled_leader():
+    async def main():
+        flight = SingleFlight()
+        runs = []
+
+        async def job():
+            runs.append(1)
+            await asyncio.sleep(0.1)
+            return len(runs)
+
+        leader = asyncio.create_task(flight.run('k', job))
+        await asyncio.sleep(0.01)
+        waiters = [asyncio.create_task(flight.run('k', job)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+
+        results = await asyncio.wait_for(asyncio.gather(*waiters), timeout=2)
+        # One waiter ran the job again and the others shared its result.
+        assert sorted(results) == [(2, False), (2, True), (2, True)]
+        assert leader.cancelled()
+        assert len(runs) == 2
+        assert len(flight) == 0
+
+    asyncio.run(main())
+
+
+def test_a_cancelled_waiter_leaves_the_run_alone():
+    async def main():
+        flight = SingleFlight()
+
+        async def job():
+            await asyncio.sleep(0.1)
+            return 'media'
+
+        leader = asyncio.create_task(flight.run('k', job))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.create_task(flight.run('k', job))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+
+        assert await leader == ('media', False)
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+    asyncio.run(main())